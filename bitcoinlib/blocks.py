@@ -18,11 +18,18 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import mmap
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from bitcoinlib.encoding import *
 from bitcoinlib.networks import Network
+from bitcoinlib.keys import verify_batch
 from bitcoinlib.transactions import Transaction
 
+_logger = logging.getLogger(__name__)
+
 
 class Block:
 
@@ -127,6 +134,47 @@ class Block:
             return True
         return False
 
+    def verify(self, workers=1):
+        """
+        Verify signatures of all transactions in this block. Signatures of all transactions are verified in one batch
+        with :func:`verify_batch`. Use the workers argument to verify large blocks in a pool of worker processes.
+
+        Transactions must be parsed and input values must be known to verify segwit inputs. Does not check if
+        UTXO's are valid or have already been spent.
+
+        :param workers: Number of worker processes. Default is 1 to verify in the current process, use None to use the number of CPU's.
+        :type workers: int
+
+        :return bool: True if all transactions in block are valid
+        """
+        if not self.transactions or len(self.transactions) != self.tx_count or \
+                not isinstance(self.transactions[0], Transaction):
+            _logger.info("Transactions of block %s are not parsed, cannot verify" % self.block_hash.hex())
+            return False
+        batch_txs = []
+        batch_inputs = []
+        items = []
+        for t in self.transactions:
+            t.verified = False
+            if t.coinbase:
+                t.verified = True
+                continue
+            inputs, tx_items = t._verify_batch_items()
+            if inputs is None:
+                _logger.info("Could not verify transaction %s in block %s" % (t.txid, self.block_hash.hex()))
+                return False
+            batch_txs += [t] * len(inputs)
+            batch_inputs += inputs
+            items += tx_items
+        for t, inp, valid in zip(batch_txs, batch_inputs, verify_batch(items, workers)):
+            if not valid:
+                _logger.info("Invalid signature for input %d of transaction %s" % (inp.index_n, t.txid))
+                return False
+            inp.valid = True
+        for t in self.transactions:
+            t.verified = True
+        return True
+
     def __repr__(self):
         return "<Block(%s, %s, transactions: %s)>" % (self.block_hash.hex(), self.height, self.tx_count)
 
@@ -255,12 +303,11 @@ class Block:
         while parse_transactions and raw.tell() < txs_data_size:
             if limit != 0 and len(transactions) >= limit:
                 break
-            t = Transaction.parse_bytesio(raw, strict=False, index=index)
+            t = Transaction.parse_bytesio(raw, strict=False, network=network, index=index)
             transactions.append(t)
             index += 1
-            # TODO: verify transactions, need input value from previous txs
-            # if verify and not t.verify():
-            #     raise ValueError("Could not verify transaction %s in block %s" % (t.txid, block_hash))
+            # Transactions can not be verified here, input values are unknown. Use the UtxoSet class to supply
+            # input values and verify blocks
 
         if parse_transactions and limit == 0 and tx_count != len(transactions):
             raise ValueError("Number of found transactions %d is not equal to expected number %d" %
@@ -446,8 +493,23 @@ class Block:
         """
         if not self.bits:
             return 0
-        exponent = self.bits[0]
-        coefficient = int.from_bytes(b'\x00' + self.bits[1:], 'big')
+        return self.bits_to_target(self.bits)
+
+    @staticmethod
+    def bits_to_target(bits):
+        """
+        Convert compact representation of block target in bits to target integer.
+
+        >>> Block.bits_to_target(bytes.fromhex('1d00ffff'))
+        26959535291011309493156476344723991336010898738574164086137773096960
+
+        :param bits: Bits of block header, in big endian order
+        :type bits: bytes
+
+        :return int:
+        """
+        exponent = bits[0]
+        coefficient = int.from_bytes(b'\x00' + bits[1:], 'big')
         return coefficient * 256 ** (exponent - 3)
 
     @property
@@ -500,6 +562,23 @@ class Block:
         """
         if len(self.transactions) != self.tx_count or len(self.transactions) < 1:
             raise ValueError("Block contains incorrect number of transactions, can not serialize")
+        rb = self.serialize_header()
+        rb += int_to_varbyteint(len(self.transactions))
+        for t in self.transactions:
+            rb += t.raw()
+        return rb
+
+    def serialize_header(self):
+        """
+        Serialize block header of 80 bytes. Method will raise an error if one of the header fields is missing or has
+        an incorrect size.
+
+        >>> b = Block('0000000000000000000154ba9d02ddd6cee0d71d1ea232753e02c9ac6affd709', version=0x20000000, prev_block='0000000000000000000f9578cda278ae7a2002e50d8e6079d11e2ea1f672b483', merkle_root='20e86f03c24c53c12014264d0e405e014e15a02ad02c174f017ee040750f8d9d', time=1592848036, bits=387044594, nonce=791719079)
+        >>> double_sha256(b.serialize_header())[::-1].hex()
+        '0000000000000000000154ba9d02ddd6cee0d71d1ea232753e02c9ac6affd709'
+
+        :return bytes:
+        """
         rb = self.version[::-1]
         rb += self.prev_block[::-1]
         rb += self.merkle_root[::-1]
@@ -509,9 +588,6 @@ class Block:
         if len(rb) != 80:
             raise ValueError("Missing or incorrect length of 1 of the block header variables: version, prev_block, "
                              "merkle_root, time, bits or nonce.")
-        rb += int_to_varbyteint(len(self.transactions))
-        for t in self.transactions:
-            rb += t.raw()
         return rb
 
     @property
@@ -583,3 +659,1025 @@ class Block:
         for t in self.transactions:
             self.total_in += sum([i.value for i in t.inputs])
             self.total_out += sum([o.value for o in t.outputs])
+
+
+_HEADER_STORE_MAGIC = b'BCLHDRS\x01'
+
+
+class BlockHeaderStore:
+    """
+    Store for block headers in a flat file of 80-byte records.
+
+    The first record of the file contains the start height and network of the store, followed by one record for every
+    header. The file is memory-mapped, so the header at a specific height can be read without any database query. Headers
+    are validated when added: every header must link to the previous header and the block hash must be below the
+    target. Block hashes are kept in a dictionary to lookup the height of a block.
+
+    >>> b = Block('0000000000000000000154ba9d02ddd6cee0d71d1ea232753e02c9ac6affd709', version=0x20000000, prev_block='0000000000000000000f9578cda278ae7a2002e50d8e6079d11e2ea1f672b483', merkle_root='20e86f03c24c53c12014264d0e405e014e15a02ad02c174f017ee040750f8d9d', time=1592848036, bits=387044594, nonce=791719079)
+    >>> import tempfile
+    >>> store = BlockHeaderStore(os.path.join(tempfile.mkdtemp(), 'headers.dat'), start_height=636363)
+    >>> store.append(b)
+    1
+    >>> store.height(b.block_hash)
+    636363
+    >>> store.block(636363).block_hash.hex()
+    '0000000000000000000154ba9d02ddd6cee0d71d1ea232753e02c9ac6affd709'
+    >>> store.close()
+
+    """
+
+    def __init__(self, filename=None, start_height=None, network=DEFAULT_NETWORK):
+        """
+        Open or create a block header store.
+
+        :param filename: Name of header file. Default is headers_<network>.dat in the database directory
+        :type filename: str, Path
+        :param start_height: Height of the first header in the file. Default is 0, the genesis block, for a new file. For existing files the start height is read from the file, a ValueError is raised if it differs from this argument.
+        :type start_height: int
+        :param network: Network, leave empty for default network
+        :type network: str, Network
+        """
+        self.network = network
+        if not isinstance(network, Network):
+            self.network = Network(network)
+        self.filename = filename
+        if not self.filename:
+            self.filename = Path(BCL_DATABASE_DIR, 'headers_%s.dat' % self.network.name)
+        self._file = open(self.filename, 'a+b')
+        self._mmap = None
+        self._size = 0
+        self._count = 0
+        self._hashes = {}
+        self._targets = {}
+        self._remap()
+        if self._size < 80:
+            self.start_height = start_height or 0
+            self._truncate(0)
+            self._file.write(_HEADER_STORE_MAGIC + self.start_height.to_bytes(4, 'little') +
+                             self.network.name.encode().ljust(20, b'\0') + bytes(48))
+            self._remap()
+        else:
+            self._read_file_info(start_height)
+        if self._size % 80:
+            _logger.warning("Header file %s contains incomplete header, ignoring last %d bytes" %
+                            (self.filename, self._size % 80))
+        for pos in range(self._count):
+            self._hashes[double_sha256(self._record(pos))[::-1]] = pos
+
+    def __repr__(self):
+        return "<BlockHeaderStore(%s, %s, headers: %d)>" % (self.filename, self.network.name, self._count)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read_file_info(self, start_height):
+        info = self._mmap[:80]
+        if info[:8] != _HEADER_STORE_MAGIC:
+            self.close()
+            raise ValueError("File %s is not a block header store" % self.filename)
+        self.start_height = int.from_bytes(info[8:12], 'little')
+        network_name = info[12:32].rstrip(b'\0').decode()
+        if start_height is not None and start_height != self.start_height:
+            self.close()
+            raise ValueError("Header file %s starts at height %d, not at %d" %
+                             (self.filename, self.start_height, start_height))
+        if network_name != self.network.name:
+            self.close()
+            raise ValueError("Header file %s contains headers for network %s, not %s" %
+                             (self.filename, network_name, self.network.name))
+
+    def _remap(self):
+        self._file.flush()
+        self._size = os.fstat(self._file.fileno()).st_size
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._count = max(self._size - 80, 0) // 80
+
+    def _truncate(self, size):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.truncate(size)
+        self._remap()
+
+    def _record(self, pos):
+        return self._mmap[80 + pos * 80:160 + pos * 80]
+
+    def close(self):
+        """
+        Close header file and memory map
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    @property
+    def tip_height(self):
+        """
+        Height of the last header in this store, or None if store is empty
+
+        :return int:
+        """
+        if not self._count:
+            return None
+        return self.start_height + self._count - 1
+
+    def _target(self, bits):
+        if bits not in self._targets:
+            self._targets[bits] = Block.bits_to_target(bits)
+        return self._targets[bits]
+
+    def append(self, headers, validate=True):
+        """
+        Add block headers to the end of the store.
+
+        :param headers: Block object, raw header of 80 bytes or a list of block objects or raw headers. Raw blocks with transactions are also accepted, only the first 80 bytes are used.
+        :type headers: Block, bytes, list
+        :param validate: Check if headers link to the previous header and contain a valid proof of work. Default is True
+        :type validate: bool
+
+        :return int: Number of headers added
+        """
+        if isinstance(headers, (Block, bytes, bytearray)):
+            headers = [headers]
+        prev_hash = self.block_hash(self.tip_height) if self._count else None
+        raw_headers = []
+        new_hashes = {}
+        for header in headers:
+            if isinstance(header, Block):
+                header = header.serialize_header()
+            header = bytes(header[:80])
+            if len(header) != 80:
+                raise ValueError("Block header must be 80 bytes, found %d bytes" % len(header))
+            block_hash = double_sha256(header)[::-1]
+            if validate:
+                if prev_hash is not None and header[4:36][::-1] != prev_hash:
+                    raise ValueError("Block header %s does not link to previous block %s" %
+                                     (block_hash.hex(), prev_hash.hex()))
+                if int.from_bytes(block_hash, 'big') >= self._target(header[72:76][::-1]):
+                    raise ValueError("Block hash %s is not below target" % block_hash.hex())
+            new_hashes[block_hash] = self.start_height + self._count + len(raw_headers)
+            raw_headers.append(header)
+            prev_hash = block_hash
+        if self._size != 80 + self._count * 80:
+            # Remove incomplete header from an interrupted write, so new headers are aligned
+            self._truncate(80 + self._count * 80)
+        self._file.write(b''.join(raw_headers))
+        self._remap()
+        for block_hash, height in new_hashes.items():
+            self._hashes[block_hash] = height - self.start_height
+        return len(raw_headers)
+
+    def header(self, height):
+        """
+        Get raw block header at specified height
+
+        :param height: Block height
+        :type height: int
+
+        :return bytes: Raw header of 80 bytes
+        """
+        pos = height - self.start_height
+        if not 0 <= pos < self._count:
+            raise IndexError("Block height %d not in header store" % height)
+        return self._record(pos)
+
+    def block_hash(self, height):
+        """
+        Get block hash of block at specified height
+
+        :param height: Block height
+        :type height: int
+
+        :return bytes:
+        """
+        return double_sha256(self.header(height))[::-1]
+
+    def height(self, block_hash):
+        """
+        Get height of block with specified hash, or None if block hash is unknown
+
+        :param block_hash: Block hash
+        :type block_hash: bytes, str
+
+        :return int:
+        """
+        pos = self._hashes.get(to_bytes(block_hash))
+        if pos is None:
+            return None
+        return self.start_height + pos
+
+    def block(self, height):
+        """
+        Get Block object with header information of block at specified height. Block does not contain any
+        transactions.
+
+        :param height: Block height
+        :type height: int
+
+        :return Block:
+        """
+        header = self.header(height)
+        return Block(double_sha256(header)[::-1], header[0:4][::-1], header[4:36][::-1], header[36:68][::-1],
+                     header[68:72][::-1], header[72:76][::-1], header[76:80][::-1], height=height,
+                     network=self.network)
+
+    def validate(self):
+        """
+        Validate all headers in the store: check linkage of every header to the previous header and the proof of
+        work. Returns height of the first invalid header or None if all headers are valid.
+
+        :return int:
+        """
+        prev_hash = None
+        for pos in range(self._count):
+            header = self._record(pos)
+            block_hash = double_sha256(header)[::-1]
+            if (prev_hash is not None and header[4:36][::-1] != prev_hash) or \
+                    int.from_bytes(block_hash, 'big') >= self._target(header[72:76][::-1]):
+                return self.start_height + pos
+            prev_hash = block_hash
+        return None
+
+
+def _xor_bytes(data, xor_key, offset):
+    """
+    Deobfuscate data read from a block file at given file offset with the XOR key of the block directory.
+
+    :param data: Obfuscated data
+    :type data: bytes
+    :param xor_key: XOR key from the xor.dat file
+    :type xor_key: bytes
+    :param offset: Position of data in file
+    :type offset: int
+
+    :return bytes:
+    """
+    if not xor_key or not data:
+        return data
+    start = offset % len(xor_key)
+    keystream = (xor_key * ((len(data) + start) // len(xor_key) + 1))[start:start + len(data)]
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(keystream, 'little')).to_bytes(len(data), 'little')
+
+
+def _scan_block_file(filename, magic, xor_key, start=0):
+    """
+    Scan a blk*.dat block file and return the location of all blocks. Used by :class:`BlockFileReader`, arguments
+    only contain primitive types so files can be scanned in worker processes.
+
+    :param filename: Path of block file
+    :type filename: str
+    :param magic: Network magic bytes
+    :type magic: bytes
+    :param xor_key: XOR key, or empty bytes if blocks are not obfuscated
+    :type xor_key: bytes
+    :param start: Position in file to start scanning
+    :type start: int
+
+    :return tuple: List of (block_hash, prev_block, offset, size) tuples, and position of end of last block found
+    """
+    blocks = []
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return blocks, start
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            while pos + 88 <= size:
+                frame = _xor_bytes(mm[pos:pos + 8], xor_key, pos)
+                if frame[:4] != magic:
+                    # End of written data, Bitcoin Core preallocates files with zeros
+                    break
+                block_size = int.from_bytes(frame[4:8], 'little')
+                if pos + 8 + block_size > size:
+                    break
+                header = _xor_bytes(mm[pos + 8:pos + 88], xor_key, pos + 8)
+                blocks.append((double_sha256(header)[::-1], header[4:36][::-1], pos + 8, block_size))
+                pos += 8 + block_size
+    return blocks, pos
+
+
+class BlockFileReader:
+    """
+    Read blocks from Bitcoin Core blk*.dat block files.
+
+    Block files are memory-mapped, every block in a file is prefixed with the network magic bytes and the block size.
+    Since Bitcoin Core version 28 the block files are obfuscated with the XOR key in the xor.dat file in the blocks
+    directory, this key is read automatically if available.
+
+    An index with the location of each block is created when the reader is opened and stored in a SQLite index
+    database, so next time only new blocks need to be scanned.
+
+    >>> reader = BlockFileReader('~/.bitcoin/blocks')  # doctest: +SKIP
+    >>> for block in reader.blocks_by_height(start=800000, end=800010):  # doctest: +SKIP
+    ...     print(block.height, block.tx_count)
+
+    """
+
+    def __init__(self, blocks_dir, index_filename=None, network=DEFAULT_NETWORK, workers=None):
+        """
+        Open block files in Bitcoin Core blocks directory and create or update block index.
+
+        :param blocks_dir: Bitcoin Core blocks directory, containing blk*.dat files
+        :type blocks_dir: str, Path
+        :param index_filename: Name of SQLite index database. Default is blkindex_<network>.sqlite in the database directory
+        :type index_filename: str, Path
+        :param network: Network, leave empty for default network
+        :type network: str, Network
+        :param workers: Number of worker processes to scan block files. Default is None to use the number of CPU's
+        :type workers: int
+        """
+        self.network = network
+        if not isinstance(network, Network):
+            self.network = Network(network)
+        self.blocks_dir = Path(blocks_dir).expanduser()
+        if not self.blocks_dir.is_dir():
+            raise ValueError("Blocks directory %s not found" % self.blocks_dir)
+        if self.network.name not in BLOCK_FILE_MAGIC:
+            raise ValueError("Block files not supported for network %s" % self.network.name)
+        self.magic = BLOCK_FILE_MAGIC[self.network.name]
+        self.xor_key = b''
+        xor_file = Path(self.blocks_dir, 'xor.dat')
+        if xor_file.exists():
+            self.xor_key = xor_file.read_bytes()
+            if not any(self.xor_key):
+                self.xor_key = b''
+        self.index_filename = index_filename
+        if not self.index_filename:
+            self.index_filename = Path(BCL_DATABASE_DIR, 'blkindex_%s.sqlite' % self.network.name)
+        self.index = {}
+        self.files_scanned = {}
+        self._files = {}
+        self._mmaps = {}
+        self._main_chain = None
+        self._load_index()
+        self.update_index(workers)
+
+    def __repr__(self):
+        return "<BlockFileReader(%s, %s, blocks: %d)>" % (self.blocks_dir, self.network.name, len(self.index))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close all opened block files
+        """
+        for mm in self._mmaps.values():
+            mm.close()
+        for f in self._files.values():
+            f.close()
+        self._mmaps = {}
+        self._files = {}
+
+    def block_files(self):
+        """
+        List of block files in blocks directory, sorted by file number
+
+        :return list of (int, Path): List of file number and path tuples
+        """
+        files = []
+        for path in self.blocks_dir.glob('blk*.dat'):
+            if path.stem[3:].isdigit():
+                files.append((int(path.stem[3:]), path))
+        return sorted(files)
+
+    def _index_db(self):
+        db = sqlite3.connect(str(self.index_filename))
+        db.execute("CREATE TABLE IF NOT EXISTS info (id INTEGER PRIMARY KEY, blocks_dir TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS blocks (block_hash BLOB PRIMARY KEY, file_n INTEGER, "
+                   "offset INTEGER, size INTEGER, prev_block BLOB)")
+        db.execute("CREATE TABLE IF NOT EXISTS files (file_n INTEGER PRIMARY KEY, scanned INTEGER)")
+        return db
+
+    def _load_index(self):
+        db = self._index_db()
+        try:
+            info = db.execute("SELECT blocks_dir FROM info WHERE id=1").fetchone()
+            if info and info[0] == str(self.blocks_dir):
+                self.index = {row[0]: tuple(row[1:]) for row in
+                              db.execute("SELECT block_hash, file_n, offset, size, prev_block FROM blocks")}
+                self.files_scanned = dict(db.execute("SELECT file_n, scanned FROM files"))
+            else:
+                # Index of another blocks directory, create new index
+                db.execute("DELETE FROM blocks")
+                db.execute("DELETE FROM files")
+                db.execute("INSERT OR REPLACE INTO info VALUES (1, ?)", (str(self.blocks_dir),))
+                db.commit()
+        finally:
+            db.close()
+
+    def update_index(self, workers=None):
+        """
+        Scan new blocks in block files and add them to the index. Files which are not scanned yet are scanned in
+        parallel, if workers is larger than 1.
+
+        :param workers: Number of worker processes to scan block files. Default is None to use the number of CPU's
+        :type workers: int
+
+        :return int: Number of blocks added to the index
+        """
+        scan_jobs = []
+        for file_n, path in self.block_files():
+            start = self.files_scanned.get(file_n, 0)
+            if path.stat().st_size > start:
+                scan_jobs.append((file_n, str(path), start))
+        if not scan_jobs:
+            return 0
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        args = ([str(path) for _, path, _ in scan_jobs], [self.magic] * len(scan_jobs),
+                [self.xor_key] * len(scan_jobs), [start for _, _, start in scan_jobs])
+        if workers > 1 and len(scan_jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(scan_jobs))) as executor:
+                results = list(executor.map(_scan_block_file, *args))
+        else:
+            results = list(map(_scan_block_file, *args))
+
+        new_blocks = []
+        for (file_n, _, _), (blocks, end_pos) in zip(scan_jobs, results):
+            for block_hash, prev_block, offset, size in blocks:
+                self.index[block_hash] = (file_n, offset, size, prev_block)
+                new_blocks.append((block_hash, file_n, offset, size, prev_block))
+            self.files_scanned[file_n] = end_pos
+            # Reopen memory map, file size could have changed
+            if file_n in self._mmaps:
+                self._mmaps.pop(file_n).close()
+                self._files.pop(file_n).close()
+        self._main_chain = None
+        db = self._index_db()
+        try:
+            db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)", new_blocks)
+            db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?)",
+                           [(file_n, self.files_scanned[file_n]) for file_n, _, _ in scan_jobs])
+            db.commit()
+        finally:
+            db.close()
+        _logger.info("Added %d blocks to block file index %s" % (len(new_blocks), self.index_filename))
+        return len(new_blocks)
+
+    def _mmap(self, file_n):
+        if file_n not in self._mmaps:
+            self._files[file_n] = open(Path(self.blocks_dir, 'blk%05d.dat' % file_n), 'rb')
+            self._mmaps[file_n] = mmap.mmap(self._files[file_n].fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmaps[file_n]
+
+    def raw_block(self, block_hash):
+        """
+        Get raw serialized block with specified block hash
+
+        :param block_hash: Block hash
+        :type block_hash: bytes, str
+
+        :return bytes:
+        """
+        block_hash = to_bytes(block_hash)
+        if block_hash not in self.index:
+            raise ValueError("Block %s not found in block files" % block_hash.hex())
+        file_n, offset, size, _ = self.index[block_hash]
+        return _xor_bytes(self._mmap(file_n)[offset:offset + size], self.xor_key, offset)
+
+    def block(self, block_hash, height=None, parse_transactions=False):
+        """
+        Get Block object with specified block hash. Transactions are not parsed by default, use the
+        :func:`Block.parse_transactions` method of the block to parse them later.
+
+        :param block_hash: Block hash
+        :type block_hash: bytes, str
+        :param height: Height of block, if known
+        :type height: int
+        :param parse_transactions: Parse all transactions in the block. Default is False
+        :type parse_transactions: bool
+
+        :return Block:
+        """
+        block_hash = to_bytes(block_hash)
+        return Block.parse_bytes(self.raw_block(block_hash), block_hash=block_hash, height=height,
+                                 parse_transactions=parse_transactions, network=self.network)
+
+    def blocks(self, parse_transactions=False):
+        """
+        Iterate over all blocks in the order of the block files. This includes blocks which are not in the main
+        chain and blocks are not sorted by height.
+
+        :param parse_transactions: Parse all transactions in the blocks. Default is False
+        :type parse_transactions: bool
+
+        :return Block:
+        """
+        for block_hash, _ in sorted(self.index.items(), key=lambda x: x[1][:2]):
+            yield self.block(block_hash, parse_transactions=parse_transactions)
+
+    def main_chain(self):
+        """
+        List of block hashes of the longest chain found in the block files, ordered by height. The first block is
+        the block without a known previous block, normally the genesis block.
+
+        :return list of bytes:
+        """
+        if self._main_chain is not None:
+            return self._main_chain
+        heights = {}
+        for block_hash in self.index:
+            path = []
+            while block_hash not in heights:
+                path.append(block_hash)
+                prev_block = self.index[block_hash][3]
+                if prev_block not in self.index:
+                    heights[block_hash] = 0
+                    path.pop()
+                    break
+                block_hash = prev_block
+            height = heights[block_hash]
+            for block_hash in reversed(path):
+                height += 1
+                heights[block_hash] = height
+        chain = []
+        if heights:
+            block_hash = max(heights, key=heights.get)
+            while block_hash in self.index:
+                chain.append(block_hash)
+                block_hash = self.index[block_hash][3]
+        self._main_chain = chain[::-1]
+        return self._main_chain
+
+    def blocks_by_height(self, start=0, end=None, parse_transactions=False):
+        """
+        Iterate over blocks in the main chain ordered by height.
+
+        :param start: First block height. Default is 0
+        :type start: int
+        :param end: Stop before this block height. Default is None to iterate to the last block
+        :type end: int
+        :param parse_transactions: Parse all transactions in the blocks. Default is False
+        :type parse_transactions: bool
+
+        :return Block:
+        """
+        chain = self.main_chain()
+        for height in range(start, len(chain) if end is None else min(end, len(chain))):
+            yield self.block(chain[height], height=height, parse_transactions=parse_transactions)
+
+
+class UtxoSet:
+    """
+    Set of unspent transaction outputs, created by applying blocks in order of the blockchain.
+
+    When a block is applied all outputs are added to the set and all outputs spent by the inputs are removed. The
+    value and locking script of the spent outputs are copied to the transaction inputs, so the signatures of the block
+    can be verified without requesting previous transactions from a service provider.
+
+    UTXO's are stored in memory. If a filename is provided UTXO's are written to a SQLite database if the number
+    of UTXO's in memory exceeds max_memory_items, and when the set is closed. The last blocks can be reverted with
+    :func:`undo_block`, undo data is only kept in memory.
+
+    >>> from bitcoinlib.services.services import Service
+    >>> utxo_set = UtxoSet()  # doctest: +SKIP
+    >>> for height in range(0, 1000):  # doctest: +SKIP
+    ...     utxo_set.apply_block(Service().getblock(height, parse_transactions=True, limit=99999), verify=True)
+
+    """
+
+    def __init__(self, filename=None, max_memory_items=UTXO_SET_MAX_MEMORY_ITEMS, undo_depth=UTXO_SET_UNDO_DEPTH):
+        """
+        Create a new UTXO set or open an existing UTXO set database.
+
+        :param filename: Filename of SQLite database to store UTXO's. Leave empty to keep all UTXO's in memory
+        :type filename: str, Path
+        :param max_memory_items: Maximum number of UTXO's in memory before they are written to the database
+        :type max_memory_items: int
+        :param undo_depth: Number of blocks which can be reverted
+        :type undo_depth: int
+        """
+        self.filename = filename
+        self.max_memory_items = max_memory_items
+        self._utxos = {}
+        self._undo = deque(maxlen=undo_depth)
+        self._db = None
+        self._db_count = 0
+        self.height = None
+        self.block_hash = None
+        if self.filename:
+            self._db = sqlite3.connect(str(self.filename))
+            self._db.execute("CREATE TABLE IF NOT EXISTS utxos (outpoint BLOB PRIMARY KEY, value INTEGER, "
+                             "script BLOB, height INTEGER, coinbase INTEGER)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS tip (id INTEGER PRIMARY KEY, height INTEGER, "
+                             "block_hash BLOB)")
+            tip = self._db.execute("SELECT height, block_hash FROM tip WHERE id=1").fetchone()
+            if tip:
+                self.height, self.block_hash = tip
+            self._db_count = self._db.execute("SELECT COUNT(*) FROM utxos").fetchone()[0]
+
+    def __repr__(self):
+        return "<UtxoSet(height %s, utxos: %d)>" % (self.height, len(self))
+
+    def __len__(self):
+        return len(self._utxos) + self._db_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _outpoint(txid, output_n):
+        return to_bytes(txid) + output_n.to_bytes(4, 'big')
+
+    def _db_get(self, outpoint):
+        if not self._db_count:
+            return None
+        row = self._db.execute("SELECT value, script, height, coinbase FROM utxos WHERE outpoint=?",
+                               (outpoint,)).fetchone()
+        if row:
+            return row[0], row[1], row[2], bool(row[3])
+        return None
+
+    def _spend(self, outpoint):
+        entry = self._utxos.pop(outpoint, None)
+        if entry is None:
+            entry = self._db_get(outpoint)
+            if entry is not None:
+                self._db.execute("DELETE FROM utxos WHERE outpoint=?", (outpoint,))
+                self._db_count -= 1
+        return entry
+
+    def get(self, txid, output_n):
+        """
+        Get unspent output
+
+        :param txid: Transaction ID
+        :type txid: bytes, str
+        :param output_n: Output index number
+        :type output_n: int
+
+        :return tuple: Tuple with value, locking script, block height and coinbase flag. None if output is not found
+        """
+        outpoint = self._outpoint(txid, output_n)
+        entry = self._utxos.get(outpoint)
+        if entry is None:
+            entry = self._db_get(outpoint)
+        return entry
+
+    def fill_inputs(self, transaction):
+        """
+        Set value and locking script of transaction inputs from the UTXO set. Inputs which spend outputs not in this
+        UTXO set are not updated.
+
+        :param transaction: Transaction object
+        :type transaction: Transaction
+
+        :return int: Number of updated inputs
+        """
+        n = 0
+        for inp in transaction.inputs:
+            entry = self.get(inp.prev_txid, inp.output_n_int)
+            if entry:
+                inp.value = entry[0]
+                if not inp.locking_script:
+                    inp.locking_script = entry[1]
+                n += 1
+        return n
+
+    def apply_block(self, block, height=None, verify=False, workers=1):
+        """
+        Apply a block to the UTXO set: spend all outputs used by the block's inputs and add the new outputs.
+        Unspendable OP_RETURN outputs are not added. Values and locking scripts of the spent outputs are copied to
+        the inputs of the block's transactions.
+
+        The block must have all transactions, and must follow the last applied block. If a spent output is not found
+        or the block signatures are invalid a ValueError is raised and the UTXO set is not changed.
+
+        :param block: Block object
+        :type block: Block
+        :param height: Height of block. Default is height of block or the next height of this UTXO set
+        :type height: int
+        :param verify: Verify all signatures in the block with :func:`Block.verify`. Default is False
+        :type verify: bool
+        :param workers: Number of worker processes to verify signatures, passed to :func:`Block.verify`
+        :type workers: int
+
+        :return int: Height of applied block
+        """
+        if self.block_hash is not None and block.prev_block != self.block_hash:
+            raise ValueError("Block %s does not follow last block %s of UTXO set" %
+                             (block.block_hash.hex(), self.block_hash.hex()))
+        if len(block.transactions) < block.tx_count:
+            block.parse_transactions()
+        if height is None:
+            height = block.height if block.height is not None else (0 if self.height is None else self.height + 1)
+
+        created = []
+        spent = []
+        overwritten = []
+        try:
+            for t in block.transactions:
+                if not t.coinbase:
+                    for inp in t.inputs:
+                        outpoint = self._outpoint(inp.prev_txid, inp.output_n_int)
+                        entry = self._spend(outpoint)
+                        if entry is None:
+                            raise ValueError("Output %s:%d spent in transaction %s not found in UTXO set" %
+                                             (inp.prev_txid.hex(), inp.output_n_int, t.txid))
+                        spent.append((outpoint, entry))
+                        inp.value = entry[0]
+                        if not inp.locking_script:
+                            inp.locking_script = entry[1]
+                txid = bytes.fromhex(t.txid)
+                for n, o in enumerate(t.outputs):
+                    if o.lock_script[:1] == b'\x6a':
+                        continue
+                    outpoint = txid + n.to_bytes(4, 'big')
+                    # Unspent output of a transaction with the same txid, as with duplicate coinbase transactions
+                    # before BIP30, is overwritten and restored when the block is reverted
+                    entry = self._spend(outpoint)
+                    if entry is not None:
+                        overwritten.append((outpoint, entry))
+                    self._utxos[outpoint] = (o.value, o.lock_script, height, t.coinbase)
+                    created.append(outpoint)
+            if verify and not block.verify(workers):
+                raise ValueError("Block %s contains invalid signatures" % block.block_hash.hex())
+        except Exception:
+            self._revert(created, spent, overwritten)
+            raise
+
+        self._undo.append((block.block_hash, self.height, self.block_hash, created, spent, overwritten))
+        self.height = height
+        self.block_hash = block.block_hash
+        if self._db is not None and len(self._utxos) > self.max_memory_items:
+            self.flush()
+        return height
+
+    def _revert(self, created, spent, overwritten):
+        # Restore spent outputs first, outputs created and spent in the same block are removed again below
+        for outpoint, entry in reversed(spent):
+            self._utxos[outpoint] = entry
+        for outpoint in created:
+            if self._utxos.pop(outpoint, None) is None and self._db_get(outpoint):
+                self._db.execute("DELETE FROM utxos WHERE outpoint=?", (outpoint,))
+                self._db_count -= 1
+        for outpoint, entry in reversed(overwritten):
+            self._utxos[outpoint] = entry
+
+    def undo_block(self):
+        """
+        Revert last applied block, for instance in case of a blockchain reorganisation.
+
+        :return bytes: Block hash of reverted block
+        """
+        if not self._undo:
+            raise ValueError("No undo data available to revert block")
+        block_hash, prev_height, prev_block_hash, created, spent, overwritten = self._undo.pop()
+        self._revert(created, spent, overwritten)
+        self.height = prev_height
+        self.block_hash = prev_block_hash
+        return block_hash
+
+    def spent_scripts(self, block_hash=None):
+        """
+        Get locking scripts of outputs spent in an applied block, from the undo data of this UTXO set. Can be used to
+        create a :class:`BlockFilter`.
+
+        :param block_hash: Hash of applied block. Default is the last applied block
+        :type block_hash: bytes, str
+
+        :return list of bytes:
+        """
+        block_hash = self.block_hash if block_hash is None else to_bytes(block_hash)
+        for undo_block_hash, _, _, _, spent, _ in self._undo:
+            if undo_block_hash == block_hash:
+                return [entry[1] for _, entry in spent]
+        raise ValueError("No undo data available for block %s" % block_hash.hex())
+
+    def flush(self):
+        """
+        Write all UTXO's in memory and the current block height to the database. Only used if a filename is provided.
+        """
+        if self._db is None:
+            return
+        self._db.executemany("INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)",
+                             [(k, v[0], v[1], v[2], int(v[3])) for k, v in self._utxos.items()])
+        self._db.execute("INSERT OR REPLACE INTO tip VALUES (1, ?, ?)", (self.height, self.block_hash))
+        self._db.commit()
+        self._utxos = {}
+        self._db_count = self._db.execute("SELECT COUNT(*) FROM utxos").fetchone()[0]
+
+    def close(self):
+        """
+        Write UTXO's to database, if a filename is provided, and close the database.
+        """
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+
+class BlockFilter:
+    """
+    BIP158 basic compact block filter.
+
+    A filter contains a Golomb-coded set of hashes of all output scripts created in a block and all previous output
+    scripts spent in the block. A wallet can match its locking scripts against a filter to check if a block contains
+    transactions of the wallet, without downloading and parsing the block. False positives occur with a probability
+    of 1 in 784931 per script.
+
+    """
+
+    P = 19
+    M = 784931
+
+    def __init__(self, filter_bytes, block_hash):
+        """
+        Create a block filter object from a serialized filter.
+
+        :param filter_bytes: Serialized BIP158 filter
+        :type filter_bytes: bytes, str
+        :param block_hash: Hash of the block
+        :type block_hash: bytes, str
+        """
+        self.filter_bytes = to_bytes(filter_bytes)
+        self.block_hash = to_bytes(block_hash)
+        self.key = self.block_hash[::-1][:16]
+        raw = BytesIO(self.filter_bytes)
+        self.n = read_varbyteint(raw) if self.filter_bytes else 0
+        self._data_start = raw.tell()
+        self._values = None
+
+    def __repr__(self):
+        return "<BlockFilter(%s, items: %d)>" % (self.block_hash.hex(), self.n)
+
+    @classmethod
+    def from_block(cls, block, spent_scripts=None):
+        """
+        Create a basic filter for given block. The block must contain all transactions.
+
+        The filter contains the locking scripts of the inputs of the block. Supply the spent locking scripts with
+        the spent_scripts argument, for instance from :func:`UtxoSet.spent_scripts`. If not provided the locking
+        scripts of the transaction inputs are used, but these are not always available or exact for parsed
+        transactions.
+
+        :param block: Block with transactions
+        :type block: Block
+        :param spent_scripts: List of previous locking scripts spent by the inputs in this block
+        :type spent_scripts: list of bytes
+
+        :return BlockFilter:
+        """
+        if len(block.transactions) < block.tx_count:
+            block.parse_transactions()
+        if spent_scripts is None:
+            spent_scripts = [inp.locking_script for t in block.transactions if not t.coinbase for inp in t.inputs]
+        items = set(spent_scripts)
+        for t in block.transactions:
+            for o in t.outputs:
+                if o.lock_script and o.lock_script[:1] != b'\x6a':
+                    items.add(o.lock_script)
+        items.discard(b'')
+        return cls.from_items(items, block.block_hash)
+
+    @classmethod
+    def from_items(cls, items, block_hash):
+        """
+        Create a basic filter with given list of items.
+
+        :param items: List of items, normally locking scripts
+        :type items: list of bytes
+        :param block_hash: Hash of block, used as key for the item hashes
+        :type block_hash: bytes, str
+
+        :return BlockFilter:
+        """
+        block_hash = to_bytes(block_hash)
+        items = set(items)
+        n = len(items)
+        values = sorted(cls._hash_items(items, block_hash[::-1][:16], n))
+        data = bytearray()
+        acc = 0
+        acc_bits = 0
+        last = 0
+        for value in values:
+            delta = value - last
+            last = value
+            quotient = delta >> cls.P
+            # Unary encoded quotient followed by a zero and the remainder in P bits
+            acc = (((acc << (quotient + 1)) | (((1 << quotient) - 1) << 1)) << cls.P) | (delta & ((1 << cls.P) - 1))
+            acc_bits += quotient + 1 + cls.P
+            # Move complete bytes to output, so the bit accumulator stays small
+            while acc_bits >= 8:
+                acc_bits -= 8
+                data.append((acc >> acc_bits) & 0xff)
+            acc &= (1 << acc_bits) - 1
+        if acc_bits:
+            data.append((acc << (8 - acc_bits)) & 0xff)
+        bf = cls(int_to_varbyteint(n) + bytes(data), block_hash)
+        bf._values = values
+        return bf
+
+    @classmethod
+    def _hash_items(cls, items, key, n):
+        f = n * cls.M
+        return [(siphash(key, item) * f) >> 64 for item in items]
+
+    @property
+    def values(self):
+        """
+        Sorted list of hashed values in this filter
+
+        :return list of int:
+        """
+        if self._values is None:
+            data = self.filter_bytes[self._data_start:]
+            n_bits = len(data) * 8
+            mask = (1 << self.P) - 1
+            pos = 0
+            values = []
+            last = 0
+            for _ in range(self.n):
+                quotient = 0
+                while pos < n_bits and (data[pos >> 3] >> (7 - (pos & 7))) & 1:
+                    quotient += 1
+                    pos += 1
+                pos += 1
+                if pos + self.P > n_bits:
+                    raise ValueError("Invalid block filter, unexpected end of data")
+                # Read remainder of P bits from the bytes which contain them
+                start = pos >> 3
+                n_bytes = ((pos & 7) + self.P + 7) // 8
+                chunk = int.from_bytes(data[start:start + n_bytes], 'big')
+                remainder = (chunk >> (n_bytes * 8 - (pos & 7) - self.P)) & mask
+                pos += self.P
+                last += (quotient << self.P) | remainder
+                values.append(last)
+            self._values = values
+        return self._values
+
+    def match(self, item):
+        """
+        Check if item, normally a locking script, is in this filter. False positives are possible.
+
+        :param item: Item to check
+        :type item: bytes
+
+        :return bool:
+        """
+        return self.match_any([item])
+
+    def match_any(self, items):
+        """
+        Check if any of the given items, normally the locking scripts of a wallet, are in this filter. False
+        positives are possible.
+
+        :param items: List of items
+        :type items: list of bytes
+
+        :return bool:
+        """
+        if not self.n:
+            return False
+        query = sorted(self._hash_items(set(items), self.key, self.n))
+        values = self.values
+        i = j = 0
+        while i < len(query) and j < len(values):
+            if query[i] == values[j]:
+                return True
+            if query[i] < values[j]:
+                i += 1
+            else:
+                j += 1
+        return False
+
+    def filter_hash(self):
+        """
+        Double SHA256 hash of serialized filter
+
+        :return bytes:
+        """
+        return double_sha256(self.filter_bytes)[::-1]
+
+    def header(self, prev_header=b'\0' * 32):
+        """
+        Calculate filter header, which commits to this filter and all previous filters.
+
+        :param prev_header: Filter header of previous block. Default is 32 zero bytes for the genesis block
+        :type prev_header: bytes, str
+
+        :return bytes:
+        """
+        return double_sha256(self.filter_hash()[::-1] + to_bytes(prev_header)[::-1])[::-1]
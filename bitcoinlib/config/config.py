@@ -53,6 +53,18 @@ TIMEOUT_REQUESTS = 5
 MAX_TRANSACTIONS = 20
 BLOCK_COUNT_CACHE_TIME = 3
 SERVICE_MAX_ERRORS = 4  # Fail service request when more then max errors occur for <SERVICE_MAX_ERRORS> providers
+BITCOIND_RPC_BATCH_SIZE = 100  # Maximum number of calls in one batched JSON-RPC request to bitcoind
+SERVICE_SCORE_EWMA_ALPHA = 0.2  # Weight of last request in moving average of provider latency and error rate
+SERVICE_CIRCUIT_BREAKER_ERRORS = 3  # Skip provider after this number of consecutive errors...
+SERVICE_CIRCUIT_BREAKER_TIME = 60  # ...for this number of seconds
+SERVICE_PROVIDER_SCORES_FILE = None  # Store provider scores in this file, to reuse them in next session
+SERVICE_CACHE_SHARED = False  # Cache database is shared by multiple processes: use WAL journaling and a writer thread
+SERVICE_CACHE_BUSY_TIMEOUT = 30  # Seconds to wait for a lock on a shared cache database
+SERVICE_CACHE_POOL_SIZE = 10  # Number of pooled connections per process for a shared cache database
+SERVICE_CACHE_WRITE_BATCH_SIZE = 500  # Maximum number of cache writes committed in one database transaction...
+SERVICE_CACHE_WRITE_INTERVAL = 0.5  # ...and seconds to wait for more writes before committing
+SERVICE_CACHE_WRITE_FLUSH_TIMEOUT = 60  # Maximum number of seconds to wait for queued cache writes when flushing
+SERVICE_METRICS_LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)  # Upper bounds in ms
 
 # Transactions
 SCRIPT_TYPES = {
@@ -156,6 +168,22 @@ elif locale.getpreferredencoding().lower() != 'utf-8':
                            "This library needs the locale set to UTF-8 to function properly" %
                            locale.getpreferredencoding())
 
+# Magic bytes at the start of each block in the Bitcoin Core blk*.dat block files
+BLOCK_FILE_MAGIC = {
+    'bitcoin': b'\xf9\xbe\xb4\xd9',
+    'testnet': b'\x0b\x11\x09\x07',
+    'testnet4': b'\x1c\x16\x3f\x28',
+    'signet': b'\x0a\x03\xcf\x40',
+    'regtest': b'\xfa\xbf\xb5\xda',
+    'litecoin': b'\xfb\xc0\xb6\xdb',
+    'litecoin_testnet': b'\xfd\xd2\xc8\xf1',
+    'dogecoin': b'\xc0\xc0\xc0\xc0',
+    'dogecoin_testnet': b'\xfc\xc1\xb7\xdc',
+}
+
+UTXO_SET_UNDO_DEPTH = 100  # Number of blocks which can be reverted in a UTXO set
+UTXO_SET_MAX_MEMORY_ITEMS = 2000000  # Maximum number of UTXO's in memory before they are written to disk
+
 # Keys / Addresses
 SUPPORTED_ADDRESS_ENCODINGS = ['base58', 'bech32']
 ENCODING_BECH32_PREFIXES = ['bc', 'tb', 'ltc', 'tltc', 'blt']
@@ -166,6 +194,10 @@ KEY_PATH_P2SH = ["m", "purpose'", "cosigner_index", "change", "address_index"]
 KEY_PATH_P2WSH = ["m", "purpose'", "coin_type'", "account'", "script_type'", "change", "address_index"]
 KEY_PATH_P2WPKH = ["m", "purpose'", "coin_type'", "account'", "change", "address_index"]
 KEY_PATH_BITCOINCORE = ['m', "account'", "change'", "address_index'"]
+PUBLIC_KEY_CACHE_SIZE = 4096
+VERIFY_BATCH_POOL_MIN_SIZE = 1000  # Minimum number of signatures to verify in a process pool
+SIGN_BATCH_POOL_MIN_SIZE = 1000  # Minimum number of signatures to create in a process pool
+KEY_RANGE_BATCH_SIZE = 1024  # Number of public key points to calculate per batch when generating key ranges
 
 # Wallets
 WALLET_KEY_STRUCTURES = [
@@ -265,7 +297,10 @@ def read_config():
     global BCL_LOG_FILE, LOGLEVEL, ENABLE_BITCOINLIB_LOGGING
     global TIMEOUT_REQUESTS, DEFAULT_LANGUAGE, DEFAULT_NETWORK, DEFAULT_WITNESS_TYPE
     global SERVICE_CACHING_ENABLED, DATABASE_ENCRYPTION_ENABLED, DB_FIELD_ENCRYPTION_KEY, DB_FIELD_ENCRYPTION_PASSWORD
-    global SERVICE_MAX_ERRORS, BLOCK_COUNT_CACHE_TIME, MAX_TRANSACTIONS
+    global SERVICE_MAX_ERRORS, BLOCK_COUNT_CACHE_TIME, MAX_TRANSACTIONS, BITCOIND_RPC_BATCH_SIZE
+    global SERVICE_CIRCUIT_BREAKER_ERRORS, SERVICE_CIRCUIT_BREAKER_TIME, SERVICE_PROVIDER_SCORES_FILE
+    global PUBLIC_KEY_CACHE_SIZE, SERVICE_CACHE_SHARED, SERVICE_CACHE_BUSY_TIMEOUT, SERVICE_CACHE_POOL_SIZE
+    global SERVICE_CACHE_WRITE_BATCH_SIZE, SERVICE_CACHE_WRITE_INTERVAL, SERVICE_CACHE_WRITE_FLUSH_TIMEOUT
 
     # Get Bitcoinlib data directory, default is at  ~/.bitcoinlib
     env_data_dir = os.environ.get('BCL_DATA_DIR')
@@ -301,11 +336,31 @@ def read_config():
     SERVICE_MAX_ERRORS = int(config_get('common', 'service_max_errors', fallback=SERVICE_MAX_ERRORS))
     MAX_TRANSACTIONS = int(config_get('common', 'max_transactions', fallback=MAX_TRANSACTIONS))
     BLOCK_COUNT_CACHE_TIME = int(config_get('common', 'block_count_cache_time', fallback=BLOCK_COUNT_CACHE_TIME))
+    BITCOIND_RPC_BATCH_SIZE = int(config_get('common', 'bitcoind_rpc_batch_size', fallback=BITCOIND_RPC_BATCH_SIZE))
+    SERVICE_CIRCUIT_BREAKER_ERRORS = int(config_get('common', 'service_circuit_breaker_errors',
+                                                    fallback=SERVICE_CIRCUIT_BREAKER_ERRORS))
+    SERVICE_CIRCUIT_BREAKER_TIME = int(config_get('common', 'service_circuit_breaker_time',
+                                                  fallback=SERVICE_CIRCUIT_BREAKER_TIME))
+    SERVICE_CACHE_SHARED = config_get('common', 'service_cache_shared', fallback=SERVICE_CACHE_SHARED,
+                                      is_boolean=True)
+    SERVICE_CACHE_BUSY_TIMEOUT = int(config_get('common', 'service_cache_busy_timeout',
+                                                fallback=SERVICE_CACHE_BUSY_TIMEOUT))
+    SERVICE_CACHE_POOL_SIZE = int(config_get('common', 'service_cache_pool_size', fallback=SERVICE_CACHE_POOL_SIZE))
+    SERVICE_CACHE_WRITE_BATCH_SIZE = int(config_get('common', 'service_cache_write_batch_size',
+                                                    fallback=SERVICE_CACHE_WRITE_BATCH_SIZE))
+    SERVICE_CACHE_WRITE_INTERVAL = float(config_get('common', 'service_cache_write_interval',
+                                                    fallback=SERVICE_CACHE_WRITE_INTERVAL))
+    SERVICE_CACHE_WRITE_FLUSH_TIMEOUT = float(config_get('common', 'service_cache_write_flush_timeout',
+                                                         fallback=SERVICE_CACHE_WRITE_FLUSH_TIMEOUT))
+    provider_scores_file = config_get('locations', 'provider_scores_file', fallback='')
+    if provider_scores_file:
+        SERVICE_PROVIDER_SCORES_FILE = Path(BCL_DATA_DIR, provider_scores_file)
 
     # Other settings
     DEFAULT_LANGUAGE = config_get('common', 'default_language', fallback=DEFAULT_LANGUAGE)
     DEFAULT_NETWORK = config_get('common', 'default_network', fallback=DEFAULT_NETWORK)
     DEFAULT_WITNESS_TYPE = config_get('common', 'default_witness_type', fallback=DEFAULT_WITNESS_TYPE)
+    PUBLIC_KEY_CACHE_SIZE = int(config_get('common', 'public_key_cache_size', fallback=PUBLIC_KEY_CACHE_SIZE))
 
     if not data:
         return False
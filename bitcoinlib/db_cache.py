@@ -18,15 +18,22 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from sqlalchemy import create_engine
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Enum, LargeBinary
+import atexit
+import queue
+import time
+import threading
+from sqlalchemy import create_engine, make_url, inspect, event, MetaData, Table
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Enum, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, session
+from sqlalchemy.pool import NullPool
 from urllib.parse import urlparse
 from bitcoinlib.main import *
 
 
 _logger = logging.getLogger(__name__)
+_cache_engines = {}
+_cache_engines_lock = threading.Lock()
 Base = declarative_base()
 
 
@@ -42,9 +49,17 @@ class DbCache:
     Create a new database if it doesn't exist yet
 
     """
-    def __init__(self, db_uri=None):
+    def __init__(self, db_uri=None, shared=None):
+        """
+        :param db_uri: Database URI or filename of SQLite database. Default is the default cache database
+        :type db_uri: str
+        :param shared: Database is shared by multiple processes. SQLite databases are opened with WAL journaling and a busy timeout and writes are handled by a :class:`DbCacheWriter`. Default is SERVICE_CACHE_SHARED from config
+        :type shared: bool
+        """
         self.engine = None
         self.session = None
+        self.writer = None
+        self.shared = SERVICE_CACHE_SHARED if shared is None else shared
         if db_uri is None:
             db_uri = DEFAULT_DATABASE_CACHE
         elif not db_uri:
@@ -60,20 +75,241 @@ class DbCache:
             raise NotImplementedError("MySQL does not allow indexing on LargeBinary fields, so caching is not possible")
             # db_uri += "&" if "?" in db_uri else "?"
             # db_uri += 'binary_prefix=true'
-        self.engine = create_engine(db_uri, isolation_level='READ UNCOMMITTED')
-
-        Session = sessionmaker(bind=self.engine)
-        Base.metadata.create_all(self.engine)
         self.db_uri = db_uri
-        _logger.info("Using cache database: %s://%s:%s/%s" % (self.o.scheme or '', self.o.hostname or '',
-                                                              self.o.port or '', self.o.path or ''))
+        key = (db_uri, self.shared)
+        with _cache_engines_lock:
+            # Engines and session factories are created once per process and database. If a sqlite database file
+            # is removed, replaced or emptied a new engine is created.
+            db_file = make_url(db_uri).database if db_uri.startswith('sqlite') else None
+            file_id = os.stat(db_file).st_ino if db_file and os.path.exists(db_file) else None
+            if key not in _cache_engines or file_id != _cache_engines[key][2] or \
+                    (file_id and not inspect(_cache_engines[key][0]).has_table(DbCacheTransaction.__tablename__)):
+                if key in _cache_engines:
+                    _cache_engines[key][0].dispose()
+                # Every Cache object keeps a connection checked out while its session is open, so pools are not
+                # limited. Sqlite connections are cheap and are not pooled at all.
+                if self.shared:
+                    engine = self._create_shared_engine(db_uri)
+                elif db_file and db_file != ':memory:':
+                    engine = create_engine(db_uri, isolation_level='READ UNCOMMITTED', poolclass=NullPool)
+                elif db_uri.startswith('sqlite'):
+                    engine = create_engine(db_uri, isolation_level='READ UNCOMMITTED')
+                else:
+                    engine = create_engine(db_uri, isolation_level='READ UNCOMMITTED', max_overflow=-1)
+                Base.metadata.create_all(engine)
+                add_missing_indexes(engine)
+                if db_file and os.path.exists(db_file):
+                    file_id = os.stat(db_file).st_ino
+                Session = sessionmaker(bind=engine)
+                writer = DbCacheWriter(Session) if self.shared else None
+                _cache_engines[key] = (engine, Session, file_id, writer)
+                _logger.info("Using cache database: %s://%s:%s/%s" % (self.o.scheme or '', self.o.hostname or '',
+                                                                      self.o.port or '', self.o.path or ''))
+            self.engine, Session, _, self.writer = _cache_engines[key]
         self.session = Session()
 
+    @staticmethod
+    def _create_shared_engine(db_uri):
+        if not db_uri.startswith('sqlite'):
+            return create_engine(db_uri, pool_size=SERVICE_CACHE_POOL_SIZE, max_overflow=-1)
+        engine = create_engine(db_uri, isolation_level='READ UNCOMMITTED', pool_size=SERVICE_CACHE_POOL_SIZE,
+                               max_overflow=-1, connect_args={'timeout': SERVICE_CACHE_BUSY_TIMEOUT})
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            # With WAL journaling readers do not block the writer and the writer does not block readers
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA busy_timeout=%d' % (SERVICE_CACHE_BUSY_TIMEOUT * 1000))
+            cursor.close()
+        return engine
+
     def drop_db(self):
+        if self.writer:
+            self.writer.flush()
         self.session.commit()
         self.session.close()
         session.close_all_sessions()
         Base.metadata.drop_all(self.engine)
+        with _cache_engines_lock:
+            _cache_engines.pop((self.db_uri, self.shared), None)
+
+
+class DbCacheWriter:
+    """
+    Background writer for a cache database which is shared by multiple processes.
+
+    Write jobs of all Cache objects in this process are executed in order in a single session and committed in
+    batches of at most SERVICE_CACHE_WRITE_BATCH_SIZE jobs. So every process uses only one connection for writing, and
+    concurrent writers of other processes have to wait less often for the database lock.
+
+    If a batch fails, for instance because another process stored the same transaction, the jobs are retried one by one.
+    """
+
+    def __init__(self, session_factory, batch_size=None, interval=None):
+        """
+        :param session_factory: SQLAlchemy sessionmaker of cache database
+        :type session_factory: sessionmaker
+        :param batch_size: Maximum number of jobs per database transaction. Default is SERVICE_CACHE_WRITE_BATCH_SIZE
+        :type batch_size: int
+        :param interval: Number of seconds to wait for more jobs before committing. Default is SERVICE_CACHE_WRITE_INTERVAL
+        :type interval: float
+        """
+        self.session_factory = session_factory
+        self.batch_size = batch_size or SERVICE_CACHE_WRITE_BATCH_SIZE
+        self.interval = SERVICE_CACHE_WRITE_INTERVAL if interval is None else interval
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, job):
+        """
+        Add write job to queue. Starts the writer thread if it is not running.
+
+        :param job: Method which is called with the writer session as argument
+        :type job: callable
+        """
+        self._start()
+        self._queue.put(job)
+
+    def flush(self, timeout=None):
+        """
+        Commit queued jobs without waiting for more jobs, and wait until all jobs are executed and committed.
+
+        If the writer thread is not running anymore it is restarted.
+
+        :param timeout: Maximum number of seconds to wait. Default is SERVICE_CACHE_WRITE_FLUSH_TIMEOUT
+        :type timeout: float
+
+        :return bool: True if all jobs are executed, False if timeout expired
+        """
+        if self._thread is None:
+            return True
+        deadline = time.time() + (SERVICE_CACHE_WRITE_FLUSH_TIMEOUT if timeout is None else timeout)
+        self._queue.put(None)
+        while True:
+            self._start()
+            with self._queue.all_tasks_done:
+                if not self._queue.unfinished_tasks:
+                    return True
+                self._queue.all_tasks_done.wait(max(0, min(1, deadline - time.time())))
+                if not self._queue.unfinished_tasks:
+                    return True
+            if time.time() >= deadline:
+                _logger.warning("Timeout while waiting for %d cache writes" % self._queue.unfinished_tasks)
+                return False
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _execute(self, session, jobs):
+        try:
+            for job in jobs:
+                if job is not None:
+                    job(session)
+            session.commit()
+            self.batches += 1
+        except Exception as e:
+            session.rollback()
+            if len(jobs) == 1:
+                self.errors += 1
+                _logger.warning("Cache write failed: %s" % e)
+            else:
+                _logger.info("Cache write of batch with %d jobs failed, retry jobs separately: %s" % (len(jobs), e))
+                for job in jobs:
+                    self._execute(session, [job])
+
+    def _run(self):
+        session = None
+        while True:
+            jobs = [self._queue.get()]
+            try:
+                deadline = time.time() + self.interval
+                while len(jobs) < self.batch_size and jobs[-1] is not None:
+                    try:
+                        jobs.append(self._queue.get(timeout=max(0, deadline - time.time())))
+                    except queue.Empty:
+                        break
+                if session is None:
+                    session = self.session_factory()
+                self._execute(session, jobs)
+            except Exception as e:
+                # Jobs are lost, but the writer keeps running with a new session
+                failed = len([job for job in jobs if job is not None])
+                self.errors += failed
+                _logger.error("Cache writer failed, %d jobs not executed: %s" % (failed, e))
+                if session is not None:
+                    try:
+                        session.close()
+                    except Exception:
+                        pass
+                    session = None
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+
+def _flush_cache_writers():
+    for _, _, _, writer in list(_cache_engines.values()):
+        if writer:
+            writer.flush(SERVICE_CACHE_WRITE_FLUSH_TIMEOUT)
+
+
+def _reset_cache_engines():
+    # Database connections and writer threads can not be shared with a forked child process
+    global _cache_engines_lock
+    _cache_engines_lock = threading.Lock()
+    for engine, _, _, _ in _cache_engines.values():
+        engine.dispose(close=False)
+    _cache_engines.clear()
+
+
+atexit.register(_flush_cache_writers)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_cache_engines)
+
+
+# Indexes of older versions which are replaced by a composite index: index name, table name and columns
+_REPLACED_INDEXES = [
+    ('ix_cache_transactions_node_address', 'cache_transactions_node', ['address']),
+]
+
+
+def add_missing_indexes(engine):
+    """
+    Create indexes which are defined in the cache models but missing in the database. Tables which already exist are
+    not updated by create_all, so indexes added in newer versions are created here. Indexes of older versions which
+    are replaced by a new index are removed.
+
+    :param engine: SQLAlchemy engine of cache database
+    :type engine: Engine
+
+    :return list: Names of created indexes
+    """
+    created = []
+    existing_tables = inspect(engine).get_table_names()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = [ix['name'] for ix in inspect(engine).get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in existing:
+                _logger.info("Add index %s to cache table %s" % (index.name, table.name))
+                index.create(engine)
+                created.append(index.name)
+        for name, table_name, columns in _REPLACED_INDEXES:
+            if table_name == table.name and name in existing:
+                _logger.info("Remove index %s from cache table %s" % (name, table.name))
+                # Use copy of table, so the index is not added to the cache models
+                old_table = Table(table.name, MetaData(), *[Column(c, table.c[c].type) for c in columns])
+                Index(name, *[old_table.c[c] for c in columns]).drop(engine)
+    return created
 
 
 class DbCacheTransactionNode(Base):
@@ -81,11 +317,14 @@ class DbCacheTransactionNode(Base):
     Link table for cache transactions and addresses
     """
     __tablename__ = 'cache_transactions_node'
+    __table_args__ = (
+        Index('ix_cache_transactions_node_address_is_input_spent', 'address', 'is_input', 'spent'),
+    )
     txid = Column(LargeBinary(32), ForeignKey('cache_transactions.txid'), primary_key=True)
     transaction = relationship("DbCacheTransaction", back_populates='nodes', doc="Related transaction object")
     index_n = Column(Integer, primary_key=True, doc="Order of input/output in this transaction")
     value = Column(BigInteger, default=0, doc="Value of transaction input")
-    address = Column(String(255), index=True, doc="Address string base32 or base58 encoded")
+    address = Column(String(255), doc="Address string base32 or base58 encoded")
     script = Column(LargeBinary, doc="Locking or unlocking script")
     witnesses = Column(LargeBinary, doc="Witnesses (signatures) used in Segwit transaction inputs")
     sequence = Column(BigInteger, default=0xffffffff,
@@ -120,6 +359,9 @@ class DbCacheTransaction(Base):
 
     """
     __tablename__ = 'cache_transactions'
+    __table_args__ = (
+        Index('ix_cache_transactions_network_name_block_height_index', 'network_name', 'block_height', 'index'),
+    )
     txid = Column(LargeBinary(32), primary_key=True, doc="Hexadecimal representation of transaction hash or transaction ID")
     date = Column(DateTime, doc="Date when transaction was confirmed and included in a block")
     version = Column(BigInteger, default=1,
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+#    BitcoinLib - Python Cryptocurrency Library
+#    Index DataBase - SqlAlchemy database definitions for local address index
+#    © 2026 - 1200 Web Development <http://1200wd.com/>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+from sqlalchemy import create_engine, make_url
+from sqlalchemy import Column, Integer, BigInteger, Boolean, LargeBinary, Index
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, session
+from urllib.parse import urlparse
+from bitcoinlib.main import *
+
+
+_logger = logging.getLogger(__name__)
+_index_engines = {}
+_index_engines_lock = threading.Lock()
+Base = declarative_base()
+
+
+class DbIndex:
+    """
+    Local index database object. Initialize the database and open a session when creating the database object.
+
+    Create a new database if it doesn't exist yet
+
+    """
+    def __init__(self, db_uri):
+        self.o = urlparse(db_uri)
+        if not self.o.scheme or len(self.o.scheme) < 2:
+            db_uri = 'sqlite:///%s' % db_uri
+        if db_uri.startswith("sqlite://") and ALLOW_DATABASE_THREADS:
+            db_uri += "&" if "?" in db_uri else "?"
+            db_uri += "check_same_thread=False"
+        if self.o.scheme == 'mysql' or self.o.scheme == 'mariadb':
+            raise NotImplementedError("MySQL does not allow indexing on LargeBinary fields, so indexing is not "
+                                      "possible")
+        self.db_uri = db_uri
+        with _index_engines_lock:
+            # Engines and session factories are created once per process and database. If a sqlite database file
+            # is removed or replaced a new engine is created.
+            db_file = make_url(db_uri).database if db_uri.startswith('sqlite') else None
+            file_id = os.stat(db_file).st_ino if db_file and os.path.exists(db_file) else None
+            if db_uri not in _index_engines or file_id != _index_engines[db_uri][2]:
+                if db_uri in _index_engines:
+                    _index_engines[db_uri][0].dispose()
+                engine = create_engine(db_uri)
+                Base.metadata.create_all(engine)
+                if db_file and os.path.exists(db_file):
+                    file_id = os.stat(db_file).st_ino
+                _index_engines[db_uri] = (engine, sessionmaker(bind=engine), file_id)
+                _logger.info("Using index database: %s://%s:%s/%s" % (self.o.scheme or '', self.o.hostname or '',
+                                                                      self.o.port or '', self.o.path or ''))
+            self.engine, Session, _ = _index_engines[db_uri]
+        self.session = Session()
+
+    def drop_db(self):
+        self.session.commit()
+        self.session.close()
+        session.close_all_sessions()
+        Base.metadata.drop_all(self.engine)
+        with _index_engines_lock:
+            _index_engines.pop(self.db_uri, None)
+
+
+class DbIndexBlock(Base):
+    """
+    Indexed blocks
+    """
+    __tablename__ = 'index_blocks'
+    height = Column(Integer, primary_key=True, doc="Height or sequence number for this block")
+    block_hash = Column(LargeBinary(32), index=True, doc="Hash of this block")
+    time = Column(BigInteger, doc="Timestamp to indicated when block was created")
+    tx_count = Column(Integer, doc="Number of transactions included in this block")
+
+
+class DbIndexTransaction(Base):
+    """
+    Indexed transactions, with raw transaction data
+
+    Transaction ID's are not unique: before BIP30 two coinbase transactions have been duplicated in a later block.
+    """
+    __tablename__ = 'index_transactions'
+    id = Column(Integer, primary_key=True)
+    txid = Column(LargeBinary(32), index=True, doc="Transaction ID")
+    height = Column(Integer, index=True, doc="Height of block this transaction is included in")
+    index = Column(Integer, doc="Index of transaction in block")
+    raw = Column(LargeBinary, doc="Raw serialized transaction")
+
+
+class DbIndexOutput(Base):
+    """
+    Indexed transaction outputs, with reference to the spending transaction input
+
+    Outputs of a transaction which are overwritten by a later transaction with the same transaction ID are marked as
+    spent by this later transaction.
+    """
+    __tablename__ = 'index_outputs'
+    __table_args__ = (
+        Index('ix_index_outputs_txid_output_n', 'txid', 'output_n'),
+    )
+    id = Column(Integer, primary_key=True)
+    txid = Column(LargeBinary(32), doc="Transaction ID")
+    output_n = Column(Integer, doc="Index number of output in transaction")
+    scripthash = Column(LargeBinary(32), index=True, doc="SHA256 hash of locking script")
+    value = Column(BigInteger, doc="Value of output in smallest denominator")
+    script = Column(LargeBinary, doc="Locking script")
+    height = Column(Integer, doc="Height of block this output is included in")
+    spending_txid = Column(LargeBinary(32), index=True, doc="Transaction ID of input which spends this output")
+    spending_input_n = Column(Integer, doc="Index number of transaction input which spends this output")
+
+
+class DbIndexHistory(Base):
+    """
+    Scripthash history: transactions which spend or create outputs with a certain locking script
+    """
+    __tablename__ = 'index_history'
+    id = Column(Integer, primary_key=True)
+    scripthash = Column(LargeBinary(32), index=True, doc="SHA256 hash of locking script")
+    height = Column(Integer, index=True, doc="Height of block with this transaction")
+    index = Column(Integer, doc="Index of transaction in block")
+    txid = Column(LargeBinary(32), doc="Transaction ID")
+    n = Column(Integer, doc="Index number of transaction input or output")
+    is_input = Column(Boolean, doc="True if input, False if output")
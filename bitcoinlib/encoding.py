@@ -987,6 +987,58 @@ def hash160(string):
     return ripemd160(hashlib.sha256(string).digest())
 
 
+def siphash(key, data):
+    """
+    SipHash-2-4 hash of data with a 128-bit key, used in BIP158 compact block filters.
+
+    >>> siphash(bytes(range(16)), b'')
+    8246050544436514353
+
+    :param key: Key of 16 bytes
+    :type key: bytes
+    :param data: Data to hash
+    :type data: bytes
+
+    :return int: 64-bit hash value
+    """
+    mask = 0xffffffffffffffff
+    k0 = int.from_bytes(key[:8], 'little')
+    k1 = int.from_bytes(key[8:16], 'little')
+    v0 = k0 ^ 0x736f6d6570736575
+    v1 = k1 ^ 0x646f72616e646f6d
+    v2 = k0 ^ 0x6c7967656e657261
+    v3 = k1 ^ 0x7465646279746573
+
+    def _rounds(v0, v1, v2, v3, n):
+        for _ in range(n):
+            v0 = (v0 + v1) & mask
+            v1 = ((v1 << 13) | (v1 >> 51)) & mask ^ v0
+            v0 = ((v0 << 32) | (v0 >> 32)) & mask
+            v2 = (v2 + v3) & mask
+            v3 = ((v3 << 16) | (v3 >> 48)) & mask ^ v2
+            v0 = (v0 + v3) & mask
+            v3 = ((v3 << 21) | (v3 >> 43)) & mask ^ v0
+            v2 = (v2 + v1) & mask
+            v1 = ((v1 << 17) | (v1 >> 47)) & mask ^ v2
+            v2 = ((v2 << 32) | (v2 >> 32)) & mask
+        return v0, v1, v2, v3
+
+    length = len(data)
+    tail_pos = length - length % 8
+    for i in range(0, tail_pos, 8):
+        m = int.from_bytes(data[i:i + 8], 'little')
+        v3 ^= m
+        v0, v1, v2, v3 = _rounds(v0, v1, v2, v3, 2)
+        v0 ^= m
+    m = int.from_bytes(data[tail_pos:], 'little') | ((length & 0xff) << 56)
+    v3 ^= m
+    v0, v1, v2, v3 = _rounds(v0, v1, v2, v3, 2)
+    v0 ^= m
+    v2 ^= 0xff
+    v0, v1, v2, v3 = _rounds(v0, v1, v2, v3, 4)
+    return v0 ^ v1 ^ v2 ^ v3
+
+
 def aes_encrypt(data, key):
     """
     Encrypt data using AES Symmetric Block cipher Encryption in SIV mode (see
@@ -21,8 +21,10 @@
 import hmac
 import random
 import collections
+import functools
 import json
 from binascii import b2a_base64, a2b_base64
+from concurrent.futures import ProcessPoolExecutor
 
 from bitcoinlib.networks import Network, network_by_value, wif_prefix_search
 from bitcoinlib.config.secp256k1 import *
@@ -42,6 +44,10 @@ else:
     secp256k1_curve = ecdsa.ellipticcurve.CurveFp(secp256k1_p, secp256k1_a, secp256k1_b)
     secp256k1_generator = ecdsa.ellipticcurve.Point(secp256k1_curve, secp256k1_Gx, secp256k1_Gy, secp256k1_n)
 
+# Curve parameters as decimal strings, as expected by the fastecdsa verify method
+_SECP256K1_PARAMS_STR = tuple(str(v) for v in (secp256k1_p, secp256k1_a, secp256k1_b, secp256k1_n, secp256k1_Gx,
+                                              secp256k1_Gy))
+
 _logger = logging.getLogger(__name__)
 
 
@@ -1320,12 +1326,8 @@ class Key(object):
     def public_uncompressed_hex(self):
         if not self._public_uncompressed_hex:
             # Calculate y from x with y=x^3 + 7 function
-            sign = self.public_hex[:2] == '03'
-            ys = pow(self._x, 3, secp256k1_p) + 7 % secp256k1_p
-            self._y = mod_sqrt(ys)
-            if self._y & 1 != sign:
-                self._y = secp256k1_p - self._y
-            self.y_hex = change_base(self._y, 10, 16, 64)
+            self._x, self._y = public_key_decompress(self.public_compressed_byte)
+            self.y_hex = self._y.to_bytes(32, 'big').hex()
             self._public_uncompressed_hex = '04' + self.x_hex + self.y_hex
         return self._public_uncompressed_hex
 
@@ -2580,38 +2582,8 @@ class Signature(object):
         if not k and not use_rfc6979:
             k = random.SystemRandom().randint(1, secp256k1_n - 1)
 
-        if USE_FASTECDSA:
-            if not k:
-                rfc6979 = RFC6979(message_bytes, secret, secp256k1_n, hashlib.sha256, prehashed=True)
-                k = rfc6979.gen_nonce()
-
-            r, s = _ecdsa.sign(
-                message,
-                str(secret),
-                str(k),
-                str(secp256k1_p),
-                str(secp256k1_a),
-                str(secp256k1_b),
-                str(secp256k1_n),
-                str(secp256k1_Gx),
-                str(secp256k1_Gy)
-            )
-            if int(s) > secp256k1_n / 2 and force_canonical:
-                s = secp256k1_n - int(s)
-            return Signature(r, s, message, secret, public_key=pub_key, k=k, hash_type=hash_type, network=network)
-        else:
-            sk = ecdsa.SigningKey.from_string(private.private_byte, curve=ecdsa.SECP256k1)
-
-            # Call generate_k method directly because sign_digest_deterministic() does not return k
-            if not k:
-                k = ecdsa.rfc6979.generate_k(ecdsa.SECP256k1.generator.order(), private.secret, hashlib.sha256,
-                                             message_bytes)
-            sig_der = sk.sign_digest(message_bytes, hashlib.sha256, ecdsa.util.sigencode_der, k=k)
-
-            r, s = signature_der_decode(sig_der)
-            if s > secp256k1_n / 2 and force_canonical:
-                s = secp256k1_n - s
-            return Signature(r, s, message, secret, public_key=pub_key, k=k, hash_type=hash_type, network=network)
+        r, s, k = _sign_secret(message_bytes, secret, k, force_canonical)
+        return Signature(r, s, message, secret, public_key=pub_key, k=k, hash_type=hash_type, network=network)
 
     def __init__(self, r, s, message=None, secret=None, signature=None, der_signature=None, public_key=None, k=None,
                  hash_type=SIGHASH_ALL, compressed=True, recid=0, witness_type=None, network=None):
@@ -2946,19 +2918,8 @@ class Signature(object):
             raise BKeyError("Please provide message and public_key to verify signature")
 
         if USE_FASTECDSA:
-            return _ecdsa.verify(
-                str(self.r),
-                str(self.s),
-                self.message,
-                str(self.x),  # get x and y from public key
-                str(self.y),
-                str(secp256k1_p),
-                str(secp256k1_a),
-                str(secp256k1_b),
-                str(secp256k1_n),
-                str(secp256k1_Gx),
-                str(secp256k1_Gy)
-            )
+            return _ecdsa.verify(str(self.r), str(self.s), self.message, str(self.x), str(self.y),
+                                 *_SECP256K1_PARAMS_STR)
         else:
             transaction_to_sign = bytes.fromhex(self.message)
             signature = self.bytes()
@@ -3017,6 +2978,109 @@ def sign(message, private, use_rfc6979=True, k=None, hash_type=SIGHASH_ALL, preh
                             force_canonical=force_canonical, network=network)
 
 
+def _sign_secret(message_bytes, secret, k=None, force_canonical=True):
+    """
+    Sign a hashed message with a private key secret. If no k is provided a deterministic k is derived from the
+    message and secret with RFC6979.
+
+    :param message_bytes: Hashed message or transaction hash of 32 bytes
+    :type message_bytes: bytes
+    :param secret: Private key secret
+    :type secret: int
+    :param k: Provide own k value, leave empty to use RFC6979
+    :type k: int
+    :param force_canonical: Calculate signature with canonical s value
+    :type force_canonical: bool
+
+    :return tuple: Signature r, s and k value as integers
+    """
+    if USE_FASTECDSA:
+        if not k:
+            rfc6979 = RFC6979(message_bytes, secret, secp256k1_n, hashlib.sha256, prehashed=True)
+            k = rfc6979.gen_nonce()
+
+        r, s = _ecdsa.sign(message_bytes.hex(), str(secret), str(k), *_SECP256K1_PARAMS_STR)
+        r, s = int(r), int(s)
+    else:
+        sk = ecdsa.SigningKey.from_string(secret.to_bytes(32, 'big'), curve=ecdsa.SECP256k1)
+
+        # Call generate_k method directly because sign_digest_deterministic() does not return k
+        if not k:
+            k = ecdsa.rfc6979.generate_k(ecdsa.SECP256k1.generator.order(), secret, hashlib.sha256, message_bytes)
+        sig_der = sk.sign_digest(message_bytes, hashlib.sha256, ecdsa.util.sigencode_der, k=k)
+        r, s = signature_der_decode(sig_der)
+    if s > secp256k1_n / 2 and force_canonical:
+        s = secp256k1_n - s
+    return r, s, k
+
+
+def _sign_values(values):
+    """
+    Sign a list of (message_bytes, secret) tuples with deterministic RFC6979 k values. Used by :func:`sign_batch`,
+    arguments only contain primitive types so they can be passed to worker processes.
+
+    :param values: List of tuples with hashed message in bytes and private key secret
+    :type values: list of tuple
+
+    :return list of tuple: List of signature r, s and k values
+    """
+    return [_sign_secret(message_bytes, secret) for message_bytes, secret in values]
+
+
+def sign_batch(items, hash_type=SIGHASH_ALL, workers=None, pool_min_size=SIGN_BATCH_POOL_MIN_SIZE,
+               network=DEFAULT_NETWORK):
+    """
+    Sign a list of transaction hashes or messages with the corresponding private keys.
+
+    Signatures use deterministic RFC6979 k values and canonical s values, so the result is the same as calling
+    :func:`sign` for every item. Large batches are split over a pool of worker processes, smaller batches are signed
+    in the current process. When using worker processes on Windows or macOS, make sure the calling code is
+    protected with a if __name__ == '__main__' guard.
+
+    >>> sk = HDKey('728afb86a98a0b60cc81faadaa2c12bc17d5da61b8deaf1c08fc07caf424d493')
+    >>> txid = 'c77545c8084b6178366d4e9a06cf99a28d7b5ff94ba8bd76bbbce66ba8cdef70'
+    >>> signatures = sign_batch([(txid, sk)])
+    >>> signatures[0].as_der_encoded().hex()
+    '3044022039df9d8a0b4df185605c5a46eb087d499ddf98cb5ebcae6e0fd99c56152d2d730220726a3c03ac0b04e1489a1f465cb615be87dde7c4c7806195ca6b1acc2910e06901'
+
+    :param items: List of (message, private_key) tuples. Messages of 32 bytes are regarded as prehashed, other messages are hashed with double_sha256. Private key as HDKey or Key object, or any other format accepted by HDKey object
+    :type items: list of tuple
+    :param hash_type: Specific hash type, default is SIGHASH_ALL
+    :type hash_type: int
+    :param workers: Number of worker processes. Default is None to use the number of CPU's, use 1 to disable worker processes
+    :type workers: int
+    :param pool_min_size: Minimum number of signatures to start worker processes
+    :type pool_min_size: int
+    :param network: Specific network, default is DEFAULT_NETWORK
+    :type network: str, Network
+
+    :return list of Signature:
+    """
+    values = []
+    private_keys = []
+    for message, private in items:
+        message_bytes = to_bytes(message)
+        if len(message_bytes) != 32:
+            message_bytes = double_sha256(message_bytes)
+        if not isinstance(private, (Key, HDKey)):
+            private = HDKey(private)
+        values.append((message_bytes, private.secret))
+        private_keys.append(private)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(values) >= pool_min_size:
+        chunk_size = -(-len(values) // workers)
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [res for chunk_results in executor.map(_sign_values, chunks) for res in chunk_results]
+    else:
+        results = _sign_values(values)
+    return [Signature(r, s, message_bytes.hex(), secret, public_key=private.public(), k=k, hash_type=hash_type,
+                      network=network)
+            for (r, s, k), (message_bytes, secret), private in zip(results, values, private_keys)]
+
+
 def verify(message, signature, public_key=None):
     """
     Verify the provided signature with the message / txid. If provided signature is no Signature object a new object will
@@ -3045,6 +3109,87 @@ def verify(message, signature, public_key=None):
     return signature.verify(message, public_key)
 
 
+def _verify_points(values):
+    """
+    Verify a list of signatures in (r, s, message_hex, x, y) format. Used by :func:`verify_batch`, arguments only
+    contain primitive types so they can be passed to worker processes.
+
+    :param values: List of tuples with signature r and s value, message as hexstring and public key point x and y
+    :type values: list of tuple
+
+    :return list of bool:
+    """
+    results = []
+    for r, s, message, x, y in values:
+        if x is None:
+            results.append(False)
+        elif USE_FASTECDSA:
+            results.append(_ecdsa.verify(str(r), str(s), message, str(x), str(y), *_SECP256K1_PARAMS_STR))
+        else:
+            message_bytes = bytes.fromhex(message)
+            if len(message_bytes) != 32:
+                message_bytes = double_sha256(message_bytes)
+            ver_key = ecdsa.VerifyingKey.from_string(x.to_bytes(32, 'big') + y.to_bytes(32, 'big'),
+                                                     curve=ecdsa.SECP256k1)
+            try:
+                results.append(ver_key.verify_digest(r.to_bytes(32, 'big') + s.to_bytes(32, 'big'), message_bytes))
+            except (ecdsa.keys.BadSignatureError, ecdsa.keys.BadDigestError):
+                results.append(False)
+    return results
+
+
+def verify_batch(items, workers=None, pool_min_size=VERIFY_BATCH_POOL_MIN_SIZE):
+    """
+    Verify a list of signatures with their messages / txids and public keys.
+
+    Signatures, public keys and messages are converted once to plain integers and strings. Large batches are split
+    over a pool of worker processes, smaller batches are verified in the current process. When using worker
+    processes on Windows or macOS, make sure the calling code is protected with a if __name__ == '__main__' guard.
+
+    >>> k = 'b2da575054fb5daba0efde613b0b8e37159b8110e4be50f73cbe6479f6038f5b'
+    >>> pub_key = HDKey(k).public()
+    >>> txid = '0d12fdc4aac9eaaab9730999e0ce84c3bd5bb38dfd1f4c90c613ee177987429c'
+    >>> sig = '48e994862e2cdb372149bad9d9894cf3a5562b4565035943efe0acc502769d351cb88752b5fe8d70d85f3541046df617f8459e991d06a7c0db13b5d4531cd6d4'
+    >>> verify_batch([(txid, sig, pub_key), (txid[::-1], sig, pub_key)])
+    [True, False]
+
+    :param items: List of (message, signature, public_key) tuples. Accepts the same formats as the :func:`verify` method. Public key may be None if the Signature object contains a public key.
+    :type items: list of tuple
+    :param workers: Number of worker processes. Default is None to use the number of CPU's, use 1 to disable worker processes
+    :type workers: int
+    :param pool_min_size: Minimum number of signatures to start worker processes
+    :type pool_min_size: int
+
+    :return list of bool: Verification result for every item in the list
+    """
+    values = []
+    for message, signature, public_key in items:
+        if not isinstance(signature, Signature):
+            if not public_key:
+                raise BKeyError("No public key provided, cannot verify")
+            signature = Signature.parse(signature)
+        if public_key is None:
+            x, y = signature.x, signature.y
+            if x is None:
+                raise BKeyError("No public key provided, cannot verify")
+        else:
+            if not isinstance(public_key, Key):
+                public_key = Key(public_key)
+            x, y = public_key.public_point()
+        if (y * y - pow(x, 3, secp256k1_p) - 7) % secp256k1_p:
+            x = y = None
+        values.append((signature.r, signature.s, to_hexstring(message), x, y))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(values) >= pool_min_size:
+        chunk_size = -(-len(values) // workers)
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return [res for chunk_results in executor.map(_verify_points, chunks) for res in chunk_results]
+    return _verify_points(values)
+
+
 def ec_point(m):
     """
     Method for elliptic curve multiplication on the secp256k1 curve. Multiply Generator point G by m
@@ -3088,6 +3233,117 @@ def ec_point_multiplication(p, m, return_point=False):
         return tup
 
 
+def _ec_point_add_batch(base, points):
+    """
+    Add a list of points to a base point on the secp256k1 curve. Uses affine coordinates and a single modular
+    inversion for the whole batch (Montgomery's trick).
+
+    All points must be different from the base point and its negation.
+
+    :param base: Base point as (x, y) tuple
+    :type base: tuple
+    :param points: List of points as (x, y) tuples
+    :type points: list of tuple
+
+    :return list of tuple: List of base + point sums as (x, y) tuples
+    """
+    bx, by = base
+    partials = []
+    acc = 1
+    for x, _ in points:
+        partials.append(acc)
+        acc = acc * (x - bx) % secp256k1_p
+    inv = pow(acc, -1, secp256k1_p)
+    sums = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, y = points[i]
+        dx_inv = inv * partials[i] % secp256k1_p
+        inv = inv * (x - bx) % secp256k1_p
+        slope = (y - by) * dx_inv % secp256k1_p
+        x3 = (slope * slope - bx - x) % secp256k1_p
+        sums[i] = (x3, (slope * (bx - x3) - by) % secp256k1_p)
+    return sums
+
+
+def key_range(start, count=None, witness_type=DEFAULT_WITNESS_TYPE, compressed=True, network=DEFAULT_NETWORK,
+              batch_size=KEY_RANGE_BATCH_SIZE):
+    """
+    Generator for consecutive private keys start, start + 1, start + 2, ... with their public key and address.
+
+    Only the first public key point is calculated with a scalar multiplication, the following points are derived by
+    adding multiples of the generator point in batches. This is a lot faster than creating a Key object for every
+    private key, so use this method to generate large amounts of keys or addresses, for instance for a vanity
+    address search or test fixtures.
+
+    >>> for secret, public_byte, address in key_range(1, 3, witness_type='legacy'):
+    ...     print(secret, address)
+    1 1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH
+    2 1cMh228HTCiwS8ZsaakH8A8wze1JR5ZsP
+    3 1CUNEBjYrCn2y1SdiUMohaKUi4wpP326Lb
+
+    :param start: First private key secret
+    :type start: int
+    :param count: Number of keys to generate. Leave empty to generate keys until the end of the curve order
+    :type count: int
+    :param witness_type: Witness type of the addresses: legacy, p2sh-segwit or segwit. Default is DEFAULT_WITNESS_TYPE
+    :type witness_type: str
+    :param compressed: Use compressed public keys. Default is True
+    :type compressed: bool
+    :param network: Network name or Network object. Default is DEFAULT_NETWORK
+    :type network: str, Network
+    :param batch_size: Number of keys to calculate per batch
+    :type batch_size: int
+
+    :return tuple: Tuples of private key secret (int), public key (bytes) and address (str)
+    """
+    start = int(start)
+    if not 0 < start < secp256k1_n:
+        raise BKeyError("Start secret must be between 1 and the secp256k1 curve order")
+    if witness_type not in ['legacy', 'p2sh-segwit', 'segwit']:
+        raise BKeyError("Witness type %s not supported for key ranges" % witness_type)
+    if not compressed and witness_type != 'legacy':
+        raise BKeyError("Uncompressed keys are non-standard for segwit/bech32 encoded addresses")
+    if not isinstance(network, Network):
+        network = Network(network)
+    end = secp256k1_n if count is None else min(start + count, secp256k1_n)
+    batch_size = max(int(batch_size), 1)
+
+    # Multiples of the generator point G, 2G, ..., batch_size * G
+    point = ec_point(2)
+    multiples = [(secp256k1_Gx, secp256k1_Gy), (point.x, point.y) if USE_FASTECDSA else (point.x(), point.y())]
+    while len(multiples) < batch_size:
+        multiples += _ec_point_add_batch(multiples[-1], multiples[:1])
+    multiples = multiples[:batch_size]
+    point = ec_point(start)
+    base = (point.x, point.y) if USE_FASTECDSA else (point.x(), point.y())
+    secret = start
+    while secret < end:
+        n = min(batch_size, end - secret)
+        if any(x == base[0] for x, _ in multiples):
+            # Base point is a small multiple of G or its negation, fall back to scalar multiplication
+            points = []
+            for i in range(n + 1):
+                point = ec_point(secret + i) if secret + i < secp256k1_n else None
+                points.append(((point.x, point.y) if USE_FASTECDSA else (point.x(), point.y())) if point else None)
+        else:
+            points = [base] + _ec_point_add_batch(base, multiples)
+        for i, (x, y) in enumerate(points[:n]):
+            if compressed:
+                public_byte = (b'\3' if y & 1 else b'\2') + x.to_bytes(32, 'big')
+            else:
+                public_byte = b'\4' + x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+            public_hash = hash160(public_byte)
+            if witness_type == 'legacy':
+                address = pubkeyhash_to_addr_base58(public_hash, network.prefix_address)
+            elif witness_type == 'segwit':
+                address = pubkeyhash_to_addr_bech32(public_hash, network.prefix_bech32)
+            else:
+                address = pubkeyhash_to_addr_base58(hash160(b'\0\x14' + public_hash), network.prefix_address_p2sh)
+            yield secret + i, public_byte, address
+        secret += n
+        base = points[n] if n < len(points) else None
+
+
 def mod_sqrt(a):
     """
     Compute the square root of 'a' using the secp256k1 'bitcoin' curve
@@ -3106,6 +3362,31 @@ def mod_sqrt(a):
     return pow(a, k + 1, secp256k1_p)
 
 
+@functools.lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+def public_key_decompress(public_compressed_byte):
+    """
+    Calculate the public key point from a compressed public key. The y-coordinate is derived from the x-coordinate
+    with the y^2 = x^3 + 7 curve formula and the sign in the prefix byte.
+
+    The same public keys are used over and over again, for instance wallet keys, multisig cosigners and keys in
+    parsed scripts. Results are therefore stored in a bounded LRU cache, set the cache size with
+    'public_key_cache_size' in config.ini or use 0 to disable the cache.
+
+    >>> public_key_decompress(bytes.fromhex('0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798'))[1]
+    32670510020758816978083085130507043184471273380659243275938904335757337482424
+
+    :param public_compressed_byte: Compressed public key of 33 bytes
+    :type public_compressed_byte: bytes
+
+    :return tuple: Public key point as (x, y) tuple
+    """
+    x = int.from_bytes(public_compressed_byte[1:33], 'big')
+    y = mod_sqrt(pow(x, 3, secp256k1_p) + 7 % secp256k1_p)
+    if y & 1 != (public_compressed_byte[:1] == b'\x03'):
+        y = secp256k1_p - y
+    return x, y
+
+
 def message_magic(message, network=None):
     """
     Add network magic to a message string, so "Hello world!" results in "BITCOIN Signed Message: Hello world!
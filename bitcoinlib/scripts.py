@@ -23,6 +23,7 @@ from bitcoinlib.encoding import *
 from bitcoinlib.main import *
 from bitcoinlib.config.opcodes import *
 from bitcoinlib.keys import Signature, Key
+from bitcoinlib.networks import Network
 
 
 _logger = logging.getLogger(__name__)
@@ -145,6 +146,72 @@ def get_data_type(data):
         return 'other'
 
 
+def script_standard_match(script):
+    """
+    Recognise a standard locking script by its length and the opcodes on fixed positions, without running the
+    general script parser.
+
+    Nearly all transaction outputs are p2pkh, p2sh, p2wpkh, p2wsh or p2tr scripts. These can be identified by a
+    simple byte pattern, which is a lot faster than :func:`Script.parse_bytesio`. Returns None for all other
+    scripts, these should be parsed with the general parser.
+
+    >>> script_type, public_hash, witver = script_standard_match(bytes.fromhex('76a914af8e14a2cecd715c363b3a72b55b59a31e2acac988ac'))
+    >>> script_type, public_hash.hex(), witver
+    ('p2pkh', 'af8e14a2cecd715c363b3a72b55b59a31e2acac9', 0)
+
+    :param script: Raw locking script
+    :type script: bytes
+
+    :return tuple: Tuple with script type, public hash and witness version or None if script is not standard
+    """
+    script_len = len(script)
+    if script_len == 25:
+        if script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+            return 'p2pkh', script[3:23], 0
+    elif script_len == 23:
+        if script[:2] == b'\xa9\x14' and script[22] == 0x87:
+            return 'p2sh', script[2:22], 0
+    elif script_len == 22:
+        if script[:2] == b'\x00\x14':
+            return 'p2wpkh', script[2:], 0
+    elif script_len == 34:
+        if script[:2] == b'\x00\x20':
+            return 'p2wsh', script[2:], 0
+        elif script[:2] == b'\x51\x20':
+            return 'p2tr', script[2:], 1
+    return None
+
+
+def script_standard_address(script, network=DEFAULT_NETWORK):
+    """
+    Get script type, public hash and address of a standard locking script. Uses :func:`script_standard_match` to
+    recognise the script and encodes the address directly from the public hash and network prefixes.
+
+    >>> script_standard_address(bytes.fromhex('0014dc2d3a3b8ab5bbbe5e3d0ce6ec3b3ad7a9be6a2e'))[::2]
+    ('p2wpkh', 'bc1qmskn5wu2kkamuh3apnnwcwe6675mu63wx35z9q')
+
+    :param script: Raw locking script
+    :type script: bytes
+    :param network: Network name or Network object. Used to determine the address prefix
+    :type network: str, Network
+
+    :return tuple: Tuple with script type, public hash and address or None if script is not standard
+    """
+    match = script_standard_match(script)
+    if not match:
+        return None
+    script_type, public_hash, witver = match
+    if not isinstance(network, Network):
+        network = Network(network)
+    if script_type == 'p2pkh':
+        address = pubkeyhash_to_addr_base58(public_hash, network.prefix_address)
+    elif script_type == 'p2sh':
+        address = pubkeyhash_to_addr_base58(public_hash, network.prefix_address_p2sh)
+    else:
+        address = pubkeyhash_to_addr_bech32(public_hash, network.prefix_bech32, witver)
+    return script_type, public_hash, address
+
+
 class Script(object):
 
     def __init__(self, commands=None, message=None, script_types='', is_locking=True, keys=None, signatures=None,
@@ -312,6 +379,15 @@ class Script(object):
 
         :return Script:
         """
+        if is_locking and not _level:
+            standard = script_standard_match(script.getvalue())
+            if standard:
+                script_type, public_hash, _ = standard
+                s = cls(message=message, script_types=[script_type], env_data=env_data, public_hash=public_hash,
+                        hash_type=None)
+                s._raw = script.getvalue()
+                return s
+
         commands = []
         signatures = []
         keys = []
@@ -155,8 +155,8 @@ class AuthServiceProxy(object):
         batch_data = []
         for rpc_call in rpc_calls:
             AuthServiceProxy.__id_count += 1
-            m = rpc_call.pop(0)
-            batch_data.append({"jsonrpc": "2.0", "method": m, "params": rpc_call, "id": AuthServiceProxy.__id_count})
+            batch_data.append({"jsonrpc": "2.0", "method": rpc_call[0], "params": list(rpc_call[1:]),
+                               "id": AuthServiceProxy.__id_count})
 
         postdata = json.dumps(batch_data, default=EncodeDecimal)
         log.debug("--> " + postdata)
@@ -167,6 +167,11 @@ class AuthServiceProxy(object):
                              'Content-type': 'application/json'})
         results = []
         responses = self._get_response()
+        if isinstance(responses, dict):
+            raise JSONRPCException(responses.get('error') or {
+                'code': -343, 'message': 'batch request not supported by server'})
+        # Responses to a batch request may be returned in any order
+        responses = sorted(responses, key=lambda r: r.get('id') or 0)
         for response in responses:
             if response.get('error') is not None:
                 raise JSONRPCException(response['error'])
@@ -18,6 +18,11 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import base64
+import random
+import re
+import threading
+import time
 import requests
 import urllib3
 from urllib.parse import urlencode
@@ -41,6 +46,289 @@ class ClientError(Exception):
         return self.msg
 
 
+class RateLimitError(ClientError):
+    """
+    Raised when a service provider responds that the maximum number of requests is reached
+    """
+    pass
+
+
+class LocalRateLimitError(RateLimitError):
+    """
+    Raised when a request would wait longer than the timeout for the local rate limiter. The request is not sent to
+    the service provider.
+    """
+    pass
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter for requests to a service provider.
+
+    The bucket holds a maximum of 'burst' tokens and is refilled with 'rate' tokens per second. Every request takes
+    one token. If no token is available the request is delayed until it is the caller's turn, so concurrent requests
+    are queued and spread over time instead of failing with a rate limit response.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Create a new rate limiter
+
+        :param rate: Number of requests per second
+        :type rate: float
+        :param burst: Maximum number of requests at once. Default is rate, with a minimum of 1
+        :type burst: int
+        """
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(self.rate))
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<RateLimiter(%s/s, burst %d)>" % (self.rate, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """
+        Number of seconds before next request can be made
+
+        :return float:
+        """
+        with self._lock:
+            self._refill()
+            return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """
+        Take token from bucket, and wait until the token is available if necessary.
+
+        :param timeout: Maximum number of seconds to wait. Raise a LocalRateLimitError if waiting time would be longer
+        :type timeout: float
+
+        :return float: Number of seconds waited
+        """
+        with self._lock:
+            self._refill()
+            wait = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                raise LocalRateLimitError("Rate limit of %s requests per second reached, request would wait %.1f "
+                                          "seconds" % (self.rate, wait))
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self):
+        """
+        Empty bucket, for instance after the provider responded the maximum number of requests is reached
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, rate, burst=None):
+    """
+    Get process wide rate limiter for given provider, create a new one if it does not exist or settings are changed
+
+    :param name: Provider name, key in providers.json
+    :type name: str
+    :param rate: Number of requests per second
+    :type rate: float
+    :param burst: Maximum number of requests at once
+    :type burst: int
+
+    :return RateLimiter:
+    """
+    with _rate_limiters_lock:
+        limiter = rate_limiters.get(name)
+        if limiter is None or limiter.rate != float(rate) or (burst and limiter.burst != burst):
+            limiter = RateLimiter(rate, burst)
+            rate_limiters[name] = limiter
+        return limiter
+
+
+class ServiceRecorder(object):
+    """
+    Record responses of web requests to service providers in a file, and replay them later without network access.
+
+    Use replay mode to run service and wallet code offline and deterministic, for instance for benchmarks. Latency
+    and errors of providers can be simulated. Only requests made with :func:`BaseClient.request` are recorded, so
+    clients for local nodes such as bitcoind and ElectrumX are not supported.
+
+    >>> with ServiceRecorder('responses.json', mode='record'):  # doctest: +SKIP
+    ...     Service(network='testnet').getutxos('tb1q...')
+    >>> with ServiceRecorder('responses.json', latency=0.1, error_rate=0.05):  # doctest: +SKIP
+    ...     Service(network='testnet').getutxos('tb1q...')
+
+    """
+
+    # Request parameters which contain API keys, these are removed from recorded requests
+    SECRET_PARAMETERS = ('token', 'key', 'api_key', 'apikey')
+
+    def __init__(self, filename=None, mode='replay', latency=0, latency_jitter=0, error_rate=0, rate_limit_rate=0,
+                 seed=None):
+        """
+        Create a new recorder. Use as context manager or call :func:`activate` to use it for all requests.
+
+        :param filename: File with recorded responses in JSON format. Leave empty to keep responses in memory
+        :type filename: str, Path
+        :param mode: Use 'record' to send requests and record responses, or 'replay' to return recorded responses
+        :type mode: str
+        :param latency: Simulated response time in seconds in replay mode
+        :type latency: float
+        :param latency_jitter: Random extra response time between 0 and latency_jitter seconds
+        :type latency_jitter: float
+        :param error_rate: Fraction of replayed requests which return a server error
+        :type error_rate: float
+        :param rate_limit_rate: Fraction of replayed requests which return a rate limit response (HTTP 429)
+        :type rate_limit_rate: float
+        :param seed: Seed of random generator for latency jitter and errors, to make runs reproducible
+        :type seed: int
+        """
+        if mode not in ['record', 'replay']:
+            raise ClientError("Unknown mode '%s', use 'record' or 'replay'" % mode)
+        self.filename = filename
+        self.mode = mode
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.responses = {}
+        self.requests = 0
+        self.missing = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if filename and Path(filename).exists():
+            with Path(filename).open() as f:
+                self.responses = json.load(f)
+
+    def __repr__(self):
+        return "<ServiceRecorder(%s, %s, %d responses)>" % (self.filename, self.mode, len(self.responses))
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.deactivate()
+
+    def activate(self):
+        """
+        Use this recorder for all service provider requests
+        """
+        global service_recorder
+        service_recorder = self
+
+    def deactivate(self):
+        """
+        Stop using this recorder and save recorded responses
+        """
+        global service_recorder
+        if service_recorder is self:
+            service_recorder = None
+        if self.mode == 'record':
+            self.save()
+
+    @staticmethod
+    def request_key(method, url, variables=None, post_data=''):
+        """
+        Key to identify a request. Credentials and API keys in the url or variables are removed.
+
+        :return str:
+        """
+        url = re.sub(r'//[^/@]*@', '//', url)
+        secrets = '|'.join(ServiceRecorder.SECRET_PARAMETERS)
+        url = re.sub(r'(?<=[?&])(?:%s)=[^&#]*&?' % secrets, '', url, flags=re.IGNORECASE)
+        url = re.sub(r'[?&]+(?=#|$)', '', url)
+        if variables:
+            variables = {k: v for k, v in variables.items() if k.lower() not in ServiceRecorder.SECRET_PARAMETERS}
+        if isinstance(post_data, bytes):
+            post_data = post_data.hex()
+        key = '%s %s' % (method.upper(), url)
+        if variables:
+            key += ' ' + json.dumps(variables, sort_keys=True)
+        if post_data:
+            key += ' ' + str(post_data)
+        return key
+
+    def add(self, key, status_code, content, encoding='utf-8'):
+        """
+        Add response for request with given key
+
+        :param key: Request key, see :func:`request_key`
+        :type key: str
+        :param status_code: HTTP status code
+        :type status_code: int
+        :param content: Response body
+        :type content: bytes, str, dict, list
+        :param encoding: Encoding of response. Use None for binary responses
+        :type encoding: str
+        """
+        if isinstance(content, (dict, list)):
+            content = json.dumps(content)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        with self._lock:
+            self.responses[key] = {'status': status_code, 'body': base64.b64encode(content).decode(),
+                                   'encoding': encoding}
+
+    def record(self, key, response):
+        self.add(key, response.status_code, response.content, response.encoding)
+
+    def replay(self, key):
+        """
+        Get recorded response for request with given key, with simulated latency and errors
+
+        :return requests.Response:
+        """
+        with self._lock:
+            self.requests += 1
+            recorded = self.responses.get(key)
+            if recorded is None:
+                self.missing += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter) if self.latency_jitter else \
+                self.latency
+            error = self._random.random()
+        if delay:
+            time.sleep(delay)
+        resp = requests.models.Response()
+        resp.encoding = 'utf-8'
+        if error < self.rate_limit_rate:
+            resp.status_code, resp._content = 429, b'Simulated rate limit'
+        elif error < self.rate_limit_rate + self.error_rate:
+            resp.status_code, resp._content = 500, b'Simulated server error'
+        elif recorded is None:
+            raise ClientError("No recorded response for request %s" % key)
+        else:
+            resp.status_code = recorded['status']
+            resp._content = base64.b64decode(recorded['body'])
+            resp.encoding = recorded['encoding']
+        return resp
+
+    def save(self):
+        """
+        Write recorded responses to file
+        """
+        if not self.filename:
+            return
+        with self._lock:
+            with Path(self.filename).open('w') as f:
+                json.dump(self.responses, f, indent=0, sort_keys=True)
+
+
+service_recorder = None
+
+
 class BaseClient(object):
 
     def __init__(self, network, provider, base_url, denominator, api_key='', provider_coin_id='',
@@ -63,6 +351,8 @@ class BaseClient(object):
                 self.network_overrides = network_overrides
             self.strict = strict
             self.wallet_name = wallet_name
+            self.rate_limiter = None
+            self.bytes_received = 0
         except Exception:
             raise ClientError("This Network is not supported by %s Client" % provider)
 
@@ -78,8 +368,11 @@ class BaseClient(object):
         }
         if self.api_key:
             headers["Api-Key"] = self.api_key
+        if self.rate_limiter:
+            self.rate_limiter.acquire(self.timeout)
         if header:
             headers.update(header)
+        recorder = service_recorder
         if method == 'get':
             if variables is None:
                 variables = {}
@@ -88,20 +381,33 @@ class BaseClient(object):
             url += url_vars
             log_url = url if '@' not in url else url.split('@')[1]
             _logger.info("Url get request %s" % log_url)
-            self.resp = requests.get(url, timeout=self.timeout, verify=secure, headers=headers)
+            key = None if not recorder else recorder.request_key(method, url)
+            if recorder and recorder.mode == 'replay':
+                self.resp = recorder.replay(key)
+            else:
+                self.resp = requests.get(url, timeout=self.timeout, verify=secure, headers=headers)
         elif method == 'post':
             log_url = url if '@' not in url else url.split('@')[1]
             _logger.info("Url post request %s" % log_url)
-            self.resp = requests.post(url, json=dict(variables), data=post_data, timeout=self.timeout, verify=secure,
-                                      headers=headers)
+            key = None if not recorder else recorder.request_key(method, url, dict(variables), post_data)
+            if recorder and recorder.mode == 'replay':
+                self.resp = recorder.replay(key)
+            else:
+                self.resp = requests.post(url, json=dict(variables), data=post_data, timeout=self.timeout,
+                                          verify=secure, headers=headers)
+        if recorder and recorder.mode == 'record':
+            recorder.record(key, self.resp)
 
+        self.bytes_received += len(self.resp.content)
         resp_text = self.resp.text
         if len(resp_text) > 1000:
             resp_text = self.resp.text[:970] + '... truncated, length %d' % len(resp_text)
         _logger.debug("Response [%d] %s" % (self.resp.status_code, resp_text))
         log_url = url if '@' not in url else url.split('@')[1]
         if self.resp.status_code == 429:
-            raise ClientError("Maximum number of requests reached for %s with url %s, response [%d] %s" %
+            if self.rate_limiter:
+                self.rate_limiter.penalize()
+            raise RateLimitError("Maximum number of requests reached for %s with url %s, response [%d] %s" %
                               (self.provider, log_url, self.resp.status_code, resp_text))
         elif not(self.resp.status_code == 200 or self.resp.status_code == 201):
             raise ClientError("Error connecting to %s on url %s, response [%d] %s" %
@@ -113,6 +419,12 @@ class BaseClient(object):
         except ValueError or json.decoder.JSONDecodeError:
             return self.resp.text
 
+    def close(self):
+        """
+        Release resources used by this client, called by the Service object after every request.
+        """
+        pass
+
     def _address_convert(self, address):
         if not isinstance(address, Address):
             return Address.parse(address, network_overrides=self.network_overrides, network=self.network.name)
@@ -140,8 +140,49 @@ class BitcoindClient(BaseClient):
             base_url = base_url.replace("{wallet_name}", wallet_name)
         _logger.info("Connect to bitcoind")
         self.proxy = AuthServiceProxy(base_url)
+        self.batch_size = BITCOIND_RPC_BATCH_SIZE
         super(self.__class__, self).__init__(network, PROVIDERNAME, base_url, denominator, *args)
 
+    def _batch(self, calls):
+        """
+        Execute a list of RPC calls in batched JSON-RPC requests with a maximum of batch_size calls per request
+
+        :param calls: List of calls in format [method, param1, param2, ...]
+        :type calls: list of list
+
+        :return list: Results in the same order as the calls
+        """
+        results = []
+        for i in range(0, len(calls), self.batch_size):
+            results += self.proxy.batch_(calls[i:i + self.batch_size])
+        return results
+
+    def _output_values(self, tx):
+        return [round(float(o['value']) / self.network.denominator) for o in tx['vout']]
+
+    def _set_input_values(self, txs, prev_values=None):
+        """
+        Set values of transaction inputs. Previous transactions are retrieved with batched getrawtransaction calls.
+
+        :param txs: List of transactions
+        :type txs: list of Transaction
+        :param prev_values: Dictionary with known output values per transaction ID, for instance of other transactions in the same block
+        :type prev_values: dict
+        """
+        prev_values = {} if prev_values is None else prev_values
+        txids = []
+        for t in txs:
+            for i in t.inputs:
+                txid = i.prev_txid.hex()
+                if i.prev_txid != b'\x00' * 32 and txid not in prev_values and txid not in txids:
+                    txids.append(txid)
+        for txi in self._batch([['getrawtransaction', txid, 1] for txid in txids]):
+            prev_values[txi['txid']] = self._output_values(txi)
+        for t in txs:
+            for i in t.inputs:
+                if i.prev_txid != b'\x00' * 32:
+                    i.value = prev_values[i.prev_txid.hex()][i.output_n_int]
+
     def getbalance(self, addresslist):
         balance = 0
         for address in addresslist:
@@ -192,17 +233,8 @@ class BitcoindClient(BaseClient):
             if i.prev_txid == b'\x00' * 32:
                 i.script_type = 'coinbase'
                 continue
-            if get_input_values:
-                txi = self.proxy.getrawtransaction(i.prev_txid.hex(), 1)
-                i.value = round(float(txi['vout'][i.output_n_int]['value']) / self.network.denominator)
-        # This doesn't seem to save any time:
-        # if get_input_values:
-        #     batchreq = []
-        #     for i in t.inputs:
-        #         batchreq.append(['getrawtransaction', i.prev_txid.hex(), 1])
-        #     res = self.proxy.batch_(batchreq)
-        #     for n, txi in enumerate(res):
-        #         t.inputs[n].value = round(float(txi['vout'][t.inputs[n].output_n_int]['value']) / self.network.denominator)
+        if get_input_values:
+            self._set_input_values([t])
         for o in t.outputs:
             o.spent = None
 
@@ -238,18 +270,24 @@ class BitcoindClient(BaseClient):
             raise ClientError("Bitcoind wallet contains too many transactions %d, use other service provider for this "
                               "wallet" % MAX_WALLET_TRANSACTIONS)
         txids = list(set([(tx['txid'], tx.get('blockheight')) for tx in txs_list if tx['address'] == address]))
-        for (txid, blockheight) in txids:
-            tx_raw = self.proxy.getrawtransaction(txid, 1)
-            t = self._parse_transaction(tx_raw, blockheight)
+        txs_raw = self._batch([['getrawtransaction', txid, 1] for (txid, _) in txids])
+        for (txid, blockheight), tx_raw in zip(txids, txs_raw):
+            t = self._parse_transaction(tx_raw, blockheight, get_input_values=False)
             txs.append(t)
             if txid == after_txid:
                 txs = []
+        self._set_input_values(txs)
+        for t in txs:
+            t.update_totals()
         return txs
 
     def getrawtransaction(self, txid):
         res = self.proxy.getrawtransaction(txid)
         return res
 
+    def getrawtransactions(self, txids):
+        return self._batch([['getrawtransaction', txid] for txid in txids])
+
     def sendrawtransaction(self, rawtx):
         res = self.proxy.sendrawtransaction(rawtx)
         return {
@@ -294,7 +332,10 @@ class BitcoindClient(BaseClient):
             for tx in bd['tx'][(page - 1) * limit:page * limit]:
                 tx['time'] = bd['time']
                 tx['blockhash'] = bd['hash']
-                txs.append(self._parse_transaction(tx, block_height=bd['height'], get_input_values=True))
+                txs.append(self._parse_transaction(tx, block_height=bd['height'], get_input_values=False))
+            self._set_input_values(txs, {tx['txid']: self._output_values(tx) for tx in bd['tx']})
+            for t in txs:
+                t.update_totals()
         else:
             bd = self.proxy.getblock(blockid, 1)
             txs = bd['tx']
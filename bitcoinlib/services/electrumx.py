@@ -18,85 +18,276 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import json
 import logging
-from datetime import datetime, timezone
 import socket
-import sys
-try:
-    import aiorpcx
-except ImportError:
-    pass
-import asyncio
-from bitcoinlib.main import MAX_TRANSACTIONS
+import ssl
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from bitcoinlib.main import MAX_TRANSACTIONS, TIMEOUT_REQUESTS
 from bitcoinlib.services.baseclient import BaseClient, ClientError
 from bitcoinlib.transactions import Transaction
 from bitcoinlib.keys import Address, sha256
 from bitcoinlib.scripts import Script
 
 PROVIDERNAME = 'electrumx'
+ELECTRUM_PROTOCOL_VERSION = '1.4'
 
 
 _logger = logging.getLogger(__name__)
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+class ElectrumxConnection(object):
+    """
+    Persistent connection to an Electrum protocol server.
+
+    Requests are sent over one TCP or TLS connection and matched to responses by their JSON-RPC id by a background
+    reader thread, so multiple requests from multiple threads can be pipelined. Use :func:`batch` to send a list of
+    requests as one JSON-RPC batch request.
+
+    Notifications for subscriptions are passed to the handlers added with :func:`add_notification_handler`.
+    """
+
+    def __init__(self, host, port, use_tls=False, timeout=TIMEOUT_REQUESTS, verify_tls=True):
+        """
+        Open connection to Electrum server and negotiate protocol version
+
+        :param host: Hostname or IP address of server
+        :type host: str
+        :param port: Port number
+        :type port: int
+        :param use_tls: Use TLS encrypted connection
+        :type use_tls: bool
+        :param timeout: Timeout in seconds for connecting and waiting for responses
+        :type timeout: int
+        :param verify_tls: Verify certificate and hostname of the server. Only disable this for servers with a \
+        self-signed certificate you trust, the connection is not protected against man-in-the-middle attacks.
+        :type verify_tls: bool
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.closed = False
+        self._id = 0
+        self._pending = {}
+        self._notification_handlers = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        try:
+            sock = socket.create_connection((host, port), timeout=timeout)
+            if use_tls:
+                context = ssl.create_default_context()
+                if not verify_tls:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                sock = context.wrap_socket(sock, server_hostname=host)
+        except (OSError, ssl.SSLError) as e:
+            raise ClientError('ElectrumX server %s unavailable at port %s: %s' % (host, port, e))
+        sock.settimeout(None)
+        self.sock = sock
+        self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+        self._reader_thread.start()
+        self.server_version = self.request('server.version', ['bitcoinlib', ELECTRUM_PROTOCOL_VERSION])
+
+    def __repr__(self):
+        return "<ElectrumxConnection(%s:%s%s)>" % (self.host, self.port, ', closed' if self.closed else '')
+
+    def _reader(self):
+        buffer = bytearray()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                pos = len(buffer)
+                buffer += data
+                start = 0
+                end = buffer.find(b'\n', pos)
+                while end >= 0:
+                    if end > start:
+                        self._dispatch(json.loads(buffer[start:end]))
+                    start = end + 1
+                    end = buffer.find(b'\n', start)
+                del buffer[:start]
+        except Exception as e:
+            _logger.info("Connection to ElectrumX server %s closed: %s" % (self.host, e))
+        # Mark connection as closed and fail pending requests, so a new connection is opened on the next request
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self._close('Connection to ElectrumX server %s closed' % self.host)
+
+    def _dispatch(self, message):
+        if isinstance(message, list):
+            for m in message:
+                self._dispatch(m)
+            return
+        if message.get('id') is None:
+            _logger.debug("ElectrumX notification %s: %s" % (message.get('method'), message.get('params')))
+            for handler in list(self._notification_handlers.get(message.get('method'), [])):
+                try:
+                    handler(message.get('params'))
+                except Exception as e:
+                    _logger.warning("Error in handler for ElectrumX notification %s: %s" %
+                                    (message.get('method'), e))
+            return
+        with self._lock:
+            future = self._pending.pop(message['id'], None)
+        if future is None:
+            return
+        if message.get('error') is not None:
+            future.set_exception(ClientError("Electrumx error: %s" % message['error']))
+        else:
+            future.set_result(message.get('result'))
+
+    def _close(self, error):
+        with self._lock:
+            self.closed = True
+            pending = list(self._pending.values())
+            self._pending = {}
+        for future in pending:
+            future.set_exception(ClientError(error))
+
+    def batch(self, calls, return_exceptions=False):
+        """
+        Send list of requests in one JSON-RPC batch request and wait for all responses
+
+        :param calls: List of (method, parameters) tuples
+        :type calls: list of tuple
+        :param return_exceptions: Return ClientError objects for failed requests instead of raising the first error
+        :type return_exceptions: bool
+
+        :return list: Results in the same order as the calls
+        """
+        if not calls:
+            return []
+        requests = []
+        futures = []
+        with self._lock:
+            if self.closed:
+                raise ClientError('Connection to ElectrumX server %s closed' % self.host)
+            for method, parameters in calls:
+                self._id += 1
+                future = Future()
+                self._pending[self._id] = future
+                futures.append(future)
+                requests.append({'jsonrpc': '2.0', 'method': method, 'params': parameters or [], 'id': self._id})
+        data = json.dumps(requests if len(requests) > 1 else requests[0]) + '\n'
+        try:
+            with self._send_lock:
+                self.sock.sendall(data.encode('utf-8'))
+        except OSError as e:
+            self._close('Could not send request to ElectrumX server %s: %s' % (self.host, e))
+        results = []
+        deadline = time.monotonic() + self.timeout
+        for request, future in zip(requests, futures):
+            try:
+                results.append(future.result(max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                with self._lock:
+                    self._pending.pop(request['id'], None)
+                error = ClientError('Timeout waiting for response of ElectrumX server %s' % self.host)
+                if not return_exceptions:
+                    raise error
+                results.append(error)
+            except ClientError as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def request(self, method, parameters=None):
+        """
+        Send request to server and wait for the response
+
+        :param method: Electrum protocol method
+        :type method: str
+        :param parameters: List of parameters
+        :type parameters: list
+
+        :return: Result of request
+        """
+        return self.batch([(method, parameters)])[0]
+
+    def add_notification_handler(self, method, handler):
+        """
+        Add function which is called with the parameters of every notification for the specified method, for
+        instance 'blockchain.headers.subscribe'. Handlers are called from the reader thread, so they should not wait
+        for responses of requests on this connection.
+
+        :param method: Electrum protocol subscription method
+        :type method: str
+        :param handler: Function with notification parameters as argument
+        :type handler: callable
+        """
+        with self._lock:
+            self._notification_handlers.setdefault(method, []).append(handler)
+
+    def remove_notification_handler(self, method, handler):
+        with self._lock:
+            if handler in self._notification_handlers.get(method, []):
+                self._notification_handlers[method].remove(handler)
+
+    def close(self):
+        """
+        Close connection to server
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._close('Connection to ElectrumX server %s closed' % self.host)
+
+
+def electrumx_connection(host, port, use_tls=False, timeout=TIMEOUT_REQUESTS, verify_tls=True):
+    """
+    Get open connection to Electrum server from connection pool, or create a new one if not available
+
+    :return ElectrumxConnection:
+    """
+    key = (host, int(port), use_tls, verify_tls)
+    with _connections_lock:
+        conn = _connections.get(key)
+        if conn is None or conn.closed:
+            conn = ElectrumxConnection(host, int(port), use_tls, timeout, verify_tls)
+            _connections[key] = conn
+    return conn
 
 
 class ElectrumxClient(BaseClient):
 
     def __init__(self, network, base_url, denominator, api_key, *args):
-        self.aiorpcx_installed = True
-        if 'aiorpcx' not in sys.modules:
-            self.aiorpcx_installed = False
-            _logger.warning('Aiorpcx library not installed, using sockets directly now. Please install aiorpcx library '
-                            'when using ElectumX client for faster and more reliable results')
         super(self.__class__, self).__init__(network, PROVIDERNAME, base_url, denominator, api_key, *args)
 
-    def compose_request(self, method, parameters=None):
+    def _connection_args(self):
+        url = self.base_url
+        use_tls = False
+        verify_tls = True
+        if '://' in url:
+            scheme, url = url.split('://', 1)
+            use_tls = scheme in ['ssl', 'tls', 'ssl-noverify', 'tls-noverify']
+            verify_tls = not scheme.endswith('-noverify')
         try:
-            host, port = self.base_url.split(':')
+            host, port = url.rstrip('/').rsplit(':', 1)
+            port = int(port)
         except ValueError:
             raise ClientError('Please specify ElectrumX uri in format host:port')
-        parameters = parameters or []
-        if self.aiorpcx_installed:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(0.5)
-            if sock.connect_ex((host, int(port))) != 0:
-                raise ClientError('ElectrumX server %s unavailable at port %s' % (host, port))
-            sock.close()
-
-            async def main(host, port, method, parameters):
-                async with aiorpcx.connect_rs(host, port, framer=aiorpcx.NewlineFramer(5000000)) as session:
-                    session.sent_request_timeout = self.timeout
-                    return await session.send_request(method, parameters)
-
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(main(host, port, method, parameters))
-        else:
-            content = {
-                "method": method,
-                "params": parameters if parameters else [],
-                "id": 0
-            }
-
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            sock.connect((host, int(port)))
-            import json
-            from time import sleep
-            sock.sendall(json.dumps(content).encode('utf-8')+b'\n')
-            sleep(0.5)
-            sock.shutdown(socket.SHUT_WR)
-            res = ""
-            while True:
-                data = sock.recv(1024)
-                if not data:
-                    break
-                res += data.decode()
-            sock.close()
+        return host, port, use_tls, self.timeout or TIMEOUT_REQUESTS, verify_tls
+
+    def _connection(self):
+        return electrumx_connection(*self._connection_args())
 
-            parsed_resp = json.loads(res)
-            if 'result' in parsed_resp:
-                return parsed_resp['result']
-            else:
-                raise ClientError("Electrumx error: %s" % parsed_resp['error'])
+    def compose_request(self, method, parameters=None):
+        return self._connection().request(method, parameters)
+
+    def compose_batch(self, calls, return_exceptions=False):
+        return self._connection().batch(calls, return_exceptions)
 
     def _get_scripthash(self, address):
         address_obj = Address.parse(address)
@@ -105,9 +296,8 @@ class ElectrumxClient(BaseClient):
 
     def getbalance(self, addresslist):
         balance = 0
-        for address in addresslist:
-            scripthash = self._get_scripthash(address)
-            res = self.compose_request('blockchain.scripthash.get_balance', [scripthash])
+        for res in self.compose_batch([('blockchain.scripthash.get_balance', [self._get_scripthash(address)])
+                                       for address in addresslist]):
             balance += res['confirmed'] + res['unconfirmed']
         return balance
 
@@ -148,7 +338,7 @@ class ElectrumxClient(BaseClient):
             block_height = self.latest_block - confirmations + 1
         tx_date = None if not tx.get('blocktime') else datetime.fromtimestamp(tx['blocktime'], timezone.utc)
 
-        rawtx = self.compose_request('blockchain.transaction.get', [tx['txid'], False])
+        rawtx = tx.get('hex') or self.compose_request('blockchain.transaction.get', [tx['txid'], False])
         t = Transaction.parse_hex(rawtx, strict=self.strict, network=self.network)
         t.confirmations = confirmations
         t.status = status
@@ -158,21 +348,30 @@ class ElectrumxClient(BaseClient):
         t.size = tx['size']
         t.vsize = tx['vsize']
         t.network = self.network
-        for n, i in enumerate(t.inputs):
-            if not t.coinbase and not i.value and get_input_values:
-                # This does not work with very large transactions, increase MAX_SEND in electrumx config
-                try:
-                    ptx = self.compose_request('blockchain.transaction.get', [i.prev_txid.hex(), True])
-                    i.value = round([x['value'] for x in ptx['vout'] if x['n'] == i.output_n_int][0]
-                                / self.network.denominator)
-                except:
-                    pass
-            t.input_total += i.value
+        if not t.coinbase and get_input_values:
+            self._set_input_values([t])
         for o in t.outputs:
             o.spent = None
         t.update_totals()
         return t
 
+    def _set_input_values(self, txs):
+        prev_txids = []
+        for t in txs:
+            prev_txids += [i.prev_txid.hex() for i in t.inputs if not t.coinbase and not i.value]
+        prev_txids = list(dict.fromkeys(prev_txids))
+        # Requests for very large transactions can fail, increase MAX_SEND in electrumx config
+        prev_txs = dict(zip(prev_txids, self.compose_batch(
+            [('blockchain.transaction.get', [txid, True]) for txid in prev_txids], return_exceptions=True)))
+        for t in txs:
+            for i in t.inputs:
+                ptx = prev_txs.get(i.prev_txid.hex())
+                if t.coinbase or i.value or not isinstance(ptx, dict):
+                    continue
+                values = [x['value'] for x in ptx['vout'] if x['n'] == i.output_n_int]
+                if values:
+                    i.value = round(values[0] / self.network.denominator)
+
     def gettransaction(self, txid, block_count=None):
         tx = self.compose_request('blockchain.transaction.get', [txid, True])
         return self._parse_transaction(tx, block_count)
@@ -187,14 +386,19 @@ class ElectrumxClient(BaseClient):
                 txids_after = []
 
         txs = []
-        for txid in txids_after[:limit]:
-            txs.append(self.gettransaction(txid))
-
+        for tx in self.compose_batch([('blockchain.transaction.get', [txid, True]) for txid in txids_after[:limit]]):
+            txs.append(self._parse_transaction(tx, get_input_values=False))
+        self._set_input_values(txs)
+        for t in txs:
+            t.update_totals()
         return txs
 
     def getrawtransaction(self, txid):
         return self.compose_request('blockchain.transaction.get', [txid, False])
 
+    def getrawtransactions(self, txids):
+        return self.compose_batch([('blockchain.transaction.get', [txid, False]) for txid in txids])
+
     def sendrawtransaction(self, rawtx):
         txid = self.compose_request('blockchain.transaction.broadcast', [rawtx])
         return {
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+#
+#    BitcoinLib - Python Cryptocurrency Library
+#    Client for local address index created from parsed blocks
+#    © 2026 - 1200 Web Development <http://1200wd.com/>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+from sqlalchemy import bindparam, or_, and_
+from bitcoinlib.main import *
+from bitcoinlib.db_index import DbIndex, DbIndexBlock, DbIndexTransaction, DbIndexOutput, DbIndexHistory
+from bitcoinlib.services.baseclient import BaseClient, ClientError
+from bitcoinlib.transactions import Transaction, Output
+from bitcoinlib.networks import Network
+
+
+PROVIDERNAME = 'localindex'
+
+_logger = logging.getLogger(__name__)
+
+
+def scripthash(script):
+    """
+    Hash of a locking script as used in the local index
+
+    :param script: Locking script
+    :type script: bytes
+
+    :return bytes:
+    """
+    return hashlib.sha256(script).digest()
+
+
+class BlockIndexer(object):
+    """
+    Create a local index of transactions per locking script from parsed blocks.
+
+    Blocks must be added in order of height, for instance from a :class:`bitcoinlib.blocks.BlockFileReader` or
+    from a Service provider. The index stores all transactions, outputs and the history of every locking script, and
+    can be used by the :class:`LocalIndexClient` service provider to retrieve transactions and utxo's of addresses
+    without using third party service providers.
+
+    >>> from bitcoinlib.blocks import BlockFileReader
+    >>> indexer = BlockIndexer('bitcoinlib_index.sqlite')  # doctest: +SKIP
+    >>> indexer.add_blocks(BlockFileReader('~/.bitcoin/blocks').blocks_by_height())  # doctest: +SKIP
+
+    """
+
+    def __init__(self, db_uri=None, network=DEFAULT_NETWORK, commit_blocks=100):
+        """
+        Open or create a local index database
+
+        :param db_uri: Database URI. Default is bitcoinlib_index_<network>.sqlite in the database directory
+        :type db_uri: str
+        :param network: Network, leave empty for default network
+        :type network: str, Network
+        :param commit_blocks: Number of blocks to add before committing to the database
+        :type commit_blocks: int
+        """
+        self.network = network
+        if not isinstance(network, Network):
+            self.network = Network(network)
+        if not db_uri:
+            db_uri = str(Path(BCL_DATABASE_DIR, 'bitcoinlib_index_%s.sqlite' % self.network.name))
+        self.db = DbIndex(db_uri)
+        self.session = self.db.session
+        self.commit_blocks = commit_blocks
+        self._uncommitted = 0
+
+    def __repr__(self):
+        return "<BlockIndexer(%s, height %s)>" % (self.db.db_uri, self.height())
+
+    def height(self):
+        """
+        Height of last indexed block, or None if index is empty
+
+        :return int:
+        """
+        return self.session.query(DbIndexBlock.height).order_by(DbIndexBlock.height.desc()).limit(1).scalar()
+
+    def add_block(self, block, height=None):
+        """
+        Add block to index. All transactions of the block are parsed and stored with bulk inserts.
+
+        :param block: Block object with transaction data
+        :type block: Block
+        :param height: Height of block. Default is height of block object or next height in index
+        :type height: int
+
+        :return int: Height of added block
+        """
+        if len(block.transactions) < block.tx_count:
+            block.parse_transactions()
+        last_height = self.height()
+        if height is None:
+            height = block.height if block.height is not None else (0 if last_height is None else last_height + 1)
+        if last_height is not None and height != last_height + 1:
+            raise ClientError("Block height %d does not follow last indexed block %d" % (height, last_height))
+
+        transactions = []
+        outputs = []
+        history = []
+        spends = []
+        for index, t in enumerate(block.transactions):
+            txid = bytes.fromhex(t.txid)
+            transactions.append({'txid': txid, 'height': height, 'index': index, 'raw': t.rawtx or t.raw()})
+            for o in t.outputs:
+                sh = scripthash(o.lock_script)
+                outputs.append({'txid': txid, 'output_n': o.output_n, 'scripthash': sh, 'value': o.value,
+                                'script': o.lock_script, 'height': height})
+                history.append({'scripthash': sh, 'height': height, 'index': index, 'txid': txid,
+                                'n': o.output_n, 'is_input': False})
+            if not t.coinbase:
+                for inp in t.inputs:
+                    spends.append((inp.prev_txid, inp.output_n_int, txid, inp.index_n, index))
+
+        self.session.add(DbIndexBlock(height=height, block_hash=block.block_hash, time=block.time,
+                                      tx_count=len(block.transactions)))
+        if transactions:
+            # Before BIP30 coinbase transactions could duplicate an earlier transaction, the unspent outputs of the
+            # earlier transaction are overwritten and can not be spent anymore
+            coinbase_txid = transactions[0]['txid']
+            self.session.query(DbIndexOutput).\
+                filter(DbIndexOutput.txid == coinbase_txid, DbIndexOutput.spending_txid.is_(None)).\
+                update({DbIndexOutput.spending_txid: coinbase_txid}, synchronize_session=False)
+            self.session.execute(DbIndexTransaction.__table__.insert(), transactions)
+        if outputs:
+            self.session.execute(DbIndexOutput.__table__.insert(), outputs)
+        if spends:
+            # Lookup locking scripts of spent outputs, including outputs created in this block
+            prev_txids = list(set([s[0] for s in spends]))
+            spent_scripthashes = {}
+            for i in range(0, len(prev_txids), 500):
+                for prev_txid, output_n, sh in self.session.query(
+                        DbIndexOutput.txid, DbIndexOutput.output_n, DbIndexOutput.scripthash).\
+                        filter(DbIndexOutput.txid.in_(prev_txids[i:i + 500]),
+                               DbIndexOutput.spending_txid.is_(None)):
+                    spent_scripthashes[(prev_txid, output_n)] = sh
+            updates = []
+            for prev_txid, output_n, txid, input_n, index in spends:
+                sh = spent_scripthashes.get((prev_txid, output_n))
+                if sh is None:
+                    _logger.info("Output %s:%d not found in index" % (prev_txid.hex(), output_n))
+                    continue
+                updates.append({'b_txid': prev_txid, 'b_output_n': output_n, 'spending_txid': txid,
+                                'spending_input_n': input_n})
+                history.append({'scripthash': sh, 'height': height, 'index': index, 'txid': txid,
+                                'n': input_n, 'is_input': True})
+            if updates:
+                table = DbIndexOutput.__table__
+                self.session.execute(
+                    table.update().where(and_(table.c.txid == bindparam('b_txid'),
+                                              table.c.output_n == bindparam('b_output_n'),
+                                              table.c.spending_txid.is_(None))).
+                    values(spending_txid=bindparam('spending_txid'), spending_input_n=bindparam('spending_input_n')),
+                    updates)
+        if history:
+            self.session.execute(DbIndexHistory.__table__.insert(), history)
+
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_blocks:
+            self.commit()
+        return height
+
+    def add_blocks(self, blocks):
+        """
+        Add a list or iterator of blocks to the index.
+
+        :param blocks: Block objects, sorted by height
+        :type blocks: list of Block, iterator
+
+        :return int: Number of added blocks
+        """
+        n = 0
+        for block in blocks:
+            self.add_block(block)
+            n += 1
+        self.commit()
+        return n
+
+    def remove_blocks(self, height):
+        """
+        Remove blocks from given height from the index, for instance after a blockchain reorganisation.
+
+        :param height: First block height to remove
+        :type height: int
+
+        :return int: Number of removed blocks
+        """
+        txids = self.session.query(DbIndexTransaction.txid).filter(DbIndexTransaction.height >= height)
+        self.session.query(DbIndexOutput).filter(DbIndexOutput.spending_txid.in_(txids)).\
+            update({DbIndexOutput.spending_txid: None, DbIndexOutput.spending_input_n: None},
+                   synchronize_session=False)
+        self.session.query(DbIndexOutput).filter(DbIndexOutput.height >= height).delete(synchronize_session=False)
+        self.session.query(DbIndexHistory).filter(DbIndexHistory.height >= height).delete(synchronize_session=False)
+        self.session.query(DbIndexTransaction).filter(DbIndexTransaction.height >= height).\
+            delete(synchronize_session=False)
+        n = self.session.query(DbIndexBlock).filter(DbIndexBlock.height >= height).delete(synchronize_session=False)
+        self.commit()
+        return n
+
+    def commit(self):
+        """
+        Commit added blocks to the database
+        """
+        self.session.commit()
+        self._uncommitted = 0
+
+
+class LocalIndexClient(BaseClient):
+    """
+    Service provider which uses a local index database created with the :class:`BlockIndexer`.
+
+    Specify the index database URI as url in the provider definitions file.
+    """
+
+    def __init__(self, network, base_url, denominator, *args):
+        if not base_url:
+            raise ClientError("Please provide database URI of local index")
+        db_uri = base_url if '://' in base_url else str(Path(BCL_DATABASE_DIR, base_url))
+        if '://' not in base_url and not Path(db_uri).exists():
+            raise ClientError("Local index database %s not found" % db_uri)
+        self.session = DbIndex(db_uri).session
+        super(self.__class__, self).__init__(network, PROVIDERNAME, base_url, denominator, *args)
+
+    def close(self):
+        self.session.close()
+
+    def _transaction(self, txid):
+        # Latest transaction with this transaction ID, ID's of some old coinbase transactions are not unique
+        return self.session.query(DbIndexTransaction).filter_by(txid=bytes.fromhex(txid)).\
+            order_by(DbIndexTransaction.height.desc()).first()
+
+    def _scripthashes(self, addresslist):
+        return [scripthash(Output(0, address=a, network=self.network).lock_script) for a in addresslist]
+
+    def getbalance(self, addresslist):
+        balance = 0
+        for value, in self.session.query(DbIndexOutput.value).\
+                filter(DbIndexOutput.scripthash.in_(self._scripthashes(addresslist)),
+                       DbIndexOutput.spending_txid.is_(None)):
+            balance += value
+        return balance
+
+    def getutxos(self, address, after_txid='', limit=MAX_TRANSACTIONS):
+        blockcount = self.blockcount()
+        qr = self.session.query(DbIndexOutput, DbIndexTransaction.index).\
+            join(DbIndexTransaction, and_(DbIndexTransaction.txid == DbIndexOutput.txid,
+                                          DbIndexTransaction.height == DbIndexOutput.height)).\
+            filter(DbIndexOutput.scripthash == self._scripthashes([address])[0],
+                   DbIndexOutput.spending_txid.is_(None)).\
+            order_by(DbIndexOutput.height, DbIndexTransaction.index, DbIndexOutput.output_n)
+        if after_txid:
+            after_tx = self._transaction(after_txid)
+            if after_tx:
+                qr = qr.filter(or_(DbIndexOutput.height > after_tx.height,
+                                   and_(DbIndexOutput.height == after_tx.height,
+                                        DbIndexTransaction.index > after_tx.index)))
+        utxos = []
+        for o, _ in qr.limit(limit):
+            utxos.append({
+                'address': address,
+                'txid': o.txid.hex(),
+                'confirmations': blockcount - o.height + 1,
+                'output_n': o.output_n,
+                'input_n': 0,
+                'block_height': o.height,
+                'fee': None,
+                'size': 0,
+                'value': o.value,
+                'script': o.script.hex(),
+                'date': None,
+            })
+        return utxos
+
+    def _parse_transaction(self, tx, blockcount=None):
+        t = Transaction.parse_bytes(tx.raw, strict=self.strict, network=self.network)
+        blockcount = self.blockcount() if blockcount is None else blockcount
+        block = self.session.query(DbIndexBlock).filter_by(height=tx.height).scalar()
+        t.block_height = tx.height
+        t.confirmations = blockcount - tx.height + 1
+        t.date = None if not block else datetime.fromtimestamp(block.time, timezone.utc)
+        t.status = 'confirmed'
+        t.verified = True
+        t.index = tx.index
+        if not t.coinbase:
+            prev_txids = list(set([i.prev_txid for i in t.inputs]))
+            prev_outputs = {(o.txid, o.output_n): o for o in
+                            self.session.query(DbIndexOutput).filter(DbIndexOutput.txid.in_(prev_txids),
+                                                                     DbIndexOutput.height <= tx.height)}
+            for i in t.inputs:
+                prev_output = prev_outputs.get((i.prev_txid, i.output_n_int))
+                if prev_output:
+                    i.value = prev_output.value
+        else:
+            t.inputs[0].script_type = 'coinbase'
+        outputs = {o.output_n: o for o in
+                   self.session.query(DbIndexOutput).filter_by(txid=tx.txid, height=tx.height)}
+        for o in t.outputs:
+            db_output = outputs.get(o.output_n)
+            o.spent = bool(db_output and db_output.spending_txid)
+            if o.spent:
+                o.spending_txid = db_output.spending_txid.hex()
+                o.spending_index_n = db_output.spending_input_n
+        t.update_totals()
+        return t
+
+    def gettransaction(self, txid):
+        tx = self._transaction(txid)
+        if not tx:
+            raise ClientError("Transaction %s not found in local index" % txid)
+        return self._parse_transaction(tx)
+
+    def gettransactions(self, address, after_txid='', limit=MAX_TRANSACTIONS):
+        qr = self.session.query(DbIndexHistory.txid, DbIndexHistory.height, DbIndexHistory.index).\
+            filter(DbIndexHistory.scripthash == self._scripthashes([address])[0]).\
+            distinct().order_by(DbIndexHistory.height, DbIndexHistory.index)
+        if after_txid:
+            after_tx = self._transaction(after_txid)
+            if after_tx:
+                qr = qr.filter(or_(DbIndexHistory.height > after_tx.height,
+                                   and_(DbIndexHistory.height == after_tx.height,
+                                        DbIndexHistory.index > after_tx.index)))
+        blockcount = self.blockcount()
+        txs = []
+        for txid, height, _ in qr.limit(limit):
+            tx = self.session.query(DbIndexTransaction).filter_by(txid=txid, height=height).first()
+            txs.append(self._parse_transaction(tx, blockcount))
+        return txs
+
+    def getrawtransaction(self, txid):
+        tx = self._transaction(txid)
+        if not tx:
+            raise ClientError("Transaction %s not found in local index" % txid)
+        return tx.raw.hex()
+
+    def getrawtransactions(self, txids):
+        raw_txs = {}
+        for i in range(0, len(txids), 500):
+            for txid, raw in self.session.query(DbIndexTransaction.txid, DbIndexTransaction.raw).\
+                    filter(DbIndexTransaction.txid.in_([bytes.fromhex(txid) for txid in txids[i:i + 500]])):
+                raw_txs[txid.hex()] = raw.hex()
+        missing = [txid for txid in txids if txid not in raw_txs]
+        if missing:
+            raise ClientError("Transaction %s not found in local index" % missing[0])
+        return [raw_txs[txid] for txid in txids]
+
+    def blockcount(self):
+        height = self.session.query(DbIndexBlock.height).order_by(DbIndexBlock.height.desc()).limit(1).scalar()
+        if height is None:
+            raise ClientError("Local index is empty")
+        return height
+
+    def isspent(self, txid, output_n):
+        o = self.session.query(DbIndexOutput).filter_by(txid=bytes.fromhex(txid), output_n=output_n).\
+            order_by(DbIndexOutput.height.desc()).first()
+        if not o:
+            raise ClientError("Output %s:%d not found in local index" % (txid, output_n))
+        return 1 if o.spending_txid else 0
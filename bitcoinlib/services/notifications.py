@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+#
+#    BitcoinLib - Python Cryptocurrency Library
+#    Subscribe to new block and transaction notifications of a local node
+#    © 2026 - 1200 Web Development <http://1200wd.com/>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import queue
+import threading
+from datetime import datetime, timezone
+from bitcoinlib.main import *
+from bitcoinlib.encoding import double_sha256
+from bitcoinlib.networks import Network
+from bitcoinlib.blocks import Block
+from bitcoinlib.transactions import Transaction
+from bitcoinlib.services.services import Cache, ServiceError
+from bitcoinlib.services.baseclient import ClientError
+from bitcoinlib.services.electrumx import ElectrumxClient, ElectrumxConnection
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+
+_logger = logging.getLogger(__name__)
+
+
+class ChainSubscriber(object):
+    """
+    Process new blocks and transactions pushed by a local node, instead of polling service providers.
+
+    New blocks update the block count in the cache and the confirmations of watched wallets. Transactions of new
+    blocks are stored in the cache. New transactions are matched with the watched addresses, only the wallet keys of
+    affected addresses are updated.
+
+    Notifications are processed in a separate worker thread, callbacks and wallet updates are called from this thread.
+    Use :class:`ZmqSubscriber` for bitcoind ZMQ notifications or :class:`ElectrumSubscriber` for an Electrum server.
+    """
+
+    def __init__(self, network=DEFAULT_NETWORK, cache_uri=None, on_block=None, on_transaction=None,
+                 on_address=None):
+        """
+        :param network: Network name or Network object
+        :type network: str, Network
+        :param cache_uri: Cache database to update. Default is the default cache database
+        :type cache_uri: str
+        :param on_block: Called with block height and block hash of every new block. Height is None if unknown.
+        :type on_block: callable
+        :param on_transaction: Called with transaction and list of matching addresses for new transactions which spend from or pay to a watched address
+        :type on_transaction: callable
+        :param on_address: Called with address if the history of a watched address is changed
+        :type on_address: callable
+        """
+        self.network = network
+        if not isinstance(network, Network):
+            self.network = Network(network)
+        self.cache_uri = cache_uri
+        self.on_block = on_block
+        self.on_transaction = on_transaction
+        self.on_address = on_address
+        self.addresses = {}
+        self.wallets = []
+        self._queue = queue.Queue()
+        self._worker = None
+        self._cache = None
+
+    def add_address(self, address, wallet=None):
+        """
+        Watch address for new transactions
+
+        :param address: Address string
+        :type address: str
+        :param wallet: Wallet which contains this address, will be updated if a new transaction is found
+        :type wallet: Wallet
+        """
+        wallets = self.addresses.setdefault(address, [])
+        if wallet is not None and wallet not in wallets:
+            wallets.append(wallet)
+
+    def watch_wallet(self, wallet):
+        """
+        Watch all addresses of wallet for new transactions and update confirmations of wallet transactions on new
+        blocks. Add new wallet keys with :func:`add_address`.
+
+        :param wallet: Wallet object
+        :type wallet: Wallet
+        """
+        if wallet not in self.wallets:
+            self.wallets.append(wallet)
+        for address in wallet.addresslist(depth=None):
+            self.add_address(address, wallet)
+
+    def _cache_db(self):
+        # Only used from worker thread
+        if self._cache is None:
+            self._cache = Cache(self.network, db_uri=self.cache_uri)
+        return self._cache
+
+    def _store_blockcount(self, height):
+        self._cache_db().store_blockcount(height)
+
+    def new_block(self, height=None, block_hash=None, block=None):
+        """
+        Process a new block. Called by subscriber when a new block is received.
+
+        :param height: Block height
+        :type height: int
+        :param block_hash: Block hash as hexadecimal string
+        :type block_hash: str
+        :param block: Block object with transactions if available
+        :type block: Block
+        """
+        if block is not None:
+            height = height or block.height
+            block_hash = block_hash or block.block_hash.hex()
+        if height:
+            self._store_blockcount(height)
+            if block is not None:
+                block.height = height
+                self._cache_db().store_block(block)
+                self._store_block_transactions(block)
+        if self.on_block:
+            self.on_block(height, block_hash)
+        for wallet in self.wallets:
+            wallet.transactions_update_confirmations()
+        if block is not None:
+            changed = []
+            for t in block.transactions:
+                if isinstance(t, Transaction):
+                    changed += self._match_transaction(t)
+            self.addresses_changed(list(dict.fromkeys(changed)))
+
+    def _store_block_transactions(self, block):
+        # Raw blocks do not contain input values, use outputs of transactions in this block and in the cache.
+        # Transactions with unknown input values are not stored.
+        cache = self._cache_db()
+        if not cache.cache_enabled():
+            return
+        txs = [t for t in block.transactions if isinstance(t, Transaction)]
+        values = {t.txid: {n: o.value for n, o in enumerate(t.outputs)} for t in txs}
+        prev_txids = {i.prev_txid for t in txs if not t.coinbase for i in t.inputs
+                      if not i.value and i.prev_txid.hex() not in values}
+        for txid, output_values in cache.getoutputvalues(list(prev_txids)).items():
+            values[txid.hex()] = output_values
+        block_date = datetime.fromtimestamp(block.time, timezone.utc)
+        for index, t in enumerate(block.transactions):
+            if not isinstance(t, Transaction):
+                continue
+            if not t.coinbase:
+                for i in t.inputs:
+                    if not i.value:
+                        i.value = values.get(i.prev_txid.hex(), {}).get(i.output_n_int, 0)
+                t.update_totals()
+            t.block_height = block.height
+            t.block_hash = block.block_hash
+            t.date = block_date
+            t.confirmations = 1
+            t.status = 'confirmed'
+            cache.store_transaction(t, index, commit=False)
+        cache.commit()
+
+    def _match_transaction(self, t):
+        addresses = [o.address for o in t.outputs if o.address in self.addresses] + \
+                    [i.address for i in t.inputs if i.address in self.addresses]
+        addresses = list(dict.fromkeys(addresses))
+        if addresses and self.on_transaction:
+            self.on_transaction(t, addresses)
+        return addresses
+
+    def new_transaction(self, t):
+        """
+        Process a new transaction. Called by subscriber when a new transaction is received.
+
+        :param t: Transaction object
+        :type t: Transaction
+        """
+        self.addresses_changed(self._match_transaction(t))
+
+    def addresses_changed(self, addresses):
+        """
+        Update wallet keys of given addresses with new transactions from service providers
+
+        :param addresses: List of watched addresses
+        :type addresses: list of str
+        """
+        for address in addresses:
+            if self.on_address:
+                self.on_address(address)
+            for wallet in self.addresses.get(address, []):
+                try:
+                    key = wallet.key(address)
+                    wallet.transactions_update(key_id=key.key_id, depth=key.depth, network=key.network_name)
+                except Exception as e:
+                    _logger.warning("Could not update wallet %s for address %s: %s" % (wallet.name, address, e))
+
+    def _process(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                self._queue.task_done()
+                break
+            method, args = event
+            try:
+                method(*args)
+            except Exception as e:
+                _logger.warning("Error processing notification: %s" % e)
+            finally:
+                self._queue.task_done()
+
+    def _put(self, method, *args):
+        self._queue.put((method, args))
+
+    def start(self):
+        """
+        Start worker thread which processes notifications
+        """
+        if self._worker and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._process, daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """
+        Stop processing notifications. Notifications which are already received are processed first.
+        """
+        if self._worker:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def wait(self):
+        """
+        Wait until all received notifications are processed
+        """
+        self._queue.join()
+
+
+class ZmqSubscriber(ChainSubscriber):
+    """
+    Subscribe to ZMQ notifications of a bitcoind node. Requires the pyzmq library.
+
+    Enable notifications in bitcoin.conf, for instance with zmqpubrawblock=tcp://127.0.0.1:28332 and
+    zmqpubrawtx=tcp://127.0.0.1:28332
+
+    >>> subscriber = ZmqSubscriber('tcp://127.0.0.1:28332', network='bitcoin')  # doctest: +SKIP
+    >>> subscriber.watch_wallet(wallet)  # doctest: +SKIP
+    >>> subscriber.start()  # doctest: +SKIP
+
+    """
+
+    def __init__(self, url='tcp://127.0.0.1:28332', topics=('rawblock', 'rawtx'), *args, **kwargs):
+        """
+        :param url: ZMQ publisher url of node
+        :type url: str
+        :param topics: Topics to subscribe to: 'rawblock', 'rawtx' and/or 'hashblock'
+        :type topics: tuple of str
+        """
+        super(ZmqSubscriber, self).__init__(*args, **kwargs)
+        self.url = url
+        self.topics = topics
+        self.sequence = {}
+        self._stop = threading.Event()
+        self._receiver = None
+
+    def handle_message(self, topic, body, sequence=None):
+        """
+        Parse a ZMQ notification and add it to the processing queue
+
+        :param topic: Notification topic, i.e. b'rawtx'
+        :type topic: bytes
+        :param body: Message body: raw transaction, raw block or block hash
+        :type body: bytes
+        :param sequence: Sequence number of message, 4 bytes little endian
+        :type sequence: bytes
+        """
+        topic = topic.decode() if isinstance(topic, bytes) else topic
+        if sequence is not None:
+            seq = int.from_bytes(sequence, 'little')
+            if topic in self.sequence and seq != self.sequence[topic] + 1:
+                _logger.warning("Missed %d ZMQ %s notifications" % (seq - self.sequence[topic] - 1, topic))
+            self.sequence[topic] = seq
+        if topic == 'rawtx':
+            self._put(self.new_transaction, Transaction.parse_bytes(body, strict=False, network=self.network))
+        elif topic == 'rawblock':
+            block = Block.parse_bytes(body, parse_transactions=True, network=self.network)
+            self._put(self.new_block, None, None, block)
+        elif topic == 'hashblock':
+            self._put(self.new_block, None, body.hex())
+
+    def _receive(self, socket):
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while not self._stop.is_set():
+            if poller.poll(500):
+                try:
+                    self.handle_message(*socket.recv_multipart())
+                except Exception as e:
+                    _logger.warning("Could not process ZMQ notification: %s" % e)
+        socket.close()
+
+    def start(self):
+        if zmq is None:
+            raise ServiceError("The pyzmq library is needed to subscribe to ZMQ notifications")
+        super(ZmqSubscriber, self).start()
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.connect(self.url)
+        for topic in self.topics:
+            socket.setsockopt(zmq.SUBSCRIBE, topic.encode())
+        self._stop.clear()
+        self._receiver = threading.Thread(target=self._receive, args=(socket, ), daemon=True)
+        self._receiver.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._receiver:
+            self._receiver.join()
+            self._receiver = None
+        super(ZmqSubscriber, self).stop()
+
+
+class ElectrumSubscriber(ChainSubscriber):
+    """
+    Subscribe to new block headers and address notifications of an Electrum server.
+
+    Subscriptions use a dedicated connection to the server. If the connection is lost, a new connection is opened
+    and all subscriptions are renewed. Blocks and address changes which were missed in the meantime are processed
+    after reconnecting.
+
+    >>> subscriber = ElectrumSubscriber('127.0.0.1:50001', network='bitcoin')  # doctest: +SKIP
+    >>> subscriber.watch_wallet(wallet)  # doctest: +SKIP
+    >>> subscriber.start()  # doctest: +SKIP
+
+    """
+
+    def __init__(self, url='127.0.0.1:50001', *args, reconnect_interval=5, **kwargs):
+        """
+        :param url: Electrum server url in the format host:port, use ssl://host:port for an encrypted connection
+        :type url: str
+        :param reconnect_interval: Number of seconds between checks of the connection and reconnection attempts
+        :type reconnect_interval: float
+        """
+        super(ElectrumSubscriber, self).__init__(*args, **kwargs)
+        self.url = url
+        self.reconnect_interval = reconnect_interval
+        self.client = ElectrumxClient(self.network, url, 100000000, '')
+        self.scripthashes = {}
+        self.status = {}
+        self.height = None
+        self._connection = None
+        self._stop = threading.Event()
+        self._monitor_thread = None
+
+    def add_address(self, address, wallet=None):
+        super(ElectrumSubscriber, self).add_address(address, wallet)
+        if address not in self.scripthashes.values():
+            scripthash = self.client._get_scripthash(address)
+            self.scripthashes[scripthash] = address
+            if self._connection:
+                try:
+                    self.status[scripthash] = self._connection.request('blockchain.scripthash.subscribe',
+                                                                       [scripthash])
+                except ClientError as e:
+                    # Address is subscribed when reconnecting
+                    _logger.info("Could not subscribe to address %s: %s" % (address, e))
+
+    def _header_notification(self, params):
+        header = params[0]
+        self.height = header['height']
+        self._put(self.new_block, header['height'], double_sha256(bytes.fromhex(header['hex']))[::-1].hex())
+
+    def _scripthash_notification(self, params):
+        scripthash, status = params
+        if scripthash in self.scripthashes and self.status.get(scripthash) != status:
+            self.status[scripthash] = status
+            self._put(self.addresses_changed, [self.scripthashes[scripthash]])
+
+    def _subscribe(self):
+        # Open new connection and subscribe to headers and all addresses. After a reconnect, process new blocks and
+        # changed addresses which were missed while disconnected.
+        reconnect = self._connection is not None
+        conn = ElectrumxConnection(*self.client._connection_args())
+        conn.add_notification_handler('blockchain.headers.subscribe', self._header_notification)
+        conn.add_notification_handler('blockchain.scripthash.subscribe', self._scripthash_notification)
+        header = conn.request('blockchain.headers.subscribe')
+        if not reconnect:
+            self._put(self._store_blockcount, header['height'])
+        elif header['height'] != self.height:
+            self._put(self.new_block, header['height'], double_sha256(bytes.fromhex(header['hex']))[::-1].hex())
+        self.height = header['height']
+        scripthashes = list(self.scripthashes)
+        changed = []
+        for scripthash, status in zip(scripthashes, conn.batch(
+                [('blockchain.scripthash.subscribe', [sh]) for sh in scripthashes])):
+            if reconnect and self.status.get(scripthash) != status:
+                changed.append(self.scripthashes[scripthash])
+            self.status[scripthash] = status
+        if changed:
+            self._put(self.addresses_changed, changed)
+        self._connection = conn
+
+    def _monitor(self):
+        while not self._stop.wait(self.reconnect_interval):
+            if self._connection.closed:
+                _logger.info("Connection to Electrum server %s lost, reconnecting" % self.url)
+                try:
+                    self._subscribe()
+                except ClientError as e:
+                    _logger.warning("Could not reconnect to Electrum server %s: %s" % (self.url, e))
+
+    def start(self):
+        super(ElectrumSubscriber, self).start()
+        self._subscribe()
+        self._stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self._monitor_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._monitor_thread:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+        super(ElectrumSubscriber, self).stop()
@@ -18,9 +18,15 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import atexit
+import copy
+import functools
 import json
 import random
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from sqlalchemy import func
 from bitcoinlib import services
@@ -29,6 +35,7 @@ from bitcoinlib.encoding import to_bytes, int_to_varbyteint, varstr
 from bitcoinlib.db_cache import *
 from bitcoinlib.transactions import Transaction, transaction_update_spents
 from bitcoinlib.blocks import Block
+from bitcoinlib.services.baseclient import RateLimitError, LocalRateLimitError, get_rate_limiter
 
 
 _logger = logging.getLogger(__name__)
@@ -43,6 +50,492 @@ class ServiceError(Exception):
         return self.msg
 
 
+class ProviderScore(object):
+    """
+    Latency and error statistics of a service provider, used to order providers and to skip failing providers for a
+    while (circuit breaker).
+    """
+
+    def __init__(self, name, latency=None, error_rate=0.0, requests=0, errors=0, rate_limited=0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = requests
+        self.errors = errors
+        self.rate_limited = rate_limited
+        self.consecutive_errors = 0
+        self.circuit_open_until = 0
+        self.last_error = None
+
+    def __repr__(self):
+        return "<ProviderScore(%s, score %.3f%s)>" % (self.name, self.score(),
+                                                       ', circuit open' if self.circuit_open else '')
+
+    @property
+    def circuit_open(self):
+        """
+        Provider is skipped if circuit is open, i.e. after too many consecutive errors or a rate limit response.
+
+        :return bool:
+        """
+        return time.time() < self.circuit_open_until
+
+    def score(self):
+        """
+        Score between 0 and 1 based on moving average of error rate and latency. Providers without requests get a
+        score of 1, so they will be tried first.
+
+        :return float:
+        """
+        latency = self.latency or 0
+        return (1 - self.error_rate) / (1 + latency / 1000)
+
+    def success(self, latency):
+        """
+        Update statistics after a successful request
+
+        :param latency: Request time in milliseconds
+        :type latency: float
+        """
+        self.requests += 1
+        self.consecutive_errors = 0
+        self.circuit_open_until = 0
+        self.latency = latency if self.latency is None else \
+            SERVICE_SCORE_EWMA_ALPHA * latency + (1 - SERVICE_SCORE_EWMA_ALPHA) * self.latency
+        self.error_rate = (1 - SERVICE_SCORE_EWMA_ALPHA) * self.error_rate
+
+    def failure(self, error, rate_limited=False):
+        """
+        Update statistics after a failed request. Opens the circuit if provider reached a rate limit or the maximum
+        number of consecutive errors.
+
+        :param error: Error message
+        :type error: str
+        :param rate_limited: Provider responded that the maximum number of requests is reached
+        :type rate_limited: bool
+        """
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error = str(error)
+        self.error_rate = SERVICE_SCORE_EWMA_ALPHA + (1 - SERVICE_SCORE_EWMA_ALPHA) * self.error_rate
+        if rate_limited:
+            self.rate_limited += 1
+        if rate_limited or self.consecutive_errors >= SERVICE_CIRCUIT_BREAKER_ERRORS:
+            _logger.info("Skip provider %s for %d seconds after error: %s" %
+                         (self.name, SERVICE_CIRCUIT_BREAKER_TIME, error))
+            self.circuit_open_until = time.time() + SERVICE_CIRCUIT_BREAKER_TIME
+
+    def as_dict(self):
+        return {
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+            'errors': self.errors,
+            'rate_limited': self.rate_limited,
+            'score': self.score(),
+            'circuit_open': self.circuit_open,
+            'last_error': self.last_error,
+        }
+
+
+class ProviderScores(object):
+    """
+    Process wide registry of service provider scores, shared by all Service objects.
+
+    Scores are stored in the file specified in the 'provider_scores_file' configuration setting if available.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.scores = {}
+        self._lock = threading.Lock()
+        if filename and Path(filename).exists():
+            try:
+                with Path(filename).open() as f:
+                    for name, score in json.load(f).items():
+                        self.scores[name] = ProviderScore(name, score['latency'], score['error_rate'],
+                                                          score['requests'], score['errors'], score['rate_limited'])
+            except (ValueError, KeyError, TypeError) as e:
+                _logger.warning("Could not read provider scores from %s: %s" % (filename, e))
+
+    def get(self, name):
+        """
+        Get score object of provider, create a new one if it does not exist
+
+        :param name: Provider name, key in providers.json
+        :type name: str
+
+        :return ProviderScore:
+        """
+        with self._lock:
+            if name not in self.scores:
+                self.scores[name] = ProviderScore(name)
+            return self.scores[name]
+
+    def success(self, name, latency):
+        score = self.get(name)
+        with self._lock:
+            score.success(latency)
+
+    def failure(self, name, error, rate_limited=False):
+        score = self.get(name)
+        with self._lock:
+            score.failure(error, rate_limited)
+
+    def reset(self):
+        """
+        Remove all provider statistics
+        """
+        with self._lock:
+            self.scores = {}
+
+    def as_dict(self):
+        """
+        Statistics and scores of all providers, for monitoring
+
+        :return dict:
+        """
+        with self._lock:
+            return {name: score.as_dict() for name, score in self.scores.items()}
+
+    def save(self):
+        """
+        Write scores to file if a filename is specified
+        """
+        if not self.filename:
+            return
+        try:
+            with Path(self.filename).open('w') as f:
+                json.dump({name: {k: v for k, v in score.items() if k not in ['score', 'circuit_open', 'last_error']}
+                           for name, score in self.as_dict().items()}, f)
+        except OSError as e:
+            _logger.warning("Could not save provider scores to %s: %s" % (self.filename, e))
+
+
+provider_scores = ProviderScores(SERVICE_PROVIDER_SCORES_FILE)
+atexit.register(provider_scores.save)
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of request latencies in milliseconds, with a count per bucket upper bound
+    """
+
+    def __init__(self, buckets=SERVICE_METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, latency):
+        for i, bound in enumerate(self.buckets):
+            if latency <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += latency
+
+    def as_dict(self):
+        """
+        Cumulative counts per bucket upper bound, as used by Prometheus histograms
+
+        :return dict:
+        """
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {'buckets': buckets, 'count': self.count, 'sum': round(self.sum, 3)}
+
+
+class ServiceMetrics(object):
+    """
+    Process wide registry of request metrics per provider and method, and cache hits and misses per method.
+
+    Use :func:`snapshot` to get the current values, :func:`prometheus` for the Prometheus text format or add a hook
+    with :func:`add_hook` to send every measurement to another system, for instance with a :class:`StatsdHook`.
+    """
+
+    def __init__(self, buckets=SERVICE_METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.hooks = []
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.lookups = {}
+
+    def reset(self):
+        """
+        Remove all measurements
+        """
+        with self._lock:
+            self.requests = {}
+            self.lookups = {}
+
+    def add_hook(self, hook):
+        """
+        Add function which is called for every measurement with the arguments name, value and labels. Name is one of
+        'requests', 'errors', 'rate_limited', 'bytes_received', 'latency', 'cache_hits' or 'cache_misses'. Labels is
+        a dictionary with the 'provider' and 'method' or only the 'method' for cache measurements.
+
+        :param hook: Function or other callable
+        :type hook: callable
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def _emit(self, measurements, labels):
+        for hook in list(self.hooks):
+            for name, value in measurements:
+                try:
+                    hook(name, value, labels)
+                except Exception as e:
+                    _logger.warning("Error in service metrics hook %s: %s" % (hook, e))
+
+    def request(self, provider, method, latency, error=False, rate_limited=False, bytes_received=0):
+        """
+        Register a request to a service provider
+
+        :param provider: Provider name, key in providers.json
+        :type provider: str
+        :param method: Service method, i.e. 'getutxos'
+        :type method: str
+        :param latency: Duration of request in milliseconds
+        :type latency: float
+        :param error: Request failed
+        :type error: bool
+        :param rate_limited: Request was refused because of a rate limit
+        :type rate_limited: bool
+        :param bytes_received: Size of response(s) in bytes
+        :type bytes_received: int
+        """
+        with self._lock:
+            m = self.requests.setdefault((provider, method), {
+                'requests': 0, 'errors': 0, 'rate_limited': 0, 'bytes_received': 0,
+                'latency': LatencyHistogram(self.buckets)})
+            m['requests'] += 1
+            m['errors'] += int(bool(error))
+            m['rate_limited'] += int(bool(rate_limited))
+            m['bytes_received'] += bytes_received
+            m['latency'].observe(latency)
+        if self.hooks:
+            self._emit([('requests', 1), ('errors', int(bool(error))), ('rate_limited', int(bool(rate_limited))),
+                        ('bytes_received', bytes_received), ('latency', latency)],
+                       {'provider': provider, 'method': method})
+
+    def cache_lookup(self, method, hit):
+        """
+        Register a lookup in the cache database
+
+        :param method: Service method, i.e. 'gettransaction'
+        :type method: str
+        :param hit: Result was found in cache
+        :type hit: bool
+        """
+        with self._lock:
+            m = self.lookups.setdefault(method, {'hits': 0, 'misses': 0})
+            m['hits' if hit else 'misses'] += 1
+        if self.hooks:
+            self._emit([('cache_hits' if hit else 'cache_misses', 1)], {'method': method})
+
+    def snapshot(self):
+        """
+        Copy of all current measurements. Requests per provider and method and cache lookups per method.
+
+        >>> service_metrics.snapshot()  # doctest: +SKIP
+        {'providers': {'blockstream': {'getutxos': {'requests': 2, 'errors': 0, 'rate_limited': 0, 'bytes_received': 1612, 'latency': {...}}}}, 'cache': {'gettransaction': {'hits': 1, 'misses': 2, 'hit_ratio': 0.333}}}
+
+        :return dict:
+        """
+        with self._lock:
+            providers = {}
+            for (provider, method), m in self.requests.items():
+                providers.setdefault(provider, {})[method] = dict(m, latency=m['latency'].as_dict())
+            cache = {method: dict(m, hit_ratio=round(m['hits'] / (m['hits'] + m['misses']), 3))
+                     for method, m in self.lookups.items()}
+        return {'providers': providers, 'cache': cache}
+
+    def prometheus(self, prefix='bitcoinlib_service'):
+        """
+        Current measurements in Prometheus text exposition format, can be served on a metrics endpoint.
+
+        :param prefix: Prefix of metric names
+        :type prefix: str
+
+        :return str:
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, mtype in [('requests', 'counter'), ('errors', 'counter'), ('rate_limited', 'counter'),
+                            ('bytes_received', 'counter'), ('latency', 'histogram')]:
+            metric = '%s_%s%s' % (prefix, name, '_ms' if name == 'latency' else '_total')
+            lines.append('# TYPE %s %s' % (metric, mtype))
+            for provider, methods in sorted(snapshot['providers'].items()):
+                for method, m in sorted(methods.items()):
+                    labels = 'provider="%s",method="%s"' % (provider, method)
+                    if name != 'latency':
+                        lines.append('%s{%s} %d' % (metric, labels, m[name]))
+                        continue
+                    for bound, count in m['latency']['buckets'].items():
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, count))
+                    lines.append('%s_sum{%s} %s' % (metric, labels, m['latency']['sum']))
+                    lines.append('%s_count{%s} %d' % (metric, labels, m['latency']['count']))
+        for name in ['hits', 'misses']:
+            metric = '%s_cache_%s_total' % (prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            for method, m in sorted(snapshot['cache'].items()):
+                lines.append('%s{method="%s"} %d' % (metric, method, m[name]))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdHook(object):
+    """
+    Metrics hook which sends measurements to a StatsD server over UDP
+
+    >>> service_metrics.add_hook(StatsdHook('localhost', 8125))  # doctest: +SKIP
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='bitcoinlib'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, name, value, labels):
+        if not value and name != 'latency':
+            return
+        key = '.'.join([self.prefix, name] + [labels[k] for k in ['provider', 'method'] if k in labels])
+        self.sock.sendto(('%s:%s|%s' % (key, round(value, 3), 'ms' if name == 'latency' else 'c')).encode(),
+                         self.address)
+
+
+service_metrics = ServiceMetrics()
+
+
+class SingleFlight(object):
+    """
+    Coalesce identical concurrent requests: the first caller executes the request, other callers with the same key
+    wait for it to finish and share its result or exception.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        Execute function, or wait for the result if a function with the same key is already executing
+
+        :param key: Hashable key of request
+        :type key: tuple
+        :param func: Function without arguments to execute
+        :type func: callable
+
+        :return tuple: Result and boolean which is True if function was executed by this caller
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'result': None, 'error': None}
+                self._flights[key] = flight
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                flight['result'] = func()
+            except Exception as e:
+                flight['error'] = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight['done'].set()
+        else:
+            flight['done'].wait()
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['result'], leader
+
+
+single_flight = SingleFlight()
+
+
+_providers_defined = {}
+_providers_defined_lock = threading.Lock()
+
+
+def provider_definitions(filename=None, reload=False):
+    """
+    Get service provider definitions from the providers.json file. The file is only read and parsed once per process,
+    the same dictionary is returned on later calls.
+
+    :param filename: Path to provider definitions file. Default is providers.json in data directory
+    :type filename: str, Path
+    :param reload: Read the file again, use when the provider definitions have been changed
+    :type reload: bool
+
+    :return dict:
+    """
+    fn = Path(filename or Path(BCL_DATA_DIR, 'providers.json'))
+    with _providers_defined_lock:
+        if reload or str(fn) not in _providers_defined:
+            try:
+                with fn.open("r") as f:
+                    _providers_defined[str(fn)] = json.loads(f.read())
+            except json.decoder.JSONDecodeError as e:  # pragma: no cover
+                errstr = "Error reading provider definitions from %s: %s" % (fn, e)
+                _logger.warning(errstr)
+                raise ServiceError(errstr)
+        return _providers_defined[str(fn)]
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _single_flight(method):
+    """
+    Decorator for read-only Service methods: concurrent calls with the same network, providers, settings, cache
+    database, wallet and arguments share one request to the service providers. Callers which waited receive a copy
+    of the result.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (self.network.name, method.__name__, _freeze(args), _freeze(kwargs), tuple(sorted(self.providers)),
+               self.min_providers, self.max_providers, self.strict, self.timeout, self.wallet_name,
+               self.cache.db_uri)
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+
+        def execute():
+            res = method(self, *args, **kwargs)
+            return res, (self.results, self.errors, self.skipped, self.resultcount, self.complete,
+                         self.execution_time, self.results_cache_n, self._blockcount, self._blockcount_update)
+
+        (res, state), leader = single_flight.do(key, execute)
+        if not leader:
+            self.results, self.errors, self.skipped, self.resultcount, self.complete, self.execution_time, \
+                self.results_cache_n = copy.copy(state[0]), copy.copy(state[1]), copy.copy(state[2]), *state[3:7]
+            if state[7] is not None:
+                self._blockcount, self._blockcount_update = state[7:]
+            if not isinstance(res, (int, float, str, bytes, bool, type(None))):
+                res = copy.deepcopy(res)
+        return res
+    return wrapper
+
+
 class Service(object):
     """
     Class to connect to various cryptocurrency service providers. Use to receive network and blockchain information,
@@ -90,16 +583,7 @@ class Service(object):
             self.network = Network(network)
         if min_providers > max_providers:
             max_providers = min_providers
-        fn = Path(BCL_DATA_DIR, 'providers.json')
-        f = fn.open("r")
-
-        try:
-            self.providers_defined = json.loads(f.read())
-        except json.decoder.JSONDecodeError as e:  # pragma: no cover
-            errstr = "Error reading provider definitions from %s: %s" % (fn, e)
-            _logger.warning(errstr)
-            raise ServiceError(errstr)
-        f.close()
+        self.providers_defined = provider_definitions()
 
         provider_set = {self.providers_defined[x]['provider'] for x in self.providers_defined}
         if providers is None:
@@ -118,13 +602,13 @@ class Service(object):
                 raise ServiceError("Provider with name '%s' not found in provider definitions" % provider_name)
             if self.providers_defined[provider_name]['network'] != self.network:
                 raise ServiceError("Network from provider '%s' is different than Service network" % provider_name)
-            self.providers.update({provider_name: self.providers_defined[provider_name]})
+            self.providers.update({provider_name: dict(self.providers_defined[provider_name])})
         else:
             for p in self.providers_defined:
                 if (self.providers_defined[p]['network'] == network or self.providers_defined[p]['network'] == '') and \
                         self.providers_defined[p]['priority'] > 0 and \
                         (not providers or self.providers_defined[p]['provider'] in providers):
-                    self.providers.update({p: self.providers_defined[p]})
+                    self.providers.update({p: dict(self.providers_defined[p])})
         exclude_providers_keys = {pi: self.providers[pi]['provider'] for
                                   pi in self.providers if self.providers[pi]['provider'] in exclude_providers}.keys()
         for provider_key in exclude_providers_keys:
@@ -136,52 +620,93 @@ class Service(object):
         self.max_providers = max_providers
         self.results = {}
         self.errors = {}
+        self.skipped = {}
         self.resultcount = 0
         self.max_errors = max_errors
         self.complete = None
         self.timeout = timeout
         self._blockcount_update = 0
         self._blockcount = None
-        self.cache = None
+        self._cache = None
         self.cache_uri = cache_uri
         self.wallet_name = wallet_name
-        try:
-            self.cache = Cache(self.network, db_uri=cache_uri)
-        except Exception as e:
-            self.cache = Cache(self.network, db_uri='')
-            _logger.warning("Could not connect to cache database. Error: %s" % e)
         self.results_cache_n = 0
         self.ignore_priority = ignore_priority
         self.strict = strict
         self.execution_time = None
-        if self.min_providers > 1:
-            self._blockcount = Service(network=network, cache_uri=cache_uri, providers=providers,
-                                       exclude_providers=exclude_providers, timeout=timeout).blockcount()
-        else:
-            self._blockcount = self.blockcount()
+
+    @property
+    def cache(self):
+        """
+        Cache database object. The connection to the cache database is only opened on first use.
+
+        :return Cache:
+        """
+        if self._cache is None:
+            try:
+                self._cache = Cache(self.network, db_uri=self.cache_uri)
+            except Exception as e:
+                self._cache = Cache(self.network, db_uri='')
+                _logger.warning("Could not connect to cache database. Error: %s" % e)
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        self._cache = value
+
+    def _latest_block(self):
+        # Block count is passed to provider clients to calculate confirmations. It is requested once when a method
+        # needs it, instead of on every Service initialization.
+        if self._blockcount is None:
+            srv = copy.copy(self)
+            srv.min_providers = srv.max_providers = 1
+            try:
+                self._blockcount = srv.blockcount() or None
+            except ServiceError as e:
+                _logger.info("Could not retrieve latest block count: %s" % e)
+            self._blockcount_update = srv._blockcount_update
+        return self._blockcount
 
     def _reset_results(self):
         self.results = {}
         self.errors = {}
+        self.skipped = {}
         self.complete = None
         self.resultcount = 0
         self.execution_time = None
 
     def _provider_execute(self, method, *arguments):
+        if method in ('getutxos', 'gettransaction', 'gettransactions', 'getblock'):
+            self._latest_block()
         self._reset_results()
+        scores = {x: provider_scores.get(x) for x in self.providers}
+        limiters = {x: get_rate_limiter(x, self.providers[x]['rate_limit'], self.providers[x].get('rate_limit_burst'))
+                    for x in self.providers if self.providers[x].get('rate_limit')}
+        # Order by priority, then prefer providers which are not rate limited at the moment and have the best score
         provider_lst = [p[0] for p in sorted([(x, self.providers[x]['priority']) for x in self.providers],
-                        key=lambda x: (x[1], random.random()), reverse=True)]
+                        key=lambda x: (x[1], x[0] not in limiters or not limiters[x[0]].wait_time(),
+                                       scores[x[0]].score() * random.uniform(0.9, 1)), reverse=True)]
         if self.ignore_priority:
             random.shuffle(provider_lst)
+        # Providers with an open circuit are only used when all other providers fail
+        provider_lst = [sp for sp in provider_lst if not scores[sp].circuit_open] + \
+                       [sp for sp in provider_lst if scores[sp].circuit_open]
 
         start_time = datetime.now()
         for sp in provider_lst:
             if self.resultcount >= self.max_providers:
                 break
+            request_start = None
+            pc_instance = None
             try:
                 if sp not in ['bitcoind', 'litecoind', 'dogecoind', 'caching'] and not self.providers[sp]['url'] and \
                         self.network.name != 'bitcoinlib_test':
                     continue
+                # Providers skipped because of the local rate limiter do not count as errors
+                if sp in limiters and limiters[sp].wait_time() > self.timeout:
+                    self.skipped.update({sp: 'Rate limit reached'})
+                    _logger.debug("Skip provider %s, rate limit reached" % sp)
+                    continue
                 client = getattr(services, self.providers[sp]['provider'])
                 providerclient = getattr(client, self.providers[sp]['client_class'])
 
@@ -190,6 +715,7 @@ class Service(object):
                     self.providers[sp]['api_key'], self.providers[sp]['provider_coin_id'],
                     self.providers[sp]['network_overrides'], self.timeout, self._blockcount, self.strict,
                     self.wallet_name)
+                pc_instance.rate_limiter = limiters.get(sp)
                 if not hasattr(pc_instance, method):
                     _logger.debug("Method %s not found for provider %s" % (method, sp))
                     continue
@@ -197,18 +723,28 @@ class Service(object):
                     _logger.debug("API key needed for provider %s" % sp)
                     continue
                 providermethod = getattr(pc_instance, method)
+                request_start = time.time()
                 res = providermethod(*arguments)
+                latency = (time.time() - request_start) * 1000
                 if res is False:  # pragma: no cover
                     self.errors.update(
                         {sp: 'Received empty response'}
                     )
+                    provider_scores.failure(sp, 'Received empty response')
+                    service_metrics.request(sp, method, latency, error=True,
+                                            bytes_received=pc_instance.bytes_received)
                     _logger.info("Empty response from %s when calling %s" % (sp, method))
                     continue
+                provider_scores.success(sp, latency)
+                service_metrics.request(sp, method, latency, bytes_received=pc_instance.bytes_received)
                 self.results.update(
                     {sp: res}
                 )
                 _logger.debug("Executed method %s from provider %s" % (method, sp))
                 self.resultcount += 1
+            except LocalRateLimitError as e:
+                self.skipped.update({sp: e.msg})
+                _logger.debug("Skip provider %s: %s" % (sp, e))
             except Exception as e:
                 if not isinstance(e, AttributeError):
                     try:
@@ -218,6 +754,11 @@ class Service(object):
                     self.errors.update(
                         {sp: err}
                     )
+                    provider_scores.failure(sp, err, isinstance(e, RateLimitError))
+                    if request_start:
+                        service_metrics.request(sp, method, (time.time() - request_start) * 1000, error=True,
+                                                rate_limited=isinstance(e, RateLimitError),
+                                                bytes_received=pc_instance.bytes_received)
                     _logger.debug("Error %s on provider %s" % (e, sp))
                     # -- Use this to debug specific Services errors --
                     # from pprint import pprint
@@ -230,6 +771,9 @@ class Service(object):
                         return list(self.results.values())[0]
                     else:
                         return False
+            finally:
+                if pc_instance is not None:
+                    pc_instance.close()
 
             if self.resultcount >= self.max_providers:
                 break
@@ -239,6 +783,33 @@ class Service(object):
             raise ServiceError("No successful response from any serviceprovider: %s" % list(self.providers.keys()))
         return list(self.results.values())[0]
 
+    def _cache_lookup(self, method, hit):
+        if self.cache.cache_enabled():
+            service_metrics.cache_lookup(method, hit)
+
+    def metrics(self):
+        """
+        Request metrics of the providers of this Service object, and cache hits and misses per method. Metrics are
+        kept process wide, so these include requests of other Service objects. Use the module level
+        'service_metrics' object for all metrics, to reset them or to add export hooks.
+
+        :return dict:
+        """
+        snapshot = service_metrics.snapshot()
+        snapshot['providers'] = {sp: snapshot['providers'][sp] for sp in self.providers if sp in snapshot['providers']}
+        return snapshot
+
+    def scores(self):
+        """
+        Latency, error statistics and score of the providers of this Service object. Statistics are kept process
+        wide, so these include requests of other Service objects.
+
+        :return dict:
+        """
+        all_scores = provider_scores.as_dict()
+        return {sp: all_scores[sp] for sp in self.providers if sp in all_scores}
+
+    @_single_flight
     def getbalance(self, addresslist, addresses_per_request=5):
         """
         Get total balance for address or list of addresses
@@ -260,6 +831,9 @@ class Service(object):
                 if db_addr and db_addr.last_block and db_addr.last_block >= self.blockcount() and db_addr.balance:
                     tot_balance += db_addr.balance
                     addresslist.remove(address)
+                    self._cache_lookup('getbalance', True)
+                else:
+                    self._cache_lookup('getbalance', False)
 
             balance = self._provider_execute('getbalance', addresslist[:addresses_per_request])
             if balance:
@@ -269,6 +843,7 @@ class Service(object):
             addresslist = addresslist[addresses_per_request:]
         return tot_balance
 
+    @_single_flight
     def getutxos(self, address, after_txid='', limit=MAX_TRANSACTIONS):
         """
         Get a list of unspent outputs (UTXO's) for the specified address.
@@ -292,6 +867,7 @@ class Service(object):
         utxos_cache = []
         if self.min_providers <= 1:
             utxos_cache = self.cache.getutxos(address, bytes.fromhex(after_txid)) or []
+            self._cache_lookup('getutxos', bool(utxos_cache))
         if utxos_cache:
             self.results_cache_n = len(utxos_cache)
 
@@ -316,6 +892,7 @@ class Service(object):
 
         return utxos_cache + utxos
 
+    @_single_flight
     def gettransaction(self, txid):
         """
         Get a transaction by its transaction hash. Convert to a Bitcoinlib Transaction object.
@@ -330,6 +907,7 @@ class Service(object):
 
         if self.min_providers <= 1:
             tx = self.cache.gettransaction(bytes.fromhex(txid))
+            self._cache_lookup('gettransaction', bool(tx))
             if tx:
                 self.results_cache_n = 1
         if not tx:
@@ -341,6 +919,7 @@ class Service(object):
                 self.cache.store_transaction(tx)
         return tx
 
+    @_single_flight
     def gettransactions(self, address, after_txid='', limit=MAX_TRANSACTIONS):
         """
         Get all transactions for the specified address.
@@ -375,6 +954,7 @@ class Service(object):
 
         if caching_enabled:
             txs_cache = self.cache.gettransactions(address, qry_after_txid, limit) or []
+            self._cache_lookup('gettransactions', bool(txs_cache))
             if txs_cache:
                 self.results_cache_n = len(txs_cache)
                 if len(txs_cache) == limit:
@@ -430,6 +1010,66 @@ class Service(object):
                 self.cache.commit()
         return all_txs
 
+    def iter_transactions(self, address, after_txid='', page_size=MAX_TRANSACTIONS, prefetch=True):
+        """
+        Iterate over all transactions of an address, from old to new. Transactions are retrieved from cache and
+        service providers with :func:`gettransactions` in pages of 'page_size' transactions, so large transaction
+        histories can be processed without keeping all transactions in memory.
+
+        The next page is requested in a background thread while the transactions of the current page are processed.
+        Progress is stored in the cache like with :func:`gettransactions`, so an interrupted iteration continues from
+        the cache.
+
+        >>> srv = Service()
+        >>> for t in srv.iter_transactions('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa', page_size=50):  # doctest: +SKIP
+        ...     print(t.txid)
+
+        :param address: Address string
+        :type address: str
+        :param after_txid: Transaction ID of the last known transaction. Only iterate over transactions after given tx id. Default: Leave empty to iterate over all transactions.
+        :type after_txid: str
+        :param page_size: Maximum number of transactions to retrieve per request
+        :type page_size: int
+        :param prefetch: Retrieve next page in background. Default is True
+        :type prefetch: bool
+
+        :return Transaction: Generator of Transaction objects
+        """
+        def fetch(after):
+            srv = self
+            if prefetch:
+                # Use a separate cache session in background thread
+                srv = copy.copy(self)
+                srv._cache = None
+            try:
+                return srv.gettransactions(address, after, page_size), srv.complete
+            finally:
+                if prefetch and srv._cache and srv._cache.session:
+                    srv._cache.session.close()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = executor.submit(fetch, after_txid) if prefetch else None
+            seen = set()
+            while True:
+                txs, complete = page.result() if prefetch else fetch(after_txid)
+                # A full page means more transactions can be available, also if some were already seen
+                page_full = len(txs) >= page_size
+                txs = [t for t in txs if t.txid not in seen]
+                if not txs:
+                    break
+                last_txid = txs[-1].txid
+                more = page_full and not complete and last_txid != after_txid
+                if more and prefetch:
+                    page = executor.submit(fetch, last_txid)
+                # Only remember transactions of the last page to detect loops with constant memory use
+                seen = {t.txid for t in txs}
+                for t in txs:
+                    yield t
+                if not more:
+                    break
+                after_txid = last_txid
+
+    @_single_flight
     def getrawtransaction(self, txid):
         """
         Get a raw transaction by its transaction hash
@@ -441,6 +1081,7 @@ class Service(object):
         """
         self.results_cache_n = 0
         rawtx = self.cache.getrawtransaction(bytes.fromhex(txid))
+        self._cache_lookup('getrawtransaction', bool(rawtx))
         if rawtx:
             self.results_cache_n = 1
             return rawtx
@@ -457,6 +1098,7 @@ class Service(object):
         """
         return self._provider_execute('sendrawtransaction', rawtx)
 
+    @_single_flight
     def estimatefee(self, blocks=5, priority=''):
         """
         Estimate fee per kilobyte for a transaction for this network with expected confirmation within a certain
@@ -477,6 +1119,7 @@ class Service(object):
                 blocks = 2
         if self.min_providers <= 1:  # Disable cache if comparing providers
             fee = self.cache.estimatefee(blocks)
+            self._cache_lookup('estimatefee', bool(fee))
             if fee:
                 self.results_cache_n = 1
                 return fee
@@ -493,6 +1136,7 @@ class Service(object):
         self.cache.store_estimated_fee(blocks, fee)
         return fee
 
+    @_single_flight
     def blockcount(self):
         """
         Get the latest block number: The block number of the last block in the longest chain on the Blockchain.
@@ -504,6 +1148,7 @@ class Service(object):
 
         blockcount = self.cache.blockcount()
         last_cache_blockcount = self.cache.blockcount(never_expires=True)
+        self._cache_lookup('blockcount', bool(blockcount))
         if blockcount:
             self._blockcount = blockcount
             return blockcount
@@ -528,6 +1173,7 @@ class Service(object):
                 self.cache.store_blockcount(self._blockcount)
         return self._blockcount
 
+    @_single_flight
     def getblock(self, blockid, parse_transactions=True, page=1, limit=None):
         """
         Get the block with the specified block height or block hash from service providers.
@@ -576,6 +1222,7 @@ class Service(object):
             is_last_page = page*limit > block.tx_count
         if not block or (not len(block.transactions) and limit != 0) or (not is_last_page and len(block.transactions) < limit) or \
                 (is_last_page and ((page-1)*limit - block.tx_count + len(block.transactions)) < 0):
+            self._cache_lookup('getblock', False)
             self.results_cache_n = 0
             bd = self._provider_execute('getblock', blockid, parse_transactions, page, limit)
             if not bd or isinstance(bd, bool):
@@ -595,8 +1242,11 @@ class Service(object):
                 self.cache.commit()
             self.complete = True if len(block.transactions) == block.tx_count else False
             self.cache.store_block(block)
+        else:
+            self._cache_lookup('getblock', True)
         return block
 
+    @_single_flight
     def getrawblock(self, blockid):
         """
         Get a raw block as a hexadecimal string for a block with a specified hash or block height.
@@ -611,6 +1261,7 @@ class Service(object):
         """
         return self._provider_execute('getrawblock', blockid)
 
+    @_single_flight
     def mempool(self, txid=''):
         """
         Get list of all transaction IDs in the current mempool
@@ -645,6 +1296,7 @@ class Service(object):
             addr_dict['n_utxos'] = addr_rec.n_utxos
         return addr_dict
 
+    @_single_flight
     def isspent(self, txid, output_n):
         """
         Check if the output with the provided transaction ID and output number is already spent.
@@ -658,10 +1310,13 @@ class Service(object):
         """
         t = self.cache.gettransaction(bytes.fromhex(txid))
         if t and len(t.outputs) > output_n and t.outputs[output_n].spent is not None:
+            self._cache_lookup('isspent', True)
             return t.outputs[output_n].spent
         else:
+            self._cache_lookup('isspent', False)
             return bool(self._provider_execute('isspent', txid, output_n))
 
+    @_single_flight
     def getinfo(self):
         """
         Returns info about the current network. Such as difficulty, latest block, mempool size and network hashrate.
@@ -682,15 +1337,246 @@ class Service(object):
 
         :return Transaction:
         """
-        prev_txs = []
-        for i in t.inputs:
-            if not i.value:
-                if i.prev_txid not in prev_txs and i.prev_txid != 32 * b'\0':
-                    prev_t = self.gettransaction(i.prev_txid.hex())
-                else:
-                    prev_t = [t for t in prev_txs if t.txid == i.prev_txid][0]
-                i.value = prev_t.outputs[i.output_n_int].value
-        return t
+        return self.getinputvalues_many([t])[0]
+
+    def _concurrent(self, method, items, workers=4, ignore_errors=False):
+        """
+        Call Service method for every item concurrently. Every thread uses its own copy of this Service object with a
+        separate cache session. If ignore_errors is True, None is returned for items which raise a ServiceError.
+        """
+        def call(item):
+            srv = copy.copy(self)
+            srv._cache = None
+            try:
+                return getattr(srv, method)(item)
+            except ServiceError:
+                if not ignore_errors:
+                    raise
+                return None
+            finally:
+                if srv._cache is not None and srv._cache.session:
+                    srv._cache.session.close()
+
+        if workers <= 1 or len(items) <= 1:
+            return [call(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(call, items))
+
+    def _getrawtransactions_batch(self, txids):
+        # Get raw transactions with one batch request, returns None if not supported by providers or failed
+        batch_providers = [sp for sp in self.providers if hasattr(getattr(
+            getattr(services, self.providers[sp]['provider']), self.providers[sp]['client_class']),
+            'getrawtransactions')]
+        if batch_providers:
+            try:
+                raw_txs = self._provider_execute('getrawtransactions', txids)
+                if raw_txs and len(raw_txs) == len(txids):
+                    return raw_txs
+            except ServiceError:
+                pass
+        return None
+
+    def _getrawtransactions(self, txids, workers=4, ignore_errors=False):
+        """
+        Get raw transactions from providers with a batch method, or fetch them concurrently if not available.
+        If ignore_errors is True, None is returned for transactions which could not be retrieved.
+        """
+        raw_txs = self._getrawtransactions_batch(txids)
+        if raw_txs is not None:
+            return raw_txs
+        return self._concurrent('_getrawtransaction_provider', txids, workers, ignore_errors)
+
+    def _getrawtransaction_provider(self, txid):
+        return self._provider_execute('getrawtransaction', txid)
+
+    def getinputvalues_many(self, txs, workers=4):
+        """
+        Retrieve values for the inputs of a list of transactions, for instance all transactions in a block.
+
+        Every previous transaction is only retrieved once. Outputs of transactions in the list itself are used
+        first, then the cache is checked. Remaining previous transactions are retrieved as raw transactions with a
+        batch request if supported by the provider. Otherwise, or if this fails, they are retrieved with concurrent
+        :func:`gettransaction` requests, which also store them in the cache.
+
+        :param txs: List of Transaction objects
+        :type txs: list of Transaction
+        :param workers: Number of threads to use for concurrent requests
+        :type workers: int
+
+        :return list of Transaction:
+        """
+        values = {t.txid: {n: o.value for n, o in enumerate(t.outputs)} for t in txs}
+        prev_outputs = {}
+        for t in txs:
+            for i in t.inputs:
+                if not i.value and i.prev_txid != 32 * b'\0':
+                    prev_outputs.setdefault(i.prev_txid.hex(), set()).add(i.output_n_int)
+        prev_txids = [txid for txid in prev_outputs if txid not in values]
+        for txid, output_values in self.cache.getoutputvalues([bytes.fromhex(txid) for txid in prev_txids]).items():
+            # Cache can contain a part of the outputs of a transaction, retrieve transaction if outputs are missing
+            if prev_outputs[txid.hex()].issubset(output_values):
+                values[txid.hex()] = output_values
+        for txid in prev_txids:
+            self._cache_lookup('getinputvalues', txid in values)
+        prev_txids = [txid for txid in prev_txids if txid not in values]
+        if prev_txids:
+            for txid, rawtx in zip(prev_txids, self._getrawtransactions_batch(prev_txids) or []):
+                if rawtx:
+                    prev_t = Transaction.parse_hex(rawtx, strict=self.strict, network=self.network)
+                    values[txid] = {n: o.value for n, o in enumerate(prev_t.outputs)}
+            prev_txids = [txid for txid in prev_txids if txid not in values]
+            for txid, prev_t in zip(prev_txids, self._concurrent('gettransaction', prev_txids, workers, True)):
+                if not prev_t:
+                    raise ServiceError("Could not retrieve previous transaction %s" % txid)
+                values[txid] = {n: o.value for n, o in enumerate(prev_t.outputs)}
+        for t in txs:
+            for i in t.inputs:
+                if not i.value and i.prev_txid != 32 * b'\0':
+                    i.value = values[i.prev_txid.hex()][i.output_n_int]
+            t.update_totals()
+        return txs
+
+
+class MempoolWatcher(object):
+    """
+    Watch the mempool for new transactions to a set of addresses.
+
+    Every poll the list of transaction IDs in the mempool is compared with the previous list, only transactions
+    which are new are retrieved. Raw transactions are requested in batches, or concurrently if the provider does not
+    support batch requests. The outputs of new transactions are matched against the watched addresses.
+
+    Retrieving the full mempool is only supported by local nodes such as bitcoind.
+
+    >>> def payment(t, addresses):
+    ...     print("Incoming transaction %s for %s" % (t.txid, addresses))
+    >>> watcher = MempoolWatcher(addresses=['bc1q...'], on_transaction=payment)  # doctest: +SKIP
+    >>> watcher.start(interval=5)  # doctest: +SKIP
+
+    """
+
+    def __init__(self, addresses=None, network=DEFAULT_NETWORK, service=None, on_transaction=None, on_added=None,
+                 on_removed=None, workers=4, batch_size=500):
+        """
+        Create a new mempool watcher.
+
+        :param addresses: List of addresses to watch
+        :type addresses: list of str
+        :param network: Network name. Ignored if a service object is provided
+        :type network: str, Network
+        :param service: Service object used to retrieve mempool and transactions. Default is a new Service object for specified network
+        :type service: Service
+        :param on_transaction: Called with arguments transaction and list of matching addresses for every new mempool transaction which pays to one of the watched addresses
+        :type on_transaction: callable
+        :param on_added: Called with set of transaction IDs added to the mempool since last poll
+        :type on_added: callable
+        :param on_removed: Called with set of transaction IDs removed from the mempool since last poll, because they are included in a block, replaced or expired
+        :type on_removed: callable
+        :param workers: Number of threads to use for concurrent requests
+        :type workers: int
+        :param batch_size: Number of new transactions to retrieve and process at once
+        :type batch_size: int
+        """
+        self.service = service if service is not None else Service(network=network)
+        self.addresses = set(addresses or [])
+        self.on_transaction = on_transaction
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.workers = workers
+        self.batch_size = batch_size
+        self.txids = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_address(self, address):
+        self.addresses.add(address)
+
+    def remove_address(self, address):
+        self.addresses.discard(address)
+
+    def poll(self):
+        """
+        Compare current mempool with previous poll, retrieve new transactions and match them with watched addresses.
+        On the first poll all transactions in the mempool are new.
+
+        New transactions which could not be retrieved are not marked as known, so they are retrieved again on the
+        next poll if they are still in the mempool.
+
+        :return dict: Dictionary with set of 'added' and 'removed' transaction IDs and a list of 'transactions' to watched addresses
+        """
+        txids = self.service.mempool()
+        if txids is False or txids is None:
+            raise ServiceError("Could not retrieve mempool transactions")
+        current = set(txids)
+        removed = self.txids - current
+        self.txids -= removed
+        if removed and self.on_removed:
+            self.on_removed(removed)
+
+        new = current - self.txids
+        added = set()
+        matched = []
+        try:
+            if not self.addresses:
+                added = new
+            else:
+                new_list = list(new)
+                for i in range(0, len(new_list), self.batch_size):
+                    batch = new_list[i:i + self.batch_size]
+                    for txid, rawtx in zip(batch, self.service._getrawtransactions(batch, self.workers,
+                                                                                    ignore_errors=True)):
+                        if not rawtx:
+                            # Transaction left the mempool or request failed, retry on next poll
+                            _logger.info("Could not retrieve mempool transaction %s" % txid)
+                            continue
+                        t = Transaction.parse_hex(rawtx, strict=False, network=self.service.network)
+                        added.add(txid)
+                        addresses = [o.address for o in t.outputs if o.address in self.addresses]
+                        if addresses:
+                            matched.append(t)
+                            if self.on_transaction:
+                                self.on_transaction(t, addresses)
+        finally:
+            self.txids |= added
+        if added and self.on_added:
+            self.on_added(added)
+        return {'added': added, 'removed': removed, 'transactions': matched}
+
+    def run(self, interval=10):
+        """
+        Poll mempool every 'interval' seconds until :func:`stop` is called. Errors are logged and do not stop the
+        watcher.
+
+        :param interval: Number of seconds between polls
+        :type interval: float
+        """
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                _logger.warning("Error when polling mempool: %s" % e)
+            self._stop.wait(interval)
+
+    def start(self, interval=10):
+        """
+        Run the watcher in a background thread
+
+        :param interval: Number of seconds between polls
+        :type interval: float
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the watcher and wait for the background thread to finish
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
 
 
 class Cache(object):
@@ -705,7 +1591,7 @@ class Cache(object):
 
     """
 
-    def __init__(self, network, db_uri=''):
+    def __init__(self, network, db_uri='', shared=None):
         """
         Open Cache class
 
@@ -713,10 +1599,17 @@ class Cache(object):
         :type network: str, Network
         :param db_uri: Database to use for caching
         :type db_uri: str
+        :param shared: Cache database is shared by multiple processes. Writes are handled by a background writer and committed in batches, so they are not visible immediately. Default is SERVICE_CACHE_SHARED from config
+        :type shared: bool
         """
+        self.db_uri = db_uri
         self.session = None
+        self.writer = None
+        self._writer_job = False
         if SERVICE_CACHING_ENABLED:
-            self.session = DbCache(db_uri=db_uri).session
+            db_cache = DbCache(db_uri=db_uri, shared=shared)
+            self.session = db_cache.session
+            self.writer = db_cache.writer
         self.network = network
 
     def cache_enabled(self):
@@ -737,12 +1630,43 @@ class Cache(object):
         """
         if not self.session:
             return
+        if self._writer_job:
+            # Writer commits all jobs in a batch at once
+            self.session.flush()
+            return
         try:
             self.session.commit()
         except Exception:
             self.session.rollback()
             raise
 
+    def _write(self, method, *args, **kwargs):
+        # Add call to store method to the queue of the background writer of a shared cache database. Arguments are
+        # copied, because the caller can still change objects like transactions before the job is executed
+        args = copy.deepcopy(args)
+        kwargs = copy.deepcopy(kwargs)
+
+        def job(session):
+            cache = copy.copy(self)
+            cache.session = session
+            cache.writer = None
+            cache._writer_job = True
+            getattr(cache, method)(*args, **kwargs)
+        self.writer.put(job)
+
+    def flush(self, timeout=None):
+        """
+        Wait until all writes to a shared cache database are committed. Does nothing if cache is not shared.
+
+        :param timeout: Maximum number of seconds to wait. Default is SERVICE_CACHE_WRITE_FLUSH_TIMEOUT
+        :type timeout: float
+
+        :return bool: False if timeout expired before all writes are committed, otherwise True
+        """
+        if self.writer:
+            return self.writer.flush(timeout)
+        return True
+
     @staticmethod
     def _parse_db_transaction(db_tx):
         t = Transaction(locktime=db_tx.locktime, version=db_tx.version, network=db_tx.network_name,
@@ -843,11 +1767,14 @@ class Cache(object):
                 db_txs = self.session.query(DbCacheTransaction).join(DbCacheTransactionNode). \
                     filter(DbCacheTransactionNode.address == address). \
                     order_by(DbCacheTransaction.block_height, DbCacheTransaction.index).all()
+            blockcount = None
             for db_tx in db_txs:
                 t = self._parse_db_transaction(db_tx)
                 if t:
                     if t.block_height:
-                        t.confirmations = (self.blockcount() - t.block_height) + 1
+                        if blockcount is None:
+                            blockcount = self.blockcount()
+                        t.confirmations = (blockcount - t.block_height) + 1
                     txs.append(t)
                     if len(txs) >= limit:
                         break
@@ -876,8 +1803,8 @@ class Cache(object):
         n_from = (page-1) * limit
         n_to = page * limit
         db_txs = self.session.query(DbCacheTransaction).\
-            filter(DbCacheTransaction.block_height == height, DbCacheTransaction.index >= n_from,
-                   DbCacheTransaction.index < n_to).all()
+            filter(DbCacheTransaction.network_name == self.network.name, DbCacheTransaction.block_height == height,
+                   DbCacheTransaction.index >= n_from, DbCacheTransaction.index < n_to).all()
         txs = []
         for db_tx in db_txs:
             t = self._parse_db_transaction(db_tx)
@@ -885,6 +1812,27 @@ class Cache(object):
                 txs.append(t)
         return txs
 
+    def getoutputvalues(self, txids):
+        """
+        Get output values of transactions from the database cache
+
+        :param txids: List of transaction IDs
+        :type txids: list of bytes
+
+        :return dict: Dictionary with output values per output number, with transaction ID as key
+        """
+        if not self.cache_enabled() or not txids:
+            return {}
+        values = {}
+        for i in range(0, len(txids), 500):
+            qr = self.session.query(DbCacheTransactionNode.txid, DbCacheTransactionNode.index_n,
+                                    DbCacheTransactionNode.value).join(DbCacheTransaction).\
+                filter(DbCacheTransaction.network_name == self.network.name,
+                       DbCacheTransactionNode.is_input.is_(False), DbCacheTransactionNode.txid.in_(txids[i:i + 500]))
+            for txid, index_n, value in qr:
+                values.setdefault(txid, {})[index_n] = value
+        return values
+
     def getrawtransaction(self, txid):
         """
         Get a raw transaction string from the database cache if available
@@ -1026,6 +1974,8 @@ class Cache(object):
         """
         if not self.cache_enabled():
             return
+        if self.writer:
+            return self._write('store_blockcount', blockcount)
         dbvar = DbCacheVars(varname='blockcount', network_name=self.network.name, value=str(blockcount), type='int',
                             expires=datetime.now() + timedelta(seconds=60))
         self.session.merge(dbvar)
@@ -1042,7 +1992,7 @@ class Cache(object):
         :param commit: Commit transaction to the database. Default is True. Can be disabled if a larger number of transactions are added to the cache, so you can commit outside this method.
         :type commit: bool
 
-        :return:
+        :return bool: False if transaction is incomplete and not stored, otherwise None. For a shared cache database the transaction is stored by the background writer, errors when writing are logged and not returned.
         """
         if not self.cache_enabled():
             return
@@ -1057,6 +2007,8 @@ class Cache(object):
             _logger.info("Caching failure tx: One the transaction inputs has value 0")
             return False
         # TODO: Check if inputs / outputs are complete? script, value, prev_txid, sequence, output/input_n
+        if self.writer:
+            return self._write('store_transaction', t, index)
 
         txid = bytes.fromhex(t.txid)
         if self.session.query(DbCacheTransaction).filter_by(txid=txid).count():
@@ -1103,10 +2055,12 @@ class Cache(object):
         :param commit: Commit transaction to database. Default is True. Can be disabled if a larger number of transactions are added to cache, so you can commit outside this method.
         :type commit: bool
 
-        :return:
+        :return bool: False if caching is disabled, otherwise None. For a shared cache database the utxo is stored by the background writer, errors when writing are logged and not returned.
         """
         if not self.cache_enabled():
             return False
+        if self.writer:
+            return self._write('store_utxo', txid, index_n)
         txid = bytes.fromhex(txid)
         result = self.session.query(DbCacheTransactionNode). \
             filter(DbCacheTransactionNode.txid == txid, DbCacheTransactionNode.index_n == index_n,
@@ -1139,6 +2093,8 @@ class Cache(object):
         """
         if not self.cache_enabled():
             return
+        if self.writer:
+            return self._write('store_address', address, last_block, balance, n_utxos, txs_complete, last_txid)
         n_txs = None
         if txs_complete:
             n_txs = len(self.session.query(DbCacheTransaction).join(DbCacheTransactionNode).
@@ -1183,6 +2139,8 @@ class Cache(object):
         """
         if not self.cache_enabled():
             return
+        if self.writer:
+            return self._write('store_estimated_fee', blocks, fee)
         if blocks <= 1:
             varname = 'fee_high'
         elif blocks <= 5:
@@ -1211,6 +2169,8 @@ class Cache(object):
                                             b'\xa2\xa6\xc1r\xb3\xf1\xb6\n\x8c\xe2o':  # Bitcoin genesis block
             _logger.info("Caching failure block: incomplete data")
             return
+        if self.writer:
+            return self._write('store_block', block)
 
         new_block = DbCacheBlock(
             block_hash=block.block_hash, height=block.height, network_name=self.network.name,
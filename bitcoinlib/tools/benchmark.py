@@ -6,6 +6,7 @@
 #
 
 
+import copy
 import time
 import random
 import json
@@ -13,6 +14,10 @@ from bitcoinlib.keys import *
 from bitcoinlib.wallets import *
 from bitcoinlib.transactions import *
 from bitcoinlib.mnemonic import *
+try:
+    from bitcoinlib.services.baseclient import ServiceRecorder
+except ImportError:
+    ServiceRecorder = None
 
 try:
     wallet_method = Wallet
@@ -30,6 +35,7 @@ class Benchmark:
     def __init__(self):
         wallet_delete_if_exists('wallet_multisig_huge', force=True)
         wallet_delete_if_exists('wallet_large', force=True)
+        wallet_delete_if_exists('wallet_replay', force=True)
 
     @staticmethod
     def benchmark_bip38():
@@ -55,6 +61,12 @@ class Benchmark:
         for i in range(0, 1000):
             k = HDKey()
 
+    @staticmethod
+    def benchmark_key_range():
+        if 'key_range' in globals():
+            for secret, public_byte, address in key_range(random.randint(1, 2 ** 255), 1000):
+                pass
+
     @staticmethod
     def benchmark_encoding():
         # Convert very large numbers to and from base58 / bech32
@@ -84,6 +96,25 @@ class Benchmark:
             t.verify()
             assert(t.verified is True)
 
+    @staticmethod
+    def benchmark_transaction_update_spents():
+        # Update spent outputs for a synthetic address history of 50000 transactions
+        address = HDKey(network='testnet').address()
+        input_template = Input(b'\x11' * 32, 0, address=address, network='testnet', value=2500)
+        output_template = Output(1000, address=address, network='testnet')
+        txs = []
+        prev_txid = input_template.prev_txid
+        for i in range(50000):
+            inp = copy.copy(input_template)
+            inp.prev_txid = prev_txid
+            change = copy.copy(output_template)
+            change.output_n = 1
+            t = Transaction([inp], [copy.copy(output_template), change], network='testnet', txid='%064x' % i)
+            prev_txid = bytes.fromhex(t.txid)
+            txs.append(t)
+        transaction_update_spents(txs, address)
+        assert(txs[0].outputs[0].spending_txid == txs[1].txid)
+
     @staticmethod
     def benchmark_wallets_multisig():
         # Create large multisig wallet
@@ -124,6 +155,59 @@ class Benchmark:
         else:
             w.get_key(number_of_keys=n_keys)
 
+    @staticmethod
+    def replay_responses(addresses, funded_every=10, block_height=800000):
+        # Blockstream responses for a wallet where every n-th address received one coinbase output
+        url = 'https://blockstream.info/api/'
+        recorder = ServiceRecorder()
+        recorder.add(recorder.request_key('get', url + 'blocks/tip/height'), 200, str(block_height))
+        for n, address in enumerate(addresses):
+            utxos = []
+            txs = []
+            if not n % funded_every:
+                txid = sha256(address.encode()).hex()
+                status = {'confirmed': True, 'block_height': block_height - n, 'block_time': 1700000000 - n * 600}
+                utxos = [{'txid': txid, 'vout': 0, 'value': 100000 + n, 'status': status}]
+                txs = [{'txid': txid, 'version': 1, 'locktime': 0, 'size': 100, 'weight': 400, 'fee': 0,
+                        'status': status,
+                        'vin': [{'txid': '00' * 32, 'vout': 4294967295, 'is_coinbase': True,
+                                 'scriptsig': '03' + (block_height - n).to_bytes(3, 'little').hex(),
+                                 'sequence': 4294967295}],
+                        'vout': [{'value': 100000 + n, 'scriptpubkey_address': address,
+                                  'scriptpubkey': Output(0, address=address).lock_script.hex()}]}]
+                recorder.add(recorder.request_key('get', url + 'tx/%s/outspend/0' % txid), 200, {'spent': False})
+            recorder.add(recorder.request_key('get', url + 'address/%s/utxo' % address), 200, utxos)
+            recorder.add(recorder.request_key('get', url + 'address/%s/txs' % address), 200, txs)
+        return recorder
+
+    @staticmethod
+    def benchmark_wallets_update_replay(n_keys=200, latency=0):
+        # Update utxo's and transactions of a large wallet with recorded provider responses, no network needed.
+        # Use n_keys=10000 and a latency of 0.05 seconds to simulate a large wallet with a remote provider
+        if ServiceRecorder:
+            kwargs = {}
+            cache_uri = None
+            if 'db_cache_uri' in wallet_method.create.__code__.co_varnames:
+                cache_uri = os.path.join(str(BCL_DATABASE_DIR), 'bitcoinlib_cache.benchmark_replay.sqlite')
+                if os.path.isfile(cache_uri):
+                    os.remove(cache_uri)
+                kwargs['db_cache_uri'] = cache_uri
+            w = wallet_method.create('wallet_replay', network='bitcoin', witness_type='segwit', **kwargs)
+            if not hasattr(w, 'providers'):
+                # Requests can not be limited to the provider with recorded responses
+                return
+            w.providers = ['blockstream']
+            w.get_keys(number_of_keys=n_keys)
+            recorder = Benchmark.replay_responses(w.addresslist())
+            recorder.latency = latency
+            with recorder:
+                w.utxos_update()
+                w.transactions_update()
+            assert (recorder.missing == 0)
+            assert (len(w.utxos()) == len(range(0, n_keys, 10)))
+            if cache_uri:
+                os.remove(cache_uri)
+
     def run(self, only_dict=False):
         start_time = time.time()
         bench_dict = {'version': BITCOINLIB_VERSION}
@@ -25,10 +25,11 @@ import random
 from io import BytesIO
 from bitcoinlib.encoding import *
 # from bitcoinlib.config.opcodes import *
-from bitcoinlib.keys import HDKey, Key, deserialize_address, Address, sign, verify, Signature
+from bitcoinlib.keys import HDKey, Key, deserialize_address, Address, sign, verify, verify_batch, sign_batch, \
+    Signature
 from bitcoinlib.networks import Network
 from bitcoinlib.values import Value, value_to_satoshi
-from bitcoinlib.scripts import Script
+from bitcoinlib.scripts import Script, script_standard_address
 
 _logger = logging.getLogger(__name__)
 
@@ -113,25 +114,21 @@ def transaction_update_spents(txs, address):
 
     :return list of Transaction:
     """
+    # Index spending transaction and input per outpoint, so all outputs can be updated in linear time
     spend_list = {}
     for t in txs:
         for inp in t.inputs:
             if inp.address == address:
-                spend_list.update({(inp.prev_txid.hex(), inp.output_n_int): t})
-    address_inputs = list(spend_list.keys())
+                spend_list[(inp.prev_txid.hex(), inp.output_n_int)] = (t, inp)
     for t in txs:
         for to in t.outputs:
             if to.address != address:
                 continue
-            spent = True if (t.txid, to.output_n) in address_inputs else False
-            txs[txs.index(t)].outputs[to.output_n].spent = spent
-            if spent:
-                spending_tx = spend_list[(t.txid, to.output_n)]
-                spending_index_n = \
-                    [inp for inp in txs[txs.index(spending_tx)].inputs
-                     if inp.prev_txid.hex() == t.txid and inp.output_n_int == to.output_n][0].index_n
-                txs[txs.index(t)].outputs[to.output_n].spending_txid = spending_tx.txid
-                txs[txs.index(t)].outputs[to.output_n].spending_index_n = spending_index_n
+            spending = spend_list.get((t.txid, to.output_n))
+            to.spent = spending is not None
+            if spending:
+                to.spending_txid = spending[0].txid
+                to.spending_index_n = spending[1].index_n
     return txs
 
 
@@ -745,6 +742,10 @@ class Output(object):
     @property
     def address(self):
         if not self._address:
+            standard = script_standard_address(self.lock_script, self.network) if self.lock_script else None
+            if standard and standard[0] == self.script_type:
+                self._address = standard[2]
+                return self._address
             try:
                 address_obj = self.address_obj
             except Exception:
@@ -1198,6 +1199,7 @@ class Transaction(object):
         self.replace_by_fee = replace_by_fee
         self.change = 0
         self.index = index
+        self._segwit_hashes = None
         self.calc_weight_units()
         if self.witness_type not in ['legacy', 'segwit']:
             raise TransactionError("Please specify a valid witness type: legacy or segwit")
@@ -1545,19 +1547,27 @@ class Transaction(object):
         hash_sequence = b'\0' * 32
         hash_outputs = b'\0' * 32
 
-        for i in self.inputs:
-            prevouts_serialized += i.prev_txid[::-1] + i.output_n[::-1]
-            sequence_serialized += i.sequence.to_bytes(4, 'little')
-        if not hash_type & SIGHASH_ANYONECANPAY:
-            hash_prevouts = double_sha256(prevouts_serialized)
-            if (hash_type & 0x1f) != SIGHASH_SINGLE and (hash_type & 0x1f) != SIGHASH_NONE:
-                hash_sequence = double_sha256(sequence_serialized)
-        if (hash_type & 0x1f) != SIGHASH_SINGLE and (hash_type & 0x1f) != SIGHASH_NONE:
-            for o in self.outputs:
-                outputs_serialized += int(o.value).to_bytes(8, 'little')
-                outputs_serialized += varstr(o.lock_script)
-            hash_outputs = double_sha256(outputs_serialized)
-        elif (hash_type & 0x1f) != SIGHASH_SINGLE and sign_id < len(self.outputs):
+        # Hashes of all prevouts, sequences and outputs are the same for every input, reuse them while signing
+        segwit_hashes = self._segwit_hashes
+        all_outputs = (hash_type & 0x1f) != SIGHASH_SINGLE and (hash_type & 0x1f) != SIGHASH_NONE
+        if segwit_hashes is not None and hash_type in segwit_hashes:
+            hash_prevouts, hash_sequence, hash_outputs = segwit_hashes[hash_type]
+        else:
+            for i in self.inputs:
+                prevouts_serialized += i.prev_txid[::-1] + i.output_n[::-1]
+                sequence_serialized += i.sequence.to_bytes(4, 'little')
+            if not hash_type & SIGHASH_ANYONECANPAY:
+                hash_prevouts = double_sha256(prevouts_serialized)
+                if all_outputs:
+                    hash_sequence = double_sha256(sequence_serialized)
+            if all_outputs:
+                for o in self.outputs:
+                    outputs_serialized += int(o.value).to_bytes(8, 'little')
+                    outputs_serialized += varstr(o.lock_script)
+                hash_outputs = double_sha256(outputs_serialized)
+            if segwit_hashes is not None and all_outputs:
+                segwit_hashes[hash_type] = (hash_prevouts, hash_sequence, hash_outputs)
+        if not all_outputs and (hash_type & 0x1f) != SIGHASH_SINGLE and sign_id < len(self.outputs):
             outputs_serialized += int(self.outputs[sign_id].value).to_bytes(8, 'little')
             outputs_serialized += varstr(self.outputs[sign_id].lock_script)
             hash_outputs = double_sha256(outputs_serialized)
@@ -1673,37 +1683,67 @@ class Transaction(object):
             witness_data += int_to_varbyteint(len(i.witnesses)) + b''.join([bytes(varstr(w)) for w in i.witnesses])
         return witness_data
 
-    def verify(self):
+    def _verify_batch_items(self):
         """
-        Verify all inputs of a transaction, check if signatures match public key.
-
-        Does not check if UTXO is valid or has already been spent
+        Collect signatures to verify for all inputs of this transaction. Inputs with a single signature and key are
+        returned as list of (transaction_hash, signature, key) tuples to verify with :func:`verify_batch`, other
+        inputs such as multisig inputs are verified directly.
 
-        :return bool: True if enough signatures provided and if all signatures are valid
+        :return tuple: List of inputs and list of items to verify, or (None, None) if verification failed
         """
-
-        self.verified = False
+        inputs = []
+        items = []
         for inp in self.inputs:
             try:
                 transaction_hash = self.signature_hash(inp.index_n, inp.hash_type, inp.witness_type)
             except TransactionError as e:
                 _logger.info("Could not create transaction hash. Error: %s" % e)
-                return False
+                return None, None
             if not transaction_hash:
                 _logger.info("Need at least 1 key to create segwit transaction signature")
+                return None, None
+            if inp.script_type != 'coinbase' and inp.sigs_required == 1 and len(inp.signatures) == 1 and \
+                    len(inp.keys) == 1:
+                inputs.append(inp)
+                items.append((transaction_hash, inp.signatures[0], inp.keys[0]))
+            elif not inp.verify(transaction_hash):
+                return None, None
+        return inputs, items
+
+    def verify(self, workers=1):
+        """
+        Verify all inputs of a transaction, check if signatures match public key.
+
+        Does not check if UTXO is valid or has already been spent
+
+        :param workers: Number of worker processes used to verify large number of signatures. Passed to :func:`verify_batch`. Default is 1 to verify in the current process, use None to use the number of CPU's.
+        :type workers: int
+
+        :return bool: True if enough signatures provided and if all signatures are valid
+        """
+
+        self.verified = False
+        inputs, items = self._verify_batch_items()
+        if inputs is None:
+            return False
+        for inp, valid in zip(inputs, verify_batch(items, workers)):
+            if not valid:
+                _logger.info("Invalid signature found for transaction input %d" % inp.index_n)
                 return False
-            self.verified = inp.verify(transaction_hash)
-            if not self.verified:
-                return False
+            inp.valid = True
 
         self.verified = True
         return True
 
     def sign(self, keys=None, index_n=None, multisig_key_n=None, hash_type=SIGHASH_ALL, fail_on_unknown_key=True,
-             replace_signatures=False):
+             replace_signatures=False, workers=1):
         """
         Sign the transaction input with provided private key
 
+        All signature hashes are calculated first and then signed in one batch, for large transactions you can use
+        the workers argument to create the signatures in multiple processes. Signatures are deterministic, so the
+        signed transaction is the same for any number of workers.
+
         :param keys: A private key or list of private keys
         :type keys: HDKey, Key, bytes, list
         :param index_n: Index of transaction input. Leave empty to sign all inputs
@@ -1716,6 +1756,8 @@ class Transaction(object):
         :type fail_on_unknown_key: bool
         :param replace_signatures: Replace signature with new one if already signed.
         :type replace_signatures: bool
+        :param workers: Number of worker processes to create signatures. Default is 1 to sign in the current process, use None to use the number of CPU's. Worker processes are only used for large transactions.
+        :type workers: int
 
         :return None:
         """
@@ -1733,47 +1775,58 @@ class Transaction(object):
         elif not isinstance(keys, list):
             keys = [keys]
 
-        for tid in tids:
-            n_signs = 0
-            tid_keys = [k if isinstance(k, (HDKey, Key)) else Key(k, compressed=self.inputs[tid].compressed)
-                        for k in keys]
-            for k in self.inputs[tid].keys:
-                if k.is_private and k not in tid_keys:
-                    tid_keys.append(k)
-            # If input does not contain any keys, try using provided keys
-            if not self.inputs[tid].keys:
-                self.inputs[tid].keys = tid_keys
-                self.inputs[tid].update_scripts(hash_type=hash_type)
-            if self.inputs[tid].script_type == 'coinbase':
-                raise TransactionError("Can not sign coinbase transactions")
-            pub_key_list = [k.public_byte for k in self.inputs[tid].keys]
-            n_total_sigs = len(self.inputs[tid].keys)
-            sig_domain = [''] * n_total_sigs
-
-            txid = self.signature_hash(tid, hash_type, self.inputs[tid].witness_type)
-            for key in tid_keys:
-                # Check if signature signs known key and is not already in list
-                if key.public_byte not in pub_key_list:
-                    if fail_on_unknown_key:
-                        raise TransactionError("This key does not sign any known key: %s" % key.public_hex)
-                    else:
-                        _logger.info("This key does not sign any known key: %s" % key.public_hex)
-                        continue
-                if not replace_signatures and key in [x.public_key for x in self.inputs[tid].signatures]:
-                    _logger.info("Key %s already signed" % key.public_hex)
+        # Determine signature hashes and keys to sign for each input
+        sign_plan = []
+        sign_items = []
+        self._segwit_hashes = {}
+        try:
+            for tid in tids:
+                tid_keys = [k if isinstance(k, (HDKey, Key)) else Key(k, compressed=self.inputs[tid].compressed)
+                            for k in keys]
+                for k in self.inputs[tid].keys:
+                    if k.is_private and k not in tid_keys:
+                        tid_keys.append(k)
+                # If input does not contain any keys, try using provided keys
+                if not self.inputs[tid].keys:
+                    self.inputs[tid].keys = tid_keys
+                    self.inputs[tid].update_scripts(hash_type=hash_type)
+                if self.inputs[tid].script_type == 'coinbase':
+                    raise TransactionError("Can not sign coinbase transactions")
+                pub_key_list = [k.public_byte for k in self.inputs[tid].keys]
+
+                txid = self.signature_hash(tid, hash_type, self.inputs[tid].witness_type)
+                sig_positions = []
+                for key in tid_keys:
+                    # Check if signature signs known key and is not already in list
+                    if key.public_byte not in pub_key_list:
+                        if fail_on_unknown_key:
+                            raise TransactionError("This key does not sign any known key: %s" % key.public_hex)
+                        else:
+                            _logger.info("This key does not sign any known key: %s" % key.public_hex)
+                            continue
+                    if not replace_signatures and key in [x.public_key for x in self.inputs[tid].signatures]:
+                        _logger.info("Key %s already signed" % key.public_hex)
+                        break
+
+                    if not key.private_byte:
+                        raise TransactionError("Please provide a valid private key to sign the transaction")
+                    sig_positions.append(pub_key_list.index(key.public_byte))
+                    sign_items.append((txid, key))
+
+                if not sig_positions:
                     break
+                sign_plan.append((tid, pub_key_list, sig_positions))
+        finally:
+            self._segwit_hashes = None
 
-                if not key.private_byte:
-                    raise TransactionError("Please provide a valid private key to sign the transaction")
-                sig = sign(txid, key, hash_type=hash_type)
-                newsig_pos = pub_key_list.index(key.public_byte)
-                sig_domain[newsig_pos] = sig
-                n_signs += 1
+        signatures = iter(sign_batch(sign_items, hash_type=hash_type, workers=workers))
 
-            if not n_signs:
-                break
+        # Place new and already known signatures on correct position and update scripts
+        for tid, pub_key_list, sig_positions in sign_plan:
+            sig_domain = [''] * len(self.inputs[tid].keys)
+            for newsig_pos in sig_positions:
+                sig_domain[newsig_pos] = next(signatures)
 
-            # Add already known signatures on correct position
             n_sigs_to_insert = len(self.inputs[tid].signatures)
             for sig in self.inputs[tid].signatures:
                 if not sig.public_key:
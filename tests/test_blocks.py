@@ -20,7 +20,12 @@
 
 import unittest
 import pickle
+import shutil
+import sqlite3
+import tempfile
 from bitcoinlib.blocks import *
+from bitcoinlib.keys import HDKey
+from bitcoinlib.transactions import Input, Output
 from tests.test_custom import CustomAssertions
 
 
@@ -206,6 +211,16 @@ class TestBlocks(unittest.TestCase, CustomAssertions):
                                b.serialize)
         self.assertListEqual(b.version_bips(), ['BIP109'])
 
+    def test_block_verify(self):
+        b = Block.parse_bytes(self.rb250000, parse_transactions=True, limit=25)
+        b.tx_count = len(b.transactions)
+        self.assertTrue(b.verify(workers=1))
+        self.assertTrue(all([t.verified for t in b.transactions]))
+        b.transactions[5].inputs[0].signatures[0] = b.transactions[6].inputs[0].signatures[0]
+        self.assertFalse(b.verify(workers=1))
+        self.assertFalse(b.transactions[5].verify())
+        self.assertFalse(Block.parse_bytes(self.rb250000, limit=25).verify())
+
     def test_block_parse_transaction_dict(self):
         b = Block.parse_bytes(self.rb722010, parse_transactions=False, height=722010)
         tx_dict = b.parse_transactions_dict()
@@ -218,3 +233,339 @@ class TestBlocks(unittest.TestCase, CustomAssertions):
             self.assertEqual(tx['index'], i)
             assert(tx['txid'].hex() == b.transactions[i].txid)
             i += 1
+
+
+class TestBlockHeaderStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'headers.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def _mine_headers(prev_hash, n, bits=0x207fffff, start_time=1600000000):
+        # Create chain of headers with a low difficulty target
+        headers = []
+        for i in range(n):
+            nonce = 0
+            while True:
+                header = (4).to_bytes(4, 'little') + prev_hash[::-1] + bytes(32) + \
+                         (start_time + i * 600).to_bytes(4, 'little') + bits.to_bytes(4, 'little') + \
+                         nonce.to_bytes(4, 'little')
+                block_hash = double_sha256(header)[::-1]
+                if int.from_bytes(block_hash, 'big') < Block.bits_to_target(bits.to_bytes(4, 'big')):
+                    break
+                nonce += 1
+            headers.append(header)
+            prev_hash = block_hash
+        return headers
+
+    def test_block_header_store_genesis(self):
+        genesis = bytes.fromhex(
+            '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617'
+            'fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c')
+        block1 = bytes.fromhex(
+            '010000006fe28c0ab6f1b372c1a6a246ae63f74f931e8365e15a089c68d6190000000000982051fd1e4ba744bbbe680e1fee14677'
+            'ba1a3c3540bf7b1cdb606e857233e0e61bc6649ffff001d01e36299')
+        with BlockHeaderStore(self.filename) as store:
+            self.assertIsNone(store.tip_height)
+            self.assertEqual(store.append([genesis, Block.parse_bytes(block1 + b'\0')]), 2)
+            self.assertEqual(store.tip_height, 1)
+            self.assertEqual(store.block_hash(0).hex(),
+                             '000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f')
+            self.assertEqual(store.height('00000000839a8e6886ab5951d76f411475428afc90947ee320161bbf18eb6048'), 1)
+            self.assertIsNone(store.height(bytes(32)))
+            b = store.block(1)
+            self.assertTrue(b.check_proof_of_work())
+            self.assertEqual(b.nonce_int, 2573394689)
+            self.assertRaisesRegex(IndexError, "Block height 2 not in header store", store.header, 2)
+            self.assertRaisesRegex(ValueError, "does not link to previous block", store.append, block1)
+            self.assertEqual(len(store), 2)
+
+    def test_block_header_store_bulk(self):
+        headers = self._mine_headers(bytes(32), 500)
+        with BlockHeaderStore(self.filename, start_height=1000, network='testnet') as store:
+            self.assertEqual(store.append(headers[:200]), 200)
+            self.assertEqual(store.append(headers[200:]), 300)
+        with BlockHeaderStore(self.filename, start_height=1000, network='testnet') as store:
+            self.assertEqual(len(store), 500)
+            self.assertEqual(store.tip_height, 1499)
+            self.assertIsNone(store.validate())
+            self.assertEqual(store.header(1250), headers[250])
+            self.assertEqual(store.height(double_sha256(headers[499])[::-1]), 1499)
+            self.assertEqual(store.block(1499).prev_block, double_sha256(headers[498])[::-1])
+
+            invalid = self._mine_headers(store.block_hash(1499), 1)[0]
+            invalid = invalid[:72] + (0x1d00ffff).to_bytes(4, 'little') + invalid[76:]
+            self.assertRaisesRegex(ValueError, "is not below target", store.append, invalid)
+            self.assertEqual(store.append(invalid, validate=False), 1)
+            self.assertEqual(store.validate(), 1500)
+
+    def test_block_header_store_start_height(self):
+        headers = self._mine_headers(bytes(32), 3)
+        with BlockHeaderStore(self.filename, start_height=1000, network='testnet') as store:
+            store.append(headers)
+        with BlockHeaderStore(self.filename, network='testnet') as store:
+            self.assertEqual(store.start_height, 1000)
+            self.assertEqual(store.tip_height, 1002)
+        self.assertRaisesRegex(ValueError, "starts at height 1000, not at 0", BlockHeaderStore, self.filename,
+                               start_height=0, network='testnet')
+        self.assertRaisesRegex(ValueError, "contains headers for network testnet, not bitcoin", BlockHeaderStore,
+                               self.filename, network='bitcoin')
+        other = os.path.join(self.tmpdir, 'other.dat')
+        with open(other, 'wb') as f:
+            f.write(headers[0] * 2)
+        self.assertRaisesRegex(ValueError, "is not a block header store", BlockHeaderStore, other)
+
+    def test_block_header_store_incomplete_header(self):
+        headers = self._mine_headers(bytes(32), 4)
+        with BlockHeaderStore(self.filename, network='testnet') as store:
+            store.append(headers[:2])
+        with open(self.filename, 'ab') as f:
+            f.write(headers[2][:30])
+        with BlockHeaderStore(self.filename, network='testnet') as store:
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.append(headers[2:]), 2)
+        with BlockHeaderStore(self.filename, network='testnet') as store:
+            self.assertEqual(len(store), 4)
+            self.assertIsNone(store.validate())
+            self.assertEqual(store.header(3), headers[3])
+            self.assertEqual(store.height(double_sha256(headers[3])[::-1]), 3)
+
+
+class TestBlockFileReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.blocks_dir = os.path.join(self.tmpdir, 'blocks')
+        os.mkdir(self.blocks_dir)
+        self.index_filename = os.path.join(self.tmpdir, 'blkindex.sqlite')
+        self.genesis = bytes.fromhex(
+            '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3'
+            'e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c010100000001000000000000000000'
+            '0000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d657320303'
+            '32f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f7574'
+            '20666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03'
+            '909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000')
+        genesis_hash = double_sha256(self.genesis[:80])[::-1]
+        self.chain = [self.genesis] + [h + b'\0' for h in TestBlockHeaderStore._mine_headers(genesis_hash, 20)]
+        self.fork = TestBlockHeaderStore._mine_headers(double_sha256(self.chain[5][:80])[::-1], 2,
+                                                       start_time=1700000000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_block_file(self, file_n, blocks, xor_key=b'', padding=0, mode='wb'):
+        filename = os.path.join(self.blocks_dir, 'blk%05d.dat' % file_n)
+        offset = os.path.getsize(filename) if mode == 'ab' else 0
+        data = b''.join([b'\xf9\xbe\xb4\xd9' + len(b).to_bytes(4, 'little') + b for b in blocks])
+        from bitcoinlib.blocks import _xor_bytes
+        with open(filename, mode) as f:
+            f.write(_xor_bytes(data + b'\0' * padding, xor_key, offset))
+
+    def test_block_file_reader(self):
+        self._write_block_file(0, self.chain[:8] + [self.fork[0] + b'\0'], padding=100)
+        self._write_block_file(1, [self.chain[10], self.chain[9], self.chain[8]] + self.chain[11:])
+        with BlockFileReader(self.blocks_dir, self.index_filename, workers=1) as reader:
+            self.assertEqual(len(reader), 22)
+            self.assertEqual(len(reader.main_chain()), 21)
+            self.assertEqual(len(list(reader.blocks())), 22)
+            blocks = list(reader.blocks_by_height())
+            self.assertListEqual([b.height for b in blocks], list(range(21)))
+            self.assertListEqual([b.serialize_header() for b in blocks], [b[:80] for b in self.chain])
+            self.assertEqual(blocks[0].block_hash.hex(),
+                             '000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f')
+            b = reader.block('000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f',
+                             parse_transactions=True)
+            self.assertEqual(b.transactions[0].txid,
+                             '4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b')
+            self.assertEqual(len(list(reader.blocks_by_height(start=18))), 3)
+            self.assertRaisesRegex(ValueError, "not found in block files", reader.raw_block, bytes(32))
+
+        self._write_block_file(1, [self.fork[1] + b'\0'], mode='ab')
+        with BlockFileReader(self.blocks_dir, self.index_filename, workers=1) as reader:
+            self.assertEqual(len(reader), 23)
+            self.assertEqual(reader.update_index(), 0)
+        db = sqlite3.connect(self.index_filename)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0], 23)
+        db.close()
+
+        # Index of other blocks directory is not used
+        other_dir = os.path.join(self.tmpdir, 'blocks2')
+        os.mkdir(other_dir)
+        shutil.copy(os.path.join(self.blocks_dir, 'blk00000.dat'), other_dir)
+        with BlockFileReader(other_dir, self.index_filename, workers=1) as reader:
+            self.assertEqual(len(reader), 9)
+
+    def test_block_file_reader_xor_parallel(self):
+        xor_key = bytes.fromhex('a1b2c3d4e5f60718')
+        with open(os.path.join(self.blocks_dir, 'xor.dat'), 'wb') as f:
+            f.write(xor_key)
+        self._write_block_file(0, self.chain[:11], xor_key, padding=20)
+        self._write_block_file(1, self.chain[11:], xor_key)
+        with BlockFileReader(self.blocks_dir, self.index_filename, workers=2) as reader:
+            self.assertEqual(reader.xor_key, xor_key)
+            self.assertListEqual([reader.raw_block(h) for h in reader.main_chain()], self.chain)
+
+
+class TestUtxoSet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.key = HDKey('tprv8ZgxMBicQKsPd1Q44tfDiZC98iYouKRC2CzjT3HGt1yYw2zuX2awTotzGAZQEAU9bi2M5MCj8iedP9MREPjUgpDEB'
+                         'wBgGi2C8eK5zNYeiX8', witness_type='segwit', network='testnet')
+        self.key2 = HDKey(witness_type='legacy', network='testnet')
+        address = self.key.address()
+
+        cb1 = self._coinbase(1, 5000000000, address)
+        t1 = Transaction([Input(cb1.txid, 0, keys=self.key, value=5000000000, network='testnet')],
+                         [Output(4999990000, address=self.key2.address(), network='testnet'),
+                          Output(0, lock_script=b'\x6a\x04test', network='testnet')], network='testnet')
+        t1.sign()
+        t1 = Transaction.parse(t1.raw(), network='testnet')
+        t2 = Transaction([Input(t1.txid, 0, keys=self.key2, witness_type='legacy', network='testnet')],
+                         [Output(4999980000, address=address, network='testnet')], witness_type='legacy',
+                         network='testnet')
+        t2.inputs[0].value = 4999990000
+        t2.sign()
+        t2 = Transaction.parse(t2.raw(), network='testnet')
+        self.txs = [cb1, t1, t2]
+        self.block1 = self._block(bytes(32), [cb1], 1)
+        self.block2 = self._block(Block.parse_bytes(self.block1).block_hash, [self._coinbase(2, 5000000000, address),
+                                  t1, t2], 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def _coinbase(height, value, address):
+        inp = Input(b'\0' * 32, 0xffffffff, unlocking_script=b'\x03' + height.to_bytes(3, 'little'),
+                    script_type='coinbase', network='testnet')
+        return Transaction([inp], [Output(value, address=address, network='testnet')], coinbase=True,
+                           network='testnet')
+
+    @staticmethod
+    def _block(prev_hash, transactions, n):
+        header = TestBlockHeaderStore._mine_headers(prev_hash, 1, start_time=1600000000 + n * 600)[0]
+        return header + int_to_varbyteint(len(transactions)) + b''.join([t.raw() for t in transactions])
+
+    def test_utxo_set_apply_and_verify(self):
+        utxo_set = UtxoSet()
+        self.assertEqual(utxo_set.apply_block(Block.parse_bytes(self.block1, network='testnet'), verify=True,
+                                              workers=1), 0)
+        self.assertEqual(len(utxo_set), 1)
+        self.assertEqual(utxo_set.get(self.txs[0].txid, 0)[0], 5000000000)
+        b2 = Block.parse_bytes(self.block2, network='testnet')
+        self.assertEqual(utxo_set.apply_block(b2, verify=True, workers=1), 1)
+        self.assertEqual(b2.transactions[1].inputs[0].value, 5000000000)
+        self.assertTrue(all([t.verified for t in b2.transactions]))
+        self.assertEqual(len(utxo_set), 2)
+        self.assertIsNone(utxo_set.get(self.txs[1].txid, 0))
+        self.assertIsNone(utxo_set.get(self.txs[1].txid, 1))
+        self.assertEqual(utxo_set.get(self.txs[2].txid, 0), (4999980000, self.txs[2].outputs[0].lock_script, 1, False))
+
+        self.assertEqual(utxo_set.undo_block(), b2.block_hash)
+        self.assertEqual(utxo_set.height, 0)
+        self.assertEqual(len(utxo_set), 1)
+        self.assertTrue(utxo_set.get(self.txs[0].txid, 0))
+        self.assertRaisesRegex(ValueError, "does not follow last block", utxo_set.apply_block,
+                               Block.parse_bytes(self.block1, network='testnet'))
+
+    def test_utxo_set_invalid_block(self):
+        utxo_set = UtxoSet()
+        self.assertRaisesRegex(ValueError, "spent in transaction .* not found in UTXO set", utxo_set.apply_block,
+                               Block.parse_bytes(self.block2, network='testnet'))
+        self.assertEqual(len(utxo_set), 0)
+        utxo_set.apply_block(Block.parse_bytes(self.block1, network='testnet'))
+        b2 = Block.parse_bytes(self.block2, network='testnet', parse_transactions=True)
+        b2.transactions[2].inputs[0].signatures[0] = b2.transactions[1].inputs[0].signatures[0]
+        self.assertRaisesRegex(ValueError, "contains invalid signatures", utxo_set.apply_block, b2, verify=True,
+                               workers=1)
+        self.assertEqual(len(utxo_set), 1)
+        self.assertEqual(utxo_set.height, 0)
+
+    def test_utxo_set_database(self):
+        filename = os.path.join(self.tmpdir, 'utxos.sqlite')
+        with UtxoSet(filename, max_memory_items=0) as utxo_set:
+            utxo_set.apply_block(Block.parse_bytes(self.block1, network='testnet'))
+            utxo_set.apply_block(Block.parse_bytes(self.block2, network='testnet'))
+            utxo_set.undo_block()
+            self.assertEqual(len(utxo_set), 1)
+            utxo_set.apply_block(Block.parse_bytes(self.block2, network='testnet'))
+        with UtxoSet(filename) as utxo_set:
+            self.assertEqual(utxo_set.height, 1)
+            self.assertEqual(len(utxo_set), 2)
+            t = Transaction.parse(self.txs[2].raw(), network='testnet')
+            self.assertEqual(utxo_set.fill_inputs(t), 0)
+            t = Transaction([Input(self.txs[2].txid, 0, network='testnet')], network='testnet')
+            self.assertEqual(utxo_set.fill_inputs(t), 1)
+            self.assertEqual(t.inputs[0].value, 4999980000)
+
+    def test_utxo_set_duplicate_coinbase(self):
+        # Block with the same coinbase transaction as the previous block, possible before BIP30
+        block1 = Block.parse_bytes(self.block1, network='testnet')
+        block_dup = self._block(block1.block_hash, [self.txs[0]], 2)
+        for filename in [None, os.path.join(self.tmpdir, 'utxos_dup.sqlite')]:
+            with UtxoSet(filename, max_memory_items=0) as utxo_set:
+                utxo_set.apply_block(Block.parse_bytes(self.block1, network='testnet'))
+                utxo_set.flush()
+                utxo_set.apply_block(Block.parse_bytes(block_dup, network='testnet'))
+                self.assertEqual(len(utxo_set), 1)
+                self.assertEqual(utxo_set.get(self.txs[0].txid, 0)[2], 1)
+                utxo_set.undo_block()
+                self.assertEqual(len(utxo_set), 1)
+                self.assertEqual(utxo_set.get(self.txs[0].txid, 0),
+                                 (5000000000, self.txs[0].outputs[0].lock_script, 0, True))
+                self.assertListEqual(utxo_set.spent_scripts(), [])
+
+    def test_utxo_set_block_filter(self):
+        utxo_set = UtxoSet()
+        utxo_set.apply_block(Block.parse_bytes(self.block1, network='testnet'))
+        b2 = Block.parse_bytes(self.block2, network='testnet')
+        utxo_set.apply_block(b2)
+        spent_scripts = utxo_set.spent_scripts()
+        self.assertListEqual(spent_scripts, [self.txs[0].outputs[0].lock_script, self.txs[1].outputs[0].lock_script])
+        bf = BlockFilter.from_block(b2, spent_scripts)
+        self.assertEqual(bf.n, 2)
+        self.assertTrue(bf.match(self.txs[1].outputs[0].lock_script))
+        self.assertFalse(bf.match(self.txs[1].outputs[1].lock_script))
+
+
+class TestBlockFilter(unittest.TestCase):
+
+    def test_block_filter_testnet_genesis(self):
+        # BIP158 test vector: testnet genesis block
+        raw_block = bytes.fromhex(
+            '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3'
+            'e67768f617fc81bc3888a51323a9fb8aa4b1e5e4adae5494dffff001d1aa4ae18010100000001000000000000000000'
+            '0000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d657320303'
+            '32f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f7574'
+            '20666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03'
+            '909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000')
+        b = Block.parse_bytes(raw_block, network='testnet')
+        self.assertEqual(b.block_hash.hex(), '000000000933ea01ad0ee984209779baaec3ced90fa3f408719526f8d77f4943')
+        bf = BlockFilter.from_block(b)
+        self.assertEqual(bf.filter_bytes.hex(), '019dfca8')
+        self.assertEqual(bf.header().hex(), '21584579b7eb08997773e5aeff3a7f932700042d0ed2a6129012b7d7ae81b750')
+        bf2 = BlockFilter('019dfca8', b.block_hash)
+        self.assertTrue(bf2.match(b.transactions[0].outputs[0].lock_script))
+        self.assertFalse(bf2.match(b'\x00\x14' + bytes(20)))
+
+    def test_block_filter_items(self):
+        block_hash = bytes.fromhex('0000000000000000000154ba9d02ddd6cee0d71d1ea232753e02c9ac6affd709')
+        scripts = [b'\x00\x14' + i.to_bytes(20, 'big') for i in range(1000)]
+        bf = BlockFilter.from_items(scripts, block_hash)
+        self.assertEqual(bf.n, 1000)
+        self.assertEqual(bf.filter_hash().hex(), 'f9dce69cf26302207327db7ede28794e185b94b603140c1b65d81c3ed69a67b8')
+        bf2 = BlockFilter(bf.filter_bytes, block_hash)
+        self.assertListEqual(bf2.values, bf.values)
+        self.assertTrue(bf2.match_any([b'\x00\x14' + bytes(19) + b'\xff', scripts[500]]))
+        others = [b'\x00\x20' + i.to_bytes(32, 'big') for i in range(1000)]
+        self.assertFalse(bf2.match_any(others))
+        empty = BlockFilter.from_items([], block_hash)
+        self.assertEqual(empty.filter_bytes, b'\x00')
+        self.assertFalse(empty.match_any(scripts))
+        self.assertRaisesRegex(ValueError, "unexpected end of data", getattr,
+                               BlockFilter(bf.filter_bytes[:100], block_hash), 'values')
@@ -19,11 +19,15 @@
 #
 
 import unittest
+import multiprocessing
 from bitcoinlib.db import *
 from bitcoinlib.db_cache import *
 from bitcoinlib.wallets import Wallet, WalletError, WalletTransaction
-from bitcoinlib.transactions import Input, Output
-from bitcoinlib.services.services import Service
+from bitcoinlib.transactions import Transaction, Input, Output
+from bitcoinlib.services.services import Service, Cache
+from bitcoinlib.networks import Network
+from bitcoinlib.keys import Key
+from sqlalchemy import event, inspect
 try:
     try:
         import mysql.connector
@@ -107,6 +111,26 @@ class TestDb(unittest.TestCase):
             self.assertRaisesRegex(Exception, "", srv.gettransaction,
                                    '68104dbd6819375e7bdf96562f89290b41598df7b002089ecdd3c8d999025b13')
 
+    def test_database_cache_many_sessions(self):
+        if os.getenv('UNITTEST_DATABASE') == 'mysql':
+            self.skipTest('MySQL does not allow indexing on LargeBinary fields, so caching is not possible')
+        # Open sessions of live Cache and Service objects must not exhaust the connection pool
+        caches = []
+        for n in range(25):
+            cache = Cache(Network('bitcoin'), db_uri=self.database_cache_uri)
+            cache.getaddress('address_%d' % n)
+            caches.append(cache)
+        services = []
+        for n in range(20):
+            srv = Service(network='bitcoin', cache_uri=self.database_cache_uri)
+            srv.cache.blockcount()
+            services.append(srv)
+        caches[0].store_blockcount(800000)
+        self.assertEqual(caches[-1].blockcount(never_expires=True), 800000)
+        self.assertEqual(services[-1].cache.blockcount(never_expires=True), 800000)
+        for cache in caches + [srv.cache for srv in services]:
+            cache.session.close()
+
     def test_database_transaction_integers(self):
         db = Db(self.database_uri)
         w = Wallet.create('StrangeTransactions', account_id=0x7fffffff, db_uri=db.db_uri)
@@ -119,5 +143,210 @@ class TestDb(unittest.TestCase):
         self.assertTrue(wt.store())
 
 
+class TestDbCacheIndexes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if os.getenv('UNITTEST_DATABASE'):
+            raise unittest.SkipTest('Query plans are only checked for SQLite cache databases')
+        cls.database_cache_uri = database_init('bitcoinlib_cache_indexes_tmp')
+        cls.cache = Cache(Network('bitcoin'), db_uri=cls.database_cache_uri)
+        cls.addresses = [Key(n + 1).address() for n in range(200)]
+        session = cls.cache.session
+        for n in range(4000):
+            txid = n.to_bytes(32, 'big')
+            network_name = 'bitcoin' if n % 4 else 'testnet'
+            session.add(DbCacheTransaction(txid=txid, block_height=100000 + n // 10, index=n % 10,
+                                           network_name=network_name, date=datetime.now(timezone.utc)))
+            session.add(DbCacheTransactionNode(txid=txid, index_n=0, is_input=True, value=1000,
+                                               address=cls.addresses[(n + 1) % 200], ref_txid=b'\x00' * 32,
+                                               ref_index_n=0, script=b''))
+            session.add(DbCacheTransactionNode(txid=txid, index_n=0, is_input=False, value=1000, spent=bool(n % 3),
+                                               address=cls.addresses[n % 200], script=b''))
+        session.commit()
+        session.execute(text('ANALYZE'))
+        session.commit()
+
+    def query_plan(self, method, *args):
+        statements = []
+        engine = self.cache.session.get_bind()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            method(*args)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        plan = []
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan += [r[-1] for r in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+        return plan
+
+    def assertNoTableScans(self, plan):
+        self.assertTrue(plan)
+        for detail in plan:
+            self.assertNotRegex(detail, r'^SCAN cache_transactions(_node)?\b')
+
+    def test_database_cache_indexes_getutxos(self):
+        plan = self.query_plan(self.cache.getutxos, self.addresses[10])
+        self.assertNoTableScans(plan)
+        self.assertIn('ix_cache_transactions_node_address_is_input_spent', ' '.join(plan))
+
+    def test_database_cache_indexes_gettransactions(self):
+        self.cache.store_address(self.addresses[10], last_block=200000)
+        self.assertNoTableScans(self.query_plan(self.cache.gettransactions, self.addresses[10]))
+        self.assertNoTableScans(self.query_plan(self.cache.gettransactions, self.addresses[10],
+                                                (1210).to_bytes(32, 'big')))
+
+    def test_database_cache_indexes_getblocktransactions(self):
+        plan = self.query_plan(self.cache.getblocktransactions, 100100, 1, 5)
+        self.assertNoTableScans(plan)
+        self.assertIn('ix_cache_transactions_network_name_block_height_index', ' '.join(plan))
+
+    def test_database_cache_indexes_migration(self):
+        engine = self.cache.session.get_bind()
+        with engine.begin() as conn:
+            conn.execute(text('DROP INDEX ix_cache_transactions_node_address_is_input_spent'))
+            conn.execute(text('DROP INDEX ix_cache_transactions_network_name_block_height_index'))
+            # Address index of older versions
+            conn.execute(text('CREATE INDEX ix_cache_transactions_node_address ON cache_transactions_node (address)'))
+        self.assertEqual(sorted(add_missing_indexes(engine)),
+                         ['ix_cache_transactions_network_name_block_height_index',
+                          'ix_cache_transactions_node_address_is_input_spent'])
+        self.assertNotIn('ix_cache_transactions_node_address',
+                         [ix['name'] for ix in inspect(engine).get_indexes('cache_transactions_node')])
+        self.assertEqual(add_missing_indexes(engine), [])
+
+
+def _shared_cache_worker(db_uri, worker_id, n, errors):
+    try:
+        cache = Cache(Network('bitcoin'), db_uri=db_uri, shared=True)
+        for i in range(n):
+            cache.store_address('address_%d_%d' % (worker_id, i), last_block=i, balance=i)
+            cache.getaddress('address_%d_%d' % ((worker_id + 1) % 4, i))
+            cache.blockcount()
+        cache.flush()
+        errors.put(cache.writer.errors)
+    except Exception as e:
+        errors.put(str(e))
+
+
+class TestDbCacheShared(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if os.getenv('UNITTEST_DATABASE'):
+            raise unittest.SkipTest('Shared cache test only for SQLite cache databases')
+        cls.database_cache_uri = database_init('bitcoinlib_cache_shared_tmp')
+
+    def test_database_cache_shared_wal(self):
+        cache = Cache(Network('bitcoin'), db_uri=self.database_cache_uri, shared=True)
+        self.assertEqual(cache.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+        self.assertIsInstance(cache.writer, DbCacheWriter)
+        self.assertIs(Cache(Network('bitcoin'), db_uri=self.database_cache_uri, shared=True).writer, cache.writer)
+        self.assertIsNone(Cache(Network('bitcoin'), db_uri=self.database_cache_uri, shared=False).writer)
+
+    def test_database_cache_shared_batch_writes(self):
+        cache = Cache(Network('testnet'), db_uri=self.database_cache_uri, shared=True)
+        cache.writer.interval = 5
+        batches = cache.writer.batches
+        for i in range(100):
+            cache.store_address('batch_address_%d' % i, last_block=i, balance=i * 1000)
+        cache.store_blockcount(2000000)
+        cache.store_estimated_fee(3, 1500)
+        cache.flush()
+        self.assertEqual(cache.writer.batches, batches + 1)
+
+        reader = Cache(Network('testnet'), db_uri=self.database_cache_uri)
+        self.assertEqual(reader.blockcount(), 2000000)
+        self.assertEqual(reader.estimatefee(3), 1500)
+        self.assertEqual(reader.getaddress('batch_address_99').balance, 99000)
+
+    def test_database_cache_shared_failed_job(self):
+        cache = Cache(Network('testnet'), db_uri=self.database_cache_uri, shared=True)
+        errors = cache.writer.errors
+
+        def failing_job(session):
+            raise ValueError("Job failed")
+
+        cache.writer.interval = 5
+        cache.store_address('retry_address_1', balance=1)
+        cache.writer.put(failing_job)
+        cache.store_address('retry_address_2', balance=2)
+        cache.flush()
+        self.assertEqual(cache.writer.errors, errors + 1)
+        self.assertEqual(cache.getaddress('retry_address_1').balance, 1)
+        self.assertEqual(cache.getaddress('retry_address_2').balance, 2)
+
+    def test_database_cache_shared_writer_failure(self):
+        calls = []
+
+        def session_factory():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('connect', {}, Exception('Database not available'))
+            return Cache(Network('testnet'), db_uri=self.database_cache_uri).session
+
+        writer = DbCacheWriter(session_factory, interval=0)
+        writer.put(lambda session: None)
+        self.assertTrue(writer.flush(5))
+        self.assertEqual(writer.errors, 1)
+        self.assertTrue(writer._thread.is_alive())
+        results = []
+        writer.put(lambda session: results.append(session))
+        self.assertTrue(writer.flush(5))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(writer.batches, 1)
+
+    def test_database_cache_shared_writer_stopped(self):
+        writer = DbCacheWriter(lambda: Cache(Network('testnet'), db_uri=self.database_cache_uri).session, interval=0)
+        blocked = threading.Event()
+        writer.put(lambda session: blocked.wait(5))
+        self.assertFalse(writer.flush(0.2))
+        blocked.set()
+        self.assertTrue(writer.flush(5))
+        # Restart writer thread if it is not running anymore
+        writer._thread = threading.Thread(target=lambda: None)
+        writer._thread.start()
+        writer._thread.join()
+        results = []
+        writer._queue.put(lambda session: results.append(session))
+        self.assertTrue(writer.flush(5))
+        self.assertEqual(len(results), 1)
+
+    def test_database_cache_shared_write_snapshot(self):
+        cache = Cache(Network('testnet'), db_uri=self.database_cache_uri, shared=True)
+        cache.writer.interval = 5
+        t = Transaction(network='testnet', block_height=100, date=datetime.now(timezone.utc), confirmations=10,
+                        coinbase=True)
+        t.add_input(b'\0' * 32, 0xffffffff, unlocking_script=b'\x01\x01', value=0)
+        t.add_output(5000000000, Key(network='testnet').address())
+        t.update_totals()
+        cache.store_transaction(t)
+        # Changes after storing are not written to cache
+        t.outputs[0].value = 1
+        cache.flush()
+        self.assertEqual(cache.getoutputvalues([bytes.fromhex(t.txid)]), {bytes.fromhex(t.txid): {0: 5000000000}})
+
+    def test_database_cache_shared_processes(self):
+        if not hasattr(os, 'fork'):
+            self.skipTest('Test needs fork start method')
+        ctx = multiprocessing.get_context('fork')
+        errors = ctx.Queue()
+        workers = [ctx.Process(target=_shared_cache_worker, args=(self.database_cache_uri, i, 100, errors))
+                   for i in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+        self.assertEqual([errors.get(timeout=1) for _ in workers], [0, 0, 0, 0])
+        reader = Cache(Network('bitcoin'), db_uri=self.database_cache_uri)
+        for i in range(4):
+            self.assertEqual(reader.getaddress('address_%d_99' % i).balance, 99)
+
+
 if __name__ == '__main__':
     unittest.main()
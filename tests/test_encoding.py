@@ -517,6 +517,13 @@ class TestEncodingCrypto(unittest.TestCase):
         self.assertEqual(sha256(b'a' * 1000000, as_hex=True),
             'cdc76e5c9914fb9281a1c7e284d73e67f1809a48a497200e046d39ccc7112cd0')
 
+    def test_siphash(self):
+        # Test vectors from SipHash reference implementation
+        key = bytes(range(16))
+        self.assertEqual(siphash(key, b''), 0x726fdb47dd0e0e31)
+        self.assertEqual(siphash(key, bytes(range(8))), 0x93f5f5799a932462)
+        self.assertEqual(siphash(key, bytes(range(15))), 0xa129ca6149be45e5)
+
 
 if __name__ == '__main__':
     unittest.main()
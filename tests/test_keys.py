@@ -344,6 +344,17 @@ class TestPublicKeyUncompressed(unittest.TestCase):
     def test_public_key_address_uncompressed(self):
         self.assertEqual('1thMirt546nngXqyPEz532S8fLwbozud8', self.K.address_uncompressed())
 
+    def test_public_key_decompress_cache(self):
+        public_key = bytes.fromhex('025c0de3b9c8ab18dd04e3511243ec2952002dbfadc864b9628910169d9b9b00ec')
+        y = 16388935128781238405526710466724741593761085120864331449066658622400339362166
+        self.assertEqual(public_key_decompress(public_key)[1], y)
+        hits = public_key_decompress.cache_info().hits
+        self.assertEqual(Key(public_key).public_point()[1], y)
+        self.assertEqual(public_key_decompress.cache_info().hits, hits + 1)
+        k = Key(b'\3' + public_key[1:])
+        self.assertEqual(k.y, secp256k1_p - y)
+        self.assertEqual(k.public_uncompressed_byte[33:], (secp256k1_p - y).to_bytes(32, 'big'))
+
 
 class TestHDKeysImport(unittest.TestCase):
 
@@ -1118,6 +1129,66 @@ class TestKeysSignatures(unittest.TestCase):
                                "Unrecognised base64, DER encoded or bytes signature",
                                Signature.parse, sig_bytes)
 
+    def test_signatures_verify_batch(self):
+        k = HDKey('b2da575054fb5daba0efde613b0b8e37159b8110e4be50f73cbe6479f6038f5b')
+        txid = '0d12fdc4aac9eaaab9730999e0ce84c3bd5bb38dfd1f4c90c613ee177987429c'
+        sig_hex = '48e994862e2cdb372149bad9d9894cf3a5562b4565035943efe0acc502769d351cb88752b5fe8d70d85f3541046d' \
+                  'f617f8459e991d06a7c0db13b5d4531cd6d4'
+        sig2 = sign('c77545c8084b6178366d4e9a06cf99a28d7b5ff94ba8bd76bbbce66ba8cdef70', k)
+        items = [
+            (txid, sig_hex, k.public()),
+            (txid, Signature.parse_hex(sig_hex), k.public_byte),
+            ('c77545c8084b6178366d4e9a06cf99a28d7b5ff94ba8bd76bbbce66ba8cdef70', sig2, None),
+            (txid, sig2, k),
+            (txid, sig_hex, HDKey().public()),
+        ]
+        expected = [True, True, True, False, False]
+        self.assertListEqual(verify_batch(items, workers=1), expected)
+        self.assertListEqual(verify_batch(items * 2, workers=2, pool_min_size=1), expected * 2)
+        self.assertRaisesRegex(BKeyError, "No public key provided, cannot verify", verify_batch,
+                               [(txid, sig_hex, None)])
+
+    def test_signatures_sign_batch(self):
+        k = HDKey('b2da575054fb5daba0efde613b0b8e37159b8110e4be50f73cbe6479f6038f5b')
+        k2 = HDKey('728afb86a98a0b60cc81faadaa2c12bc17d5da61b8deaf1c08fc07caf424d493')
+        items = [
+            ('0d12fdc4aac9eaaab9730999e0ce84c3bd5bb38dfd1f4c90c613ee177987429c', k),
+            ('c77545c8084b6178366d4e9a06cf99a28d7b5ff94ba8bd76bbbce66ba8cdef70', k2.wif_key()),
+            (b'Message to sign', k2),
+        ]
+        expected = [sign(message, key).as_der_encoded() for message, key in items]
+        self.assertListEqual([s.as_der_encoded() for s in sign_batch(items, workers=1)], expected)
+        signatures = sign_batch(items * 2, workers=2, pool_min_size=1)
+        self.assertListEqual([s.as_der_encoded() for s in signatures], expected * 2)
+        self.assertEqual(signatures[1].public_key, k2.public())
+        self.assertTrue(signatures[0].verify())
+
+
+class TestKeyRange(unittest.TestCase):
+
+    def test_key_range(self):
+        start = 0x1e99423a4ed27608a15a2616a2b0e9e52ced330ac530edcc32c8ffc6a526aedd
+        for witness_type in ['legacy', 'p2sh-segwit', 'segwit']:
+            keys = list(key_range(start, 10, witness_type=witness_type, network='testnet', batch_size=4))
+            self.assertEqual(len(keys), 10)
+            for secret, public_byte, address in keys:
+                k = HDKey(secret, witness_type=witness_type, network='testnet')
+                self.assertEqual(public_byte, k.public_byte)
+                self.assertEqual(address, k.address())
+        secret, public_byte, address = list(key_range(start, 3, witness_type='legacy', compressed=False))[-1]
+        self.assertEqual(public_byte, Key(start + 2, compressed=False).public_uncompressed_byte)
+        self.assertEqual(address, Key(start + 2, compressed=False).address())
+
+    def test_key_range_curve_limits(self):
+        keys = list(key_range(1, 5, witness_type='legacy', batch_size=2))
+        self.assertListEqual([k[2] for k in keys], [Key(i).address() for i in range(1, 6)])
+        keys = list(key_range(secp256k1_n - 3, witness_type='legacy', batch_size=2))
+        self.assertListEqual([k[0] for k in keys], [secp256k1_n - 3, secp256k1_n - 2, secp256k1_n - 1])
+        self.assertEqual(keys[-1][2], Key(secp256k1_n - 1).address())
+        self.assertRaisesRegex(BKeyError, "Witness type taproot not supported", next,
+                               key_range(1, witness_type='taproot'))
+        self.assertRaisesRegex(BKeyError, "Start secret must be between", next, key_range(0))
+
 
 class TestKeysTaproot(unittest.TestCase):
 
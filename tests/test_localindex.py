@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+#    BitcoinLib - Python Cryptocurrency Library
+#    Unit Tests for local address index
+#    © 2026 - 1200 Web Development <http://1200wd.com/>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+import shutil
+import tempfile
+from bitcoinlib.blocks import *
+from bitcoinlib.keys import HDKey
+from bitcoinlib.db_index import DbIndex
+from bitcoinlib.services.baseclient import ClientError
+from bitcoinlib.services.localindex import BlockIndexer, LocalIndexClient
+from bitcoinlib.services.services import Service
+from bitcoinlib.transactions import Input, Output
+
+
+class TestLocalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.key = HDKey('tprv8ZgxMBicQKsPd1Q44tfDiZC98iYouKRC2CzjT3HGt1yYw2zuX2awTotzGAZQEAU9bi2M5MCj8iedP9MREPjUgpDEB'
+                         'wBgGi2C8eK5zNYeiX8', witness_type='segwit', network='testnet')
+        self.key2 = HDKey(witness_type='legacy', network='testnet')
+        address = self.key.address()
+
+        cb1 = self._coinbase(1, 5000000000, address)
+        t1 = Transaction([Input(cb1.txid, 0, keys=self.key, value=5000000000, network='testnet')],
+                         [Output(4999990000, address=self.key2.address(), network='testnet'),
+                          Output(0, lock_script=b'\x6a\x04test', network='testnet')], network='testnet')
+        t1.sign()
+        t1 = Transaction.parse(t1.raw(), network='testnet')
+        t2 = Transaction([Input(t1.txid, 0, keys=self.key2, witness_type='legacy', network='testnet')],
+                         [Output(4999980000, address=address, network='testnet')], witness_type='legacy',
+                         network='testnet')
+        t2.inputs[0].value = 4999990000
+        t2.sign()
+        t2 = Transaction.parse(t2.raw(), network='testnet')
+        self.txs = [cb1, t1, t2]
+        self.coinbase2 = self._coinbase(2, 5000000000, address)
+        self.block1 = self._block(bytes(32), [cb1], 1)
+        self.block2 = self._block(Block.parse_bytes(self.block1).block_hash, [self.coinbase2, t1, t2], 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def _coinbase(height, value, address):
+        inp = Input(b'\0' * 32, 0xffffffff, unlocking_script=b'\x03' + height.to_bytes(3, 'little'),
+                    script_type='coinbase', network='testnet')
+        return Transaction([inp], [Output(value, address=address, network='testnet')], coinbase=True,
+                           network='testnet')
+
+    @staticmethod
+    def _block(prev_hash, transactions, n):
+        # Block with header which links to previous block, the index does not check the proof of work
+        header = (4).to_bytes(4, 'little') + prev_hash[::-1] + bytes(32) + \
+            (1600000000 + n * 600).to_bytes(4, 'little') + (0x207fffff).to_bytes(4, 'little') + bytes(4)
+        return header + int_to_varbyteint(len(transactions)) + b''.join([t.raw() for t in transactions])
+
+    def test_local_index(self):
+        db_uri = os.path.join(self.tmpdir, 'index.sqlite')
+        indexer = BlockIndexer(db_uri, network='testnet')
+        self.assertEqual(indexer.add_blocks([Block.parse_bytes(b, network='testnet')
+                                             for b in [self.block1, self.block2]]), 2)
+        self.assertEqual(indexer.height(), 1)
+        self.assertRaisesRegex(ClientError, "does not follow last indexed block", indexer.add_block,
+                               Block.parse_bytes(self.block1, network='testnet'), 5)
+
+        client = LocalIndexClient('testnet', db_uri, 1)
+        address = self.key.address()
+        self.assertEqual(client.blockcount(), 1)
+        self.assertEqual(client.getbalance([address]), 5000000000 + 4999980000)
+        self.assertEqual(client.getbalance([self.key2.address()]), 0)
+        utxos = client.getutxos(address)
+        coinbase2 = Block.parse_bytes(self.block2, parse_transactions=True).transactions[0].txid
+        self.assertEqual([(u['txid'], u['value'], u['confirmations']) for u in utxos],
+                         [(coinbase2, 5000000000, 1), (self.txs[2].txid, 4999980000, 1)])
+        self.assertEqual([u['txid'] for u in client.getutxos(address, after_txid=coinbase2)], [self.txs[2].txid])
+        self.assertEqual([t.txid for t in client.gettransactions(address)],
+                         [self.txs[0].txid, coinbase2, self.txs[1].txid, self.txs[2].txid])
+        self.assertEqual([t.txid for t in client.gettransactions(self.key2.address())],
+                         [self.txs[1].txid, self.txs[2].txid])
+
+        t = client.gettransaction(self.txs[1].txid)
+        self.assertEqual(t.inputs[0].value, 5000000000)
+        self.assertEqual(t.fee, 10000)
+        self.assertTrue(t.outputs[0].spent)
+        self.assertEqual(t.outputs[0].spending_txid, self.txs[2].txid)
+        self.assertFalse(t.outputs[1].spent)
+        self.assertEqual(t.block_height, 1)
+        self.assertEqual(client.getrawtransaction(self.txs[1].txid), self.txs[1].raw_hex())
+        self.assertEqual(client.isspent(self.txs[1].txid, 0), 1)
+        self.assertEqual(client.isspent(self.txs[2].txid, 0), 0)
+
+        self.assertEqual(indexer.remove_blocks(1), 1)
+        self.assertEqual(client.getbalance([address]), 5000000000)
+        self.assertEqual(client.isspent(self.txs[0].txid, 0), 0)
+        self.assertRaisesRegex(ClientError, "not found in local index", client.gettransaction, self.txs[1].txid)
+
+    def test_local_index_service_sessions(self):
+        db_uri = os.path.join(self.tmpdir, 'index.sqlite')
+        indexer = BlockIndexer(db_uri, network='testnet')
+        indexer.add_blocks([Block.parse_bytes(b, network='testnet') for b in [self.block1, self.block2]])
+        self.assertIs(DbIndex(db_uri).engine, indexer.db.engine)
+        srv = Service(network='testnet', cache_uri='')
+        srv.providers = {'localindex': {
+            'provider': 'localindex', 'network': 'testnet', 'client_class': 'LocalIndexClient',
+            'provider_coin_id': '', 'url': db_uri, 'api_key': '', 'priority': 10, 'denominator': 1,
+            'network_overrides': None, 'timeout': 0}}
+        for _ in range(3):
+            self.assertEqual(srv.getbalance(self.key.address()), 5000000000 + 4999980000)
+        self.assertEqual(indexer.db.engine.pool.checkedout(), 0)
+
+    def test_local_index_duplicate_coinbase(self):
+        # Coinbase transaction of block 3 has the same transaction ID as the coinbase of block 2, like the BIP30
+        # duplicates in blocks 91842 and 91880 on mainnet
+        db_uri = os.path.join(self.tmpdir, 'index.sqlite')
+        indexer = BlockIndexer(db_uri, network='testnet')
+        blocks = [Block.parse_bytes(b, network='testnet') for b in [self.block1, self.block2]]
+        blocks.append(Block.parse_bytes(self._block(blocks[1].block_hash, [self.coinbase2], 3), network='testnet'))
+        self.assertEqual(indexer.add_blocks(blocks), 3)
+
+        client = LocalIndexClient('testnet', db_uri, 1)
+        address = self.key.address()
+        self.assertEqual(client.getbalance([address]), 5000000000 + 4999980000)
+        self.assertEqual([(u['txid'], u['block_height']) for u in client.getutxos(address)],
+                         [(self.txs[2].txid, 1), (self.coinbase2.txid, 2)])
+        self.assertEqual(client.gettransaction(self.coinbase2.txid).block_height, 2)
+        self.assertEqual(client.isspent(self.coinbase2.txid, 0), 0)
+        self.assertEqual([(t.txid, t.block_height) for t in client.gettransactions(address)][-2:],
+                         [(self.txs[2].txid, 1), (self.coinbase2.txid, 2)])
+
+        # Remove duplicate, overwritten output is unspent again
+        self.assertEqual(indexer.remove_blocks(2), 1)
+        self.assertEqual([(u['txid'], u['block_height']) for u in client.getutxos(address)],
+                         [(self.coinbase2.txid, 1), (self.txs[2].txid, 1)])
+        self.assertEqual(client.gettransaction(self.coinbase2.txid).block_height, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
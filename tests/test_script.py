@@ -594,6 +594,32 @@ class TestScriptTypes(unittest.TestCase):
         self.assertEqual('p2tr', s.script_types[0])
         self.assertEqual([81, 'data-32'], s.blueprint)
 
+    def test_script_standard_match(self):
+        scripts = [
+            ('76a914af8e14a2cecd715c363b3a72b55b59a31e2acac988ac', 'p2pkh', '1H1FTWEs1dwbhmgCeDAEYpgudirTNFdWBx'),
+            ('a914e3bdbeab033c7e03fd4cbf3a03ff14533260f3f487', 'p2sh', '3NTCcni2xTyZVqau7QLpNsbf45hkSsycAY'),
+            ('0014dc2d3a3b8ab5bbbe5e3d0ce6ec3b3ad7a9be6a2e', 'p2wpkh', 'bc1qmskn5wu2kkamuh3apnnwcwe6675mu63wx35z9q'),
+            ('0020701a8d401c84fb13e6baf169d59684e17abd9fa216c8cc5b9fc63d622ff8c58d', 'p2wsh',
+             'bc1qwqdg6squsna38e46795at95yu9atm8azzmyvckulcc7kytlcckxswvvzej'),
+            ('512013334589ddbcb9d81d3d774f9eb88e14666b54ef33008444d0f1ad78879fe033', 'p2tr',
+             'bc1pzve5tzwahjuas8fawa8eawywz3nxk480xvqgg3xs7xkh3puluqeswpjvng'),
+        ]
+        for script_hex, script_type, address in scripts:
+            script = bytes.fromhex(script_hex)
+            self.assertEqual(script_standard_match(script)[0], script_type)
+            self.assertEqual(script_standard_address(script)[::2], (script_type, address))
+            s = Script.parse_bytes(script, is_locking=True)
+            self.assertEqual(s.script_types, [script_type])
+            self.assertEqual(s.public_hash, script_standard_match(script)[1])
+            self.assertEqual(s.serialize(), script)
+            self.assertEqual(str(s), str(Script.parse_bytes(script, _level=1)))
+
+    def test_script_standard_match_nonstandard(self):
+        self.assertIsNone(script_standard_match(b''))
+        self.assertIsNone(script_standard_match(bytes.fromhex('6a20985f23805edd2938e5bd9f744d36ccb8be643de00b369b901ae0b3fea911a1dd')))
+        self.assertIsNone(script_standard_match(bytes.fromhex('76a914af8e14a2cecd715c363b3a72b55b59a31e2acac987ac')))
+        self.assertIsNone(script_standard_address(bytes.fromhex('5220701a8d401c84fb13e6baf169d59684e17abd9fa216c8cc5b9fc63d622ff8c58d')))
+
 
 class TestScript(unittest.TestCase, CustomAssertions):
 
@@ -19,6 +19,8 @@
 #
 
 import unittest
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
 from bitcoinlib.transactions import *
 from bitcoinlib.keys import HDKey, BKeyError
 from tests.test_custom import CustomAssertions
@@ -1020,6 +1022,28 @@ class TestTransactions(unittest.TestCase):
                                   'inputs=3, outputs=2, status=new, network=bitcoin)>')
         self.assertEqual(str(t), '6961d06e4a921834bbf729a94d7ab423b18ddd92e5ce9661b7b871d852f1db74')
 
+    def test_transactions_update_spents(self):
+        address = '1MMMMSUb1piy2ufrSguNUdFmAcvqrQF8M5'
+        other_address = '1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH'
+        t1 = Transaction([Input('11' * 32, 0, address=other_address, value=200000)],
+                         [Output(100000, address), Output(50000, other_address, output_n=1),
+                          Output(40000, address, output_n=2)],
+                         txid='01' * 32)
+        t2 = Transaction([Input('22' * 32, 0, address=other_address, value=20000),
+                          Input(t1.txid, 2, address=address, value=40000)],
+                         [Output(50000, address)], txid='02' * 32)
+        t3 = Transaction([Input(t2.txid, 0, address=address, value=50000)], [Output(40000, other_address)],
+                         txid='03' * 32)
+        txs = transaction_update_spents([t3, t1, t2], address)
+        self.assertEqual([t.txid for t in txs], [t3.txid, t1.txid, t2.txid])
+        self.assertEqual([o.spent for o in t1.outputs], [False, False, True])
+        self.assertEqual(t1.outputs[2].spending_txid, t2.txid)
+        self.assertEqual(t1.outputs[2].spending_index_n, 1)
+        self.assertTrue(t2.outputs[0].spent)
+        self.assertEqual(t2.outputs[0].spending_txid, t3.txid)
+        self.assertEqual(t2.outputs[0].spending_index_n, 0)
+        self.assertFalse(t3.outputs[0].spent)
+
     def test_transaction_sendto_wrong_address(self):
         t = Transaction(network='bitcoin')
         self.assertRaisesRegex(BKeyError, 'Network bitcoin not found in extracted networks*',
@@ -1875,6 +1899,29 @@ class TestTransactionsSegwit(unittest.TestCase, CustomAssertions):
                          'c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670')
         self.assertTrue(t2.verify())
 
+    def test_transaction_segwit_sign_workers(self):
+        keys = [HDKey(witness_type='segwit', network='testnet') for _ in range(5)]
+        prev_txid = '3d05f69d6a2cb1fa8fbde2ee2a2b21880bf4dd8e4a5b2be1cd9cb7c1c2f4d0c1'
+        inputs = [Input(prev_txid, n, keys=k, value=100000 + n, witness_type='segwit', network='testnet')
+                  for n, k in enumerate(keys)]
+        inputs.append(Input(prev_txid, 5, keys=keys[0], value=100000, witness_type='legacy', network='testnet'))
+        outputs = [Output(550000, address=keys[1].address(), network='testnet')]
+        t1 = Transaction(inputs, outputs, witness_type='segwit', network='testnet')
+        t2 = deepcopy(t1)
+        for n in range(len(t1.inputs)):
+            t1.sign(index_n=n)
+
+        # Lower pool threshold, so signatures of this small transaction are created in worker processes
+        def sign_batch_pool(items, **kwargs):
+            return sign_batch(items, pool_min_size=1, **kwargs)
+
+        with mock.patch('bitcoinlib.transactions.sign_batch', side_effect=sign_batch_pool), \
+                mock.patch('bitcoinlib.keys.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            t2.sign(workers=2)
+        pool.assert_called_once_with(max_workers=2)
+        self.assertTrue(t2.verify())
+        self.assertEqual(t1.raw_hex(), t2.raw_hex())
+
     def test_transactions_segwit_p2sh_p2wpkh(self):
         pk_input1 = 'eb696a065ef48a2192da5b28b694f87544b30fae8327c4510137a922f32c6dcf'
         pk1 = Key(pk_input1)